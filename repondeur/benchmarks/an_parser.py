@@ -0,0 +1,123 @@
+"""
+Benchmark the parsers for AN amendement XML, on the recorded test fixtures
+
+The whole-document conversion with `xmltodict` is compared with the extraction
+of the fields we use with lxml. Both must give the same values for all fields.
+
+Time is the best of several runs. Memory is the peak of the allocations made
+while parsing a document, and what is left allocated for the parsed data.
+
+Usage: python benchmarks/an_parser.py [REPEAT]
+"""
+import sys
+import tracemalloc
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Callable, List, Tuple
+
+import xmltodict
+
+from zam_repondeur.services.fetch.an.amendements import ANAmendementData
+from zam_repondeur.services.fetch.an.parse import parse_amendement
+
+SAMPLE_DATA_DIR = Path(__file__).parent.parent / "tests" / "fetch" / "sample_data"
+
+DEFAULT_REPEAT = 200
+
+Parser = Callable[[bytes], dict]
+
+
+def parse_with_xmltodict(content: bytes) -> dict:
+    result: dict = xmltodict.parse(content, force_list=("programmeAmdt",))
+    return result
+
+
+def parse_with_lxml(content: bytes) -> dict:
+    return parse_amendement(content)
+
+
+def extract(content: bytes, parse: Parser) -> tuple:
+    amend_data = ANAmendementData(parse(content))
+    if "listeProgrammesAmdt" in amend_data.amend:
+        # Rendering the tables needs a Jinja2 environment, and isn't parsing anyway
+        corps: Any = (
+            amend_data._extract_credits_table(type_credits="aE"),
+            amend_data._extract_credits_table(type_credits="cP"),
+        )
+    else:
+        corps = amend_data.get_corps()
+    return (
+        amend_data.get_num(),
+        amend_data.get_rectif(),
+        amend_data.get_parent_raw_num(),
+        amend_data.get_division(),
+        amend_data.get_matricule(),
+        amend_data.get_auteur(),
+        amend_data.get_mission_ref(),
+        corps,
+        amend_data.get_expose(),
+        amend_data.get_sort(),
+        amend_data.get_date_depot(),
+        amend_data.get_tri_amendement(),
+    )
+
+
+def timing(content: bytes, parse: Parser, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        parse(content)
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def allocations(content: bytes, parse: Parser) -> Tuple[int, int]:
+    tracemalloc.start()
+    try:
+        result = parse(content)
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak, retained
+
+
+def sample_files() -> List[Path]:
+    return sorted(
+        path
+        for path in (SAMPLE_DATA_DIR / "an").glob("*/*.xml")
+        if path.name != "liste.xml"
+    )
+
+
+def main(repeat: int) -> None:
+    print(f"{'':>26} {'time (ms)':>22} {'peak / retained (KB)':>30}")
+    print(
+        f"{'file':>20} {'size':>5} {'xmltodict':>9} {'lxml':>6} {'speedup':>7}"
+        f" {'xmltodict':>15} {'lxml':>13}"
+    )
+    totals = [0.0, 0.0]
+    for path in sample_files():
+        content = path.read_bytes()
+        if extract(content, parse_with_xmltodict) != extract(content, parse_with_lxml):
+            raise ValueError(f"Parsers disagree on {path}")
+        slow = timing(content, parse_with_xmltodict, repeat)
+        fast = timing(content, parse_with_lxml, repeat)
+        totals[0] += slow
+        totals[1] += fast
+        slow_peak, slow_retained = allocations(content, parse_with_xmltodict)
+        fast_peak, fast_retained = allocations(content, parse_with_lxml)
+        print(
+            f"{path.parent.name + '/' + path.name:>20} {len(content) // 1024:>4}K"
+            f" {slow * 1000:>9.3f} {fast * 1000:>6.3f} {slow / fast:>6.1f}x"
+            f" {slow_peak // 1024:>7} / {slow_retained // 1024:>5}"
+            f" {fast_peak // 1024:>5} / {fast_retained // 1024:>5}"
+        )
+    print(
+        f"{'total':>20} {'':>5} {totals[0] * 1000:>9.3f} {totals[1] * 1000:>6.3f}"
+        f" {totals[0] / totals[1]:>6.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REPEAT)
@@ -0,0 +1,116 @@
+"""
+Benchmark amendement and article lookups during a fetch, by lecture size
+
+Simulates what happens when refreshing a lecture: each fetched amendement is
+looked up by number (collect), then its article is looked up by subdivision, and
+the new amendements are created (apply).
+
+The indexed lookups of `Lecture` are compared with a linear scan of its
+collections (how they used to work). No database is needed, as all objects are
+kept transient.
+
+Usage: python benchmarks/lecture_index.py [SIZE ...]
+"""
+import sys
+from time import perf_counter
+from typing import Callable, List, Optional, Set, Tuple
+
+from zam_repondeur.models import Amendement, Article, Lecture
+from zam_repondeur.models.division import SubDiv
+
+DEFAULT_SIZES = [500, 1000, 2000, 4000, 6000]
+
+AMENDEMENTS_PER_ARTICLE = 20
+
+NEW_AMENDEMENTS_RATIO = 0.1  # new amendements since last refresh
+
+
+def linear_find_amendement(lecture: Lecture, num: int) -> Optional[Amendement]:
+    for amendement in lecture.amendements:
+        if amendement.num == num:
+            return amendement
+    return None
+
+
+def linear_find_article(lecture: Lecture, subdiv: SubDiv) -> Optional[Article]:
+    for article in lecture.articles:
+        if article.matches(subdiv):
+            return article
+    return None
+
+
+def indexed_find_amendement(lecture: Lecture, num: int) -> Optional[Amendement]:
+    return lecture.find_amendement(num)
+
+
+def indexed_find_article(lecture: Lecture, subdiv: SubDiv) -> Optional[Article]:
+    return lecture.find_article(subdiv)
+
+
+def subdiv_for(num: int) -> SubDiv:
+    return SubDiv(
+        type_="article", num=str(num // AMENDEMENTS_PER_ARTICLE + 1), mult="", pos=""
+    )
+
+
+def make_lecture(size: int) -> Lecture:
+    lecture = Lecture()
+    nb_existing = int(size * (1 - NEW_AMENDEMENTS_RATIO))
+    articles = {}
+    for num in range(1, nb_existing + 1):
+        subdiv = subdiv_for(num)
+        if subdiv not in articles:
+            articles[subdiv] = Article.create(
+                lecture=lecture, type=subdiv.type_, num=subdiv.num
+            )
+        Amendement.create(lecture=lecture, article=articles[subdiv], num=num)
+    return lecture
+
+
+def refresh(
+    lecture: Lecture,
+    size: int,
+    find_amendement: Callable[[Lecture, int], Optional[Amendement]],
+    find_article: Callable[[Lecture, SubDiv], Optional[Article]],
+) -> Tuple[float, float]:
+    start = perf_counter()
+    missing: Set[int] = {
+        num for num in range(1, size + 1) if find_amendement(lecture, num) is None
+    }
+    collect = perf_counter() - start
+
+    start = perf_counter()
+    for num in range(1, size + 1):
+        subdiv = subdiv_for(num)
+        article = find_article(lecture, subdiv)
+        if article is None:
+            article = Article.create(lecture=lecture, type=subdiv.type_, num=subdiv.num)
+        if num in missing:
+            Amendement.create(lecture=lecture, article=article, num=num)
+    apply = perf_counter() - start
+
+    return collect, apply
+
+
+def main(sizes: List[int]) -> None:
+    print(f"{'':>6} {'linear':>18} {'indexed':>18}")
+    print(
+        f"{'size':>6} {'collect':>8} {'apply':>9}"
+        f" {'collect':>8} {'apply':>9} {'speedup':>8}"
+    )
+    for size in sizes:
+        linear = refresh(
+            make_lecture(size), size, linear_find_amendement, linear_find_article
+        )
+        indexed = refresh(
+            make_lecture(size), size, indexed_find_amendement, indexed_find_article
+        )
+        speedup = sum(linear) / sum(indexed)
+        print(
+            f"{size:>6} {linear[0]:>8.3f} {linear[1]:>9.3f}"
+            f" {indexed[0]:>8.3f} {indexed[1]:>9.3f} {speedup:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,85 @@
+"""
+Benchmark the memoized parsing of subdivision libellés and amendement numbers
+
+Libellés and numbers are taken from the recorded test fixtures (Sénat CSV files
+and AN amendement XML), and parsed as many times as during successive refreshes
+of these lectures (the Sénat numbers are parsed three times per refresh).
+
+The memoized parsers are compared with the same functions without the cache.
+
+Usage: python benchmarks/libelles.py [REFRESHES]
+"""
+import logging
+import sys
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, List, Tuple
+
+from zam_repondeur.decorator import memoize_stats
+from zam_repondeur.models import Amendement
+from zam_repondeur.services.fetch.an.parse import parse_amendement
+from zam_repondeur.services.fetch.division import _parse_subdiv
+from zam_repondeur.services.fetch.senat.amendements import _parse_rows
+
+SAMPLE_DATA_DIR = Path(__file__).parent.parent / "tests" / "fetch" / "sample_data"
+
+DEFAULT_REFRESHES = 10
+
+NUM_PARSES_PER_REFRESH = 3  # sorting, list of numbers, then inspecting each row
+
+
+def load_fixtures() -> Tuple[List[str], List[str]]:
+    libelles: List[str] = []
+    nums: List[str] = []
+    for path in sorted((SAMPLE_DATA_DIR / "senat").glob("jeu_complet_*.csv")):
+        for row in _parse_rows([path.read_bytes()]):
+            libelles.append(row["Subdivision "])
+            nums.extend([row["Numéro "]] * NUM_PARSES_PER_REFRESH)
+    for path in sorted((SAMPLE_DATA_DIR / "an").glob("*/*.xml")):
+        if path.name == "liste.xml":
+            continue
+        division = parse_amendement(path.read_bytes())["amendement"]["division"]
+        if isinstance(division, dict):
+            libelles.append(division["titre"] or "")
+            libelles.append(division["divisionRattache"] or "")
+    return libelles, nums
+
+
+def timing(func: Callable[[str], object], values: List[str], refreshes: int) -> float:
+    start = perf_counter()
+    for _ in range(refreshes):
+        for value in values:
+            try:
+                func(value)
+            except ValueError:
+                pass
+    return perf_counter() - start
+
+
+def main(refreshes: int) -> None:
+    # Without the cache, unparsable libellés would be logged every time
+    logging.disable(logging.ERROR)
+
+    libelles, nums = load_fixtures()
+    print(
+        f"{len(libelles)} libellés ({len(set(libelles))} distinct), "
+        f"{len(nums) // NUM_PARSES_PER_REFRESH} numbers, {refreshes} refreshes\n"
+    )
+    print(f"{'':>10} {'plain':>8} {'memoized':>9} {'speedup':>8} {'hit rate':>9}")
+    for name, func, values in [
+        ("subdiv", _parse_subdiv, libelles),
+        ("num", Amendement.parse_num, nums),
+    ]:
+        func.cache_clear()  # type: ignore
+        plain = timing(func.__wrapped__, values, refreshes)  # type: ignore
+        memoized = timing(func, values, refreshes)
+        stats = memoize_stats()[f"{func.__module__}.{func.__qualname__}"]
+        hit_rate = stats["hits"] / (stats["hits"] + stats["misses"])
+        print(
+            f"{name:>10} {plain:>7.3f}s {memoized:>8.3f}s"
+            f" {plain / memoized:>7.1f}x {hit_rate:>8.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REFRESHES)
@@ -0,0 +1,25 @@
+"""Add amendement source fingerprint
+
+Revision ID: 5c1e2a7f9d04
+Revises: 9baaf0db7e30
+Create Date: 2026-10-18 10:12:37.482915
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5c1e2a7f9d04"
+down_revision = "9baaf0db7e30"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "amendements", sa.Column("source_fingerprint", sa.Text(), nullable=True)
+    )
+
+
+def downgrade():
+    op.drop_column("amendements", "source_fingerprint")
@@ -0,0 +1,26 @@
+"""Add amendement version
+
+Revision ID: 8e3b6d2c41f7
+Revises: 5c1e2a7f9d04
+Create Date: 2026-10-18 14:47:05.193208
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8e3b6d2c41f7"
+down_revision = "5c1e2a7f9d04"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "amendements",
+        sa.Column("version", sa.Integer(), nullable=False, server_default="1"),
+    )
+
+
+def downgrade():
+    op.drop_column("amendements", "version")
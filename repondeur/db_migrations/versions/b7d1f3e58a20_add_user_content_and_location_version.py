@@ -0,0 +1,31 @@
+"""Add user content and location version
+
+Revision ID: b7d1f3e58a20
+Revises: 8e3b6d2c41f7
+Create Date: 2026-10-19 10:12:38.520417
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b7d1f3e58a20"
+down_revision = "8e3b6d2c41f7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "amendement_user_contents",
+        sa.Column("version", sa.Integer(), nullable=False, server_default="1"),
+    )
+    op.add_column(
+        "amendement_location",
+        sa.Column("version", sa.Integer(), nullable=False, server_default="1"),
+    )
+
+
+def downgrade():
+    op.drop_column("amendement_location", "version")
+    op.drop_column("amendement_user_contents", "version")
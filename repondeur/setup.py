@@ -10,6 +10,7 @@ requires = [
     "inscriptis",
     "lxml",
     "more-itertools",
+    "msgpack",
     "openpyxl",
     "parsy",
     "pdfkit",
@@ -51,6 +52,7 @@ setup(
             "zam_load_data = zam_repondeur.scripts.load_data:main",
             "zam_clear_data = zam_repondeur.scripts.clear_data:main",
             "zam_reset_data_locks = zam_repondeur.scripts.reset_data_locks:main",
+            "zam_convert_data = zam_repondeur.scripts.convert_data:main",
             "zam_whitelist = zam_repondeur.scripts.whitelist:main",
             "zam_admin = zam_repondeur.scripts.admin:main",
             "zam_queue = zam_repondeur.scripts.queue:main",
@@ -297,3 +297,22 @@ def test_parse_subdiv_error(texte_plfss2018_an_premiere_lecture):
         "this is unparsable garbage", texte=texte_plfss2018_an_premiere_lecture
     )
     assert subdiv == SubDiv("erreur", "", "", "")
+
+
+def test_parse_subdiv_is_memoized():
+    from zam_repondeur.decorator import memoize_stats
+    from zam_repondeur.services.fetch.division import parse_subdiv
+
+    def stats():
+        return memoize_stats()["zam_repondeur.services.fetch.division._parse_subdiv"]
+
+    libelle = "Article 42 quindecies"
+    before = stats()
+
+    first = parse_subdiv(libelle)
+    second = parse_subdiv(libelle)
+
+    assert second is first
+    after = stats()
+    assert after["misses"] - before["misses"] <= 1
+    assert after["hits"] - before["hits"] >= 1
@@ -0,0 +1,151 @@
+import pytest
+
+
+def rate_limited(url, retry_after=None):
+    from requests import Response
+
+    from zam_repondeur.services.fetch.exceptions import RateLimited
+
+    response = Response()
+    response.status_code = 429
+    if retry_after is not None:
+        response.headers["Retry-After"] = retry_after
+    return RateLimited(url, response)
+
+
+class TestFetchAll:
+    def test_results_are_yielded_with_their_item(self):
+        from zam_repondeur.services.fetch.engine import FetchEngine
+
+        engine = FetchEngine(max_workers=3)
+
+        results = {
+            item: future.result()
+            for item, future in engine.fetch_all(lambda n: n * 2, range(10))
+        }
+
+        assert results == {n: n * 2 for n in range(10)}
+
+    def test_exceptions_are_raised_by_future(self):
+        from zam_repondeur.services.fetch.engine import FetchEngine
+        from zam_repondeur.services.fetch.exceptions import NotFound
+
+        def fetch(n):
+            if n == 2:
+                raise NotFound(n)
+            return n
+
+        engine = FetchEngine()
+
+        futures = dict(engine.fetch_all(fetch, [1, 2, 3]))
+
+        assert futures[1].result() == 1
+        with pytest.raises(NotFound):
+            futures[2].result()
+        assert futures[3].result() == 3
+
+    def test_workers_use_the_current_registry(self):
+        from pyramid.registry import Registry
+        from pyramid.threadlocal import get_current_registry, manager
+
+        from zam_repondeur.services.fetch.engine import FetchEngine
+
+        # Not using pyramid.testing, as its tearDown() would also clear the
+        # registry of the test app (used by the next tests)
+        registry = Registry("test")
+        manager.push({"registry": registry, "request": None})
+        try:
+            engine = FetchEngine()
+            registries = [
+                future.result()
+                for _, future in engine.fetch_all(
+                    lambda n: get_current_registry(), range(5)
+                )
+            ]
+        finally:
+            manager.pop()
+
+        assert all(registry_ is registry for registry_ in registries)
+
+
+class TestRetries:
+    def test_retry_after_rate_limiting(self):
+        from zam_repondeur.services.fetch.engine import FetchEngine
+
+        attempts = []
+
+        def fetch(url):
+            attempts.append(url)
+            if len(attempts) < 3:
+                raise rate_limited(url)
+            return "OK"
+
+        engine = FetchEngine(max_workers=4, backoff_factor=0)
+
+        assert engine.call(fetch, "http://example.com/") == "OK"
+        assert len(attempts) == 3
+        assert engine.limit.limit == 2  # halved twice, then back up by one
+
+    def test_give_up_after_max_retries(self):
+        from zam_repondeur.services.fetch.engine import FetchEngine
+        from zam_repondeur.services.fetch.exceptions import RateLimited
+
+        attempts = []
+
+        def fetch(url):
+            attempts.append(url)
+            raise rate_limited(url)
+
+        engine = FetchEngine(max_retries=2, backoff_factor=0)
+
+        with pytest.raises(RateLimited):
+            engine.call(fetch, "http://example.com/")
+        assert len(attempts) == 3
+
+    @pytest.mark.parametrize(
+        "retry_after,expected", [("2", 2.0), ("120", 30.0), ("soon", None)]
+    )
+    def test_retry_after_header(self, retry_after, expected):
+        from zam_repondeur.services.fetch.engine import FetchEngine
+
+        exc = rate_limited("http://example.com/", retry_after=retry_after)
+        engine = FetchEngine(max_backoff=30.0)
+
+        if expected is None:
+            assert exc.retry_after is None
+        else:
+            assert engine._backoff_delay(1, exc.retry_after) == expected
+
+
+class TestAdaptiveLimit:
+    def test_invalid_limits(self):
+        from zam_repondeur.services.fetch.engine import AdaptiveLimit
+
+        with pytest.raises(ValueError):
+            AdaptiveLimit(min_limit=4, max_limit=2)
+
+    def test_decrease_then_increase(self):
+        from zam_repondeur.services.fetch.engine import AdaptiveLimit
+
+        limit = AdaptiveLimit(min_limit=1, max_limit=8)
+
+        limit.on_throttled()
+        assert limit.limit == 4
+        limit.on_throttled()
+        assert limit.limit == 2
+
+        for _ in range(2):
+            limit.on_success(latency=0.1)
+        assert limit.limit == 3
+
+    def test_do_not_increase_when_latency_goes_up(self):
+        from zam_repondeur.services.fetch.engine import AdaptiveLimit
+
+        limit = AdaptiveLimit(min_limit=1, max_limit=8)
+        limit.on_throttled()
+        limit.on_success(latency=0.1)
+
+        for _ in range(10):
+            limit.on_success(latency=1.0)
+
+        assert limit.limit == 4
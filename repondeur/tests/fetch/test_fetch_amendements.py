@@ -223,7 +223,7 @@ def test_fetch_amendements_an(app, source_an, lecture_an, article1_an):
             },
         )
 
-        def dynamic_return_value(urls, force_list=None):
+        def dynamic_return_value(urls, force_list=None, parser=None):
             from zam_repondeur.services.fetch.an.amendements import ANAmendementData
             from zam_repondeur.services.fetch.exceptions import NotFound
 
@@ -341,7 +341,7 @@ def test_fetch_amendements_an_with_mission(app, source_an, lecture_an, article1_
             },
         )
 
-        def dynamic_return_value(urls, force_list=None):
+        def dynamic_return_value(urls, force_list=None, parser=None):
             from zam_repondeur.services.fetch.an.amendements import ANAmendementData
             from zam_repondeur.services.fetch.exceptions import NotFound
 
@@ -453,7 +453,7 @@ def test_fetch_amendements_an_without_auteur_key(
             },
         )
 
-        def dynamic_return_value(urls, force_list=None):
+        def dynamic_return_value(urls, force_list=None, parser=None):
             from zam_repondeur.services.fetch.an.amendements import ANAmendementData
             from zam_repondeur.services.fetch.exceptions import NotFound
 
@@ -565,7 +565,7 @@ def test_fetch_amendements_an_without_group_tribun_id(
             },
         )
 
-        def dynamic_return_value(urls, force_list=None):
+        def dynamic_return_value(urls, force_list=None, parser=None):
             from zam_repondeur.services.fetch.an.amendements import ANAmendementData
             from zam_repondeur.services.fetch.exceptions import NotFound
 
@@ -687,7 +687,7 @@ def test_fetch_amendements_an_with_unknown_group_tribun_id(
             },
         )
 
-        def dynamic_return_value(urls, force_list=None):
+        def dynamic_return_value(urls, force_list=None, parser=None):
             from zam_repondeur.services.fetch.an.amendements import ANAmendementData
             from zam_repondeur.services.fetch.exceptions import NotFound
 
@@ -922,7 +922,7 @@ def test_fetch_update_amendements_an_with_batch_preserve_batch(
             },
         )
 
-        def dynamic_return_value(urls, force_list=None):
+        def dynamic_return_value(urls, force_list=None, parser=None):
             from zam_repondeur.services.fetch.an.amendements import ANAmendementData
             from zam_repondeur.services.fetch.exceptions import NotFound
 
@@ -1013,7 +1013,7 @@ def test_fetch_update_amendements_an_with_batch_and_changing_article(
             },
         )
 
-        def dynamic_return_value(urls, force_list=None):
+        def dynamic_return_value(urls, force_list=None, parser=None):
             from zam_repondeur.services.fetch.an.amendements import ANAmendementData
             from zam_repondeur.services.fetch.exceptions import NotFound
 
@@ -27,7 +27,11 @@ def source(settings):
     from zam_repondeur.services.fetch.an.amendements import AssembleeNationale
 
     return AssembleeNationale(
-        settings={"zam.fetch.an.batch_size": "25", "zam.fetch.an.max_404": "20"}
+        settings={
+            "zam.fetch.an.batch_size": "25",
+            "zam.fetch.an.max_404": "20",
+            "zam.fetch.an.discovery": "linear",
+        }
     )
 
 
@@ -1101,6 +1105,38 @@ class TestFetchAmendementAgain:
         assert amendement2.user_content.objet == "Objet"
         assert amendement2.user_content.reponse == "Réponse"
 
+    @responses.activate
+    def test_unchanged_source_is_skipped(self, lecture_an, app, source):
+        from zam_repondeur.models import DBSession
+        from zam_repondeur.services.fetch.an.amendements import (
+            ANAmendementData,
+            build_url,
+        )
+
+        responses.add(
+            responses.GET,
+            build_url(lecture_an, 177),
+            body=read_sample_data("an/269/177.xml"),
+            status=200,
+        )
+
+        DBSession.add(lecture_an)
+
+        amendement1, created = source.fetch_amendement(
+            lecture=lecture_an, numero_prefixe="177", position=1
+        )
+        assert created
+        assert amendement1.source_fingerprint is not None
+
+        # The fields are not extracted again
+        with patch.object(ANAmendementData, "get_corps") as mock_get_corps:
+            amendement2, created = source.fetch_amendement(
+                lecture=lecture_an, numero_prefixe="177", position=1
+            )
+        assert not created
+        assert amendement2 is amendement1
+        mock_get_corps.assert_not_called()
+
     @responses.activate
     def test_sort_turn_irrecevable(self, lecture_an, app, source):
         from zam_repondeur.models import DBSession
@@ -1279,6 +1315,7 @@ class TestFetchAmendementAgain:
         assert child1.parent_pk == parent1.pk
 
         child1.parent = None  # let's change the parent amendement
+        child1.source_fingerprint = None  # from elsewhere than the source
         DBSession.flush()
 
         parent2, created = source.fetch_amendement(
@@ -1428,6 +1465,530 @@ class TestBatching:
             changes = source.collect_changes(lecture_an, start_index=5)
             assert changes.next_start_index is None
 
+    @responses.activate
+    def test_discussion_list_is_fetched_once_per_run(self, app, lecture_an):
+        from zam_repondeur.models import DBSession
+        from zam_repondeur.services.fetch.an.amendements import (
+            AssembleeNationale,
+            build_url,
+        )
+
+        DBSession.add(lecture_an)
+
+        source = AssembleeNationale(
+            settings={
+                "zam.fetch.an.batch_size": "2",
+                "zam.fetch.an.max_404": "2",
+                "zam.fetch.an.discovery": "linear",
+            }
+        )
+
+        with setup_mock_responses(
+            lecture=lecture_an,
+            liste=read_sample_data("an/269/liste.xml"),
+            amendements=(
+                ("177", read_sample_data("an/269/177.xml")),
+                ("270", read_sample_data("an/269/270.xml")),
+                ("723", read_sample_data("an/269/723.xml")),
+                ("135", read_sample_data("an/269/135.xml")),
+                ("192", read_sample_data("an/269/192.xml")),
+            ),
+        ) as mock_resp:
+            source.prepare(lecture_an)
+            start_indexes = []
+            start_index = 0
+            while start_index is not None:
+                start_indexes.append(start_index)
+                batch_result = source.fetch(lecture_an, start_index=start_index)
+                start_index = batch_result.next_start_index
+
+            liste_requests = [
+                mock_call
+                for mock_call in mock_resp.calls
+                if mock_call.request.url == build_url(lecture_an)
+            ]
+
+        assert len(start_indexes) > 1
+        assert len(liste_requests) == 1
+
+        nums = {amendement.num for amendement in lecture_an.amendements}
+        assert nums == {177, 270, 723, 135, 192}
+
+
+LISTE_ONE_AMENDEMENT = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<amdtsParOrdreDeDiscussion  bibard="4072"  bibardSuffixe=""  organe="AN"
+  legislature="14"  titre="PLFSS 2017"
+   type="projet de loi de financement de la sécurité sociale">
+  <amendements>
+    <amendement place="Article 3" numero="1" sort="Rejeté"
+        parentNumero="" auteurLabel="M. DOOR"
+        auteurLabelFull="M. DOOR Jean-Pierre"
+        auteurGroupe="Les Républicains" alineaLabel="S" missionLabel=""
+        discussionCommune="" discussionCommuneAmdtPositon=""
+        discussionCommuneSsAmdtPositon="" discussionIdentique="20386"
+        discussionIdentiqueAmdtPositon="debut"
+        discussionIdentiqueSsAmdtPositon="" position="1/1" />
+  </amendements>
+</amdtsParOrdreDeDiscussion>
+"""
+
+
+class TestProbingDiscovery:
+    @pytest.fixture
+    def probing_source(self):
+        from zam_repondeur.services.fetch.an.amendements import AssembleeNationale
+
+        return AssembleeNationale(
+            settings={
+                "zam.fetch.an.batch_size": "5",
+                "zam.fetch.an.max_404": "5",
+                "zam.fetch.an.discovery": "probe",
+            }
+        )
+
+    @pytest.mark.parametrize(
+        "max_404,offsets",
+        [
+            (1, [1]),
+            (5, [1, 2, 4, 5]),
+            (8, [1, 2, 4, 8]),
+            (300, [1, 2, 4, 8, 16, 32, 64, 128, 256, 300]),
+        ],
+    )
+    def test_probe_offsets(self, max_404, offsets):
+        from zam_repondeur.services.fetch.an.amendements import AssembleeNationale
+
+        source = AssembleeNationale(
+            settings={"zam.fetch.an.batch_size": "300", "zam.fetch.an.max_404": max_404}
+        )
+
+        assert source._probe_offsets() == offsets
+
+    def test_unknown_strategy(self):
+        from zam_repondeur.services.fetch.an.amendements import AssembleeNationale
+
+        with pytest.raises(ValueError):
+            AssembleeNationale(
+                settings={
+                    "zam.fetch.an.batch_size": "5",
+                    "zam.fetch.an.max_404": "5",
+                    "zam.fetch.an.discovery": "random",
+                }
+            )
+
+    @responses.activate
+    def test_nothing_found_stop(self, app, lecture_an, probing_source):
+        from zam_repondeur.models import DBSession
+
+        DBSession.add(lecture_an)
+
+        with setup_mock_responses(
+            lecture=lecture_an,
+            liste=LISTE_ONE_AMENDEMENT,
+            amendements=[("1", read_sample_data("an/269/177.xml"))],
+        ) as mock_resp:
+            changes = probing_source.collect_changes(lecture_an)
+
+            # Only the listed amendement and the probes were requested
+            requested = {
+                call.request.url.rsplit("/", 1)[-1] for call in mock_resp.calls
+            }
+
+        assert changes.next_start_index is None
+        assert lecture_an.get_fetch_high_water_mark() == 0
+        assert requested == {"liste.xml", "1.xml", "2.xml", "3.xml", "5.xml", "6.xml"}
+
+    def test_linear_by_default(self):
+        from zam_repondeur.services.fetch.an.amendements import (
+            DISCOVERY_LINEAR,
+            AssembleeNationale,
+        )
+
+        source = AssembleeNationale(
+            settings={"zam.fetch.an.batch_size": "5", "zam.fetch.an.max_404": "5"}
+        )
+
+        assert source.discovery == DISCOVERY_LINEAR
+
+    def test_high_water_mark_expires(self, app, lecture_an):
+        from zam_repondeur.services.progress import repository
+
+        lecture_an.set_fetch_high_water_mark(3)
+
+        ttl = repository.connection.ttl(f"fetch.high_water_mark.{lecture_an.pk}")
+        assert 0 < ttl <= repository.high_water_mark_ttl * 60
+
+    @responses.activate
+    def test_probe_found_go_on(self, app, lecture_an, probing_source):
+        from zam_repondeur.models import DBSession
+
+        DBSession.add(lecture_an)
+
+        with setup_mock_responses(
+            lecture=lecture_an,
+            liste=LISTE_ONE_AMENDEMENT,
+            amendements=[
+                ("1", read_sample_data("an/269/177.xml")),
+                ("3", read_sample_data("an/269/270.xml")),
+            ],
+        ):
+            changes = probing_source.collect_changes(lecture_an)
+            assert changes.next_start_index == 1
+            assert lecture_an.get_fetch_high_water_mark() == 3
+
+            # The gap before the high-water mark is filled, then we probe after it
+            changes = probing_source.collect_changes(lecture_an, start_index=1)
+            assert changes.next_start_index is None
+            assert lecture_an.get_fetch_high_water_mark() == 3
+
+    @responses.activate
+    def test_probe_errored_not_found(self, app, lecture_an, probing_source):
+        from requests.exceptions import ReadTimeout
+
+        from zam_repondeur.models import DBSession
+
+        DBSession.add(lecture_an)
+
+        with setup_mock_responses(
+            lecture=lecture_an,
+            liste=LISTE_ONE_AMENDEMENT,
+            amendements=[
+                ("1", read_sample_data("an/269/177.xml")),
+                ("3", read_sample_data("an/269/270.xml")),
+                ("6", ReadTimeout("Timed out")),
+            ],
+        ):
+            changes = probing_source.collect_changes(lecture_an)
+
+        # The errored probe does not move the high-water mark past the gap
+        assert changes.errored == {6}
+        assert lecture_an.get_fetch_high_water_mark() == 3
+
+
+class TestApplyChanges:
+    @staticmethod
+    def create_action(num, article_num, parent_num_raw=""):
+        from zam_repondeur.models.division import SubDiv
+        from zam_repondeur.services.fetch.amendements import CreateAmendement
+
+        return CreateAmendement(
+            num=num,
+            subdiv=SubDiv("article", str(article_num), "", ""),
+            parent_num_raw=parent_num_raw,
+            rectif=0,
+            position=num,
+            tri_amendement=None,
+            id_discussion_commune=None,
+            id_identique=None,
+            matricule="",
+            groupe="",
+            auteur="",
+            mission_titre=None,
+            mission_titre_court=None,
+            corps="",
+            expose="",
+            sort="",
+            date_depot=None,
+        )
+
+    def apply_and_count_selects(self, source, lecture, creates):
+        from sqlalchemy import event
+
+        from zam_repondeur.models import DBSession
+        from zam_repondeur.services.fetch.amendements import CollectedChanges
+
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        changes = CollectedChanges.create(creates=creates)
+        engine = DBSession.get_bind()
+        DBSession.expire_all()
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            result = source.apply_changes(lecture, changes)
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+        assert result.created == {action.num for action in creates}
+        return len([stmt for stmt in statements if stmt.startswith("SELECT")])
+
+    def test_number_of_queries_does_not_depend_on_batch_size(
+        self, app, lecture_an, source
+    ):
+        from zam_repondeur.models import DBSession
+
+        DBSession.add(lecture_an)
+
+        small_batch = [
+            self.create_action(1, article_num=1),
+            self.create_action(2, article_num=1, parent_num_raw="1"),
+            self.create_action(3, article_num=2),
+        ]
+        large_batch = [
+            self.create_action(
+                num,
+                article_num=num // 10 + 3,
+                parent_num_raw=str(num - 1) if num % 2 else "",
+            )
+            for num in range(10, 60)
+        ]
+
+        assert self.apply_and_count_selects(
+            source, lecture_an, small_batch
+        ) == self.apply_and_count_selects(source, lecture_an, large_batch)
+
+        amendements = {
+            amendement.num: amendement for amendement in lecture_an.amendements
+        }
+        assert amendements[2].parent is amendements[1]
+        assert amendements[11].parent is amendements[10]
+        assert amendements[11].article.num == "4"
+
+    @responses.activate
+    def test_update_conflicting_with_another_transaction_is_retried(
+        self, app, lecture_an, article1_an, source
+    ):
+        from sqlalchemy.orm import Session
+
+        from zam_repondeur.models import Amendement, DBSession
+
+        with transaction.manager:
+            DBSession.add_all([lecture_an, article1_an])
+            Amendement.create(
+                lecture=lecture_an, article=article1_an, num=177, corps="Ancien"
+            )
+
+        DBSession.add(lecture_an)
+        with setup_mock_responses(
+            lecture=lecture_an,
+            liste=LISTE_ONE_AMENDEMENT.replace('numero="1"', 'numero="177"'),
+            amendements=[("177", read_sample_data("an/269/177.xml"))],
+        ):
+            changes = source.collect_changes(lecture_an)
+
+        assert [action.num for action in changes.updates] == [177]
+        version = lecture_an.find_amendement(177).version
+
+        # A user edits the amendement in the meantime, and commits first
+        other_session = Session(bind=DBSession.get_bind())
+        try:
+            other_session.query(Amendement).filter_by(num=177).one().resume = "Edit"
+            other_session.commit()
+        finally:
+            other_session.close()
+
+        result = source.apply_changes(lecture_an, changes)
+
+        # The stale row is reloaded, and the update applied again on top of the edit
+        assert source.apply_stats.conflicts == 1
+        assert 177 in result.fetched
+        assert 177 not in result.errored
+        amendement = lecture_an.find_amendement(177)
+        assert amendement.resume == "Edit"
+        assert amendement.corps != "Ancien"
+        assert amendement.version == version + 2
+
+    def test_bulk_create(self, app, lecture_an, article1_an):
+        from zam_repondeur.models import DBSession
+        from zam_repondeur.services.fetch.amendements import CollectedChanges
+        from zam_repondeur.services.fetch.an.amendements import AssembleeNationale
+
+        source = AssembleeNationale(
+            settings={
+                "zam.fetch.an.batch_size": "25",
+                "zam.fetch.an.max_404": "20",
+                "zam.fetch.an.bulk_threshold": "2",
+            }
+        )
+
+        DBSession.add(lecture_an)
+        source.apply_changes(
+            lecture_an, CollectedChanges.create(creates=[self.create_action(1, 1)])
+        )
+
+        changes = CollectedChanges.create(
+            creates=[
+                self.create_action(4, article_num=2, parent_num_raw="3"),
+                self.create_action(3, article_num=2),
+                self.create_action(2, article_num=1, parent_num_raw="1"),
+            ]
+        )
+        result = source.apply_changes(lecture_an, changes)
+
+        assert result.created == {2, 3, 4}
+        transaction.commit()
+
+        DBSession.add(lecture_an)
+        amendements = {
+            amendement.num: amendement for amendement in lecture_an.amendements
+        }
+        assert amendements.keys() == {1, 2, 3, 4}
+        assert amendements[2].parent is amendements[1]
+        assert amendements[4].parent is amendements[3]
+        assert amendements[1].children == [amendements[2]]
+        assert amendements[4].article.num == "2"
+        assert amendements[4].location.batch is None
+        assert amendements[4].user_content.avis is None
+
+
+class TestConditionalRequests:
+    @responses.activate
+    def test_not_modified(self, app):
+        from zam_repondeur.services.fetch.an.amendements import (
+            _retrieve_amendement_data_from_first_working_url,
+        )
+        from zam_repondeur.services.fetch.exceptions import NotModified
+        from zam_repondeur.services.fetch.http import Validators
+
+        url = "http://www.assemblee-nationale.fr/15/amendements/0269/AN/177.xml"
+        responses.add(responses.GET, url, status=304, headers={"ETag": '"abc"'})
+
+        with pytest.raises(NotModified):
+            _retrieve_amendement_data_from_first_working_url(
+                [url], validators={url: Validators(etag='"abc"', last_modified="")}
+            )
+
+        assert responses.calls[0].request.headers["If-None-Match"] == '"abc"'
+
+    @responses.activate
+    def test_modified(self, app):
+        from zam_repondeur.services.fetch.an.amendements import (
+            _retrieve_amendement_data_from_first_working_url,
+        )
+        from zam_repondeur.services.fetch.http import Validators
+
+        url = "http://www.assemblee-nationale.fr/15/amendements/0269/AN/177.xml"
+        responses.add(
+            responses.GET,
+            url,
+            body=read_sample_data("an/269/177.xml"),
+            status=200,
+            headers={"ETag": '"def"'},
+        )
+
+        amend_data = _retrieve_amendement_data_from_first_working_url(
+            [url], validators={url: Validators(etag='"abc"', last_modified="")}
+        )
+
+        assert amend_data.get_num() == 177
+        assert amend_data.url == url
+        assert amend_data.validators == Validators(etag='"def"', last_modified="")
+
+    @responses.activate
+    def test_known_amendement_not_modified_is_unchanged(
+        self, app, lecture_an, article1_an
+    ):
+        from zam_repondeur.models import Amendement, DBSession
+        from zam_repondeur.services.fetch.an.amendements import (
+            AssembleeNationale,
+            build_url,
+        )
+        from zam_repondeur.services.fetch.http import Validators
+        from zam_repondeur.services.progress import repository
+
+        with transaction.manager:
+            DBSession.add_all([lecture_an, article1_an])
+            Amendement.create(
+                lecture=lecture_an, article=article1_an, num=1, id_identique=20386
+            )
+
+        url = build_url(lecture_an, 1)
+        repository.set_validators(
+            str(lecture_an.pk), {url: Validators(etag='"abc"', last_modified="")}
+        )
+
+        source = AssembleeNationale(
+            settings={"zam.fetch.an.batch_size": "5", "zam.fetch.an.max_404": "5"}
+        )
+
+        DBSession.add(lecture_an)
+        with setup_mock_responses(
+            lecture=lecture_an,
+            liste=LISTE_ONE_AMENDEMENT,
+            amendements=[("1", read_sample_data("an/269/177.xml"))],
+        ) as mock_resp:
+            mock_resp.replace(responses.GET, url, status=304)
+            changes = source.collect_changes(lecture_an)
+
+        assert changes.unchanged == [1]
+        assert changes.creates == changes.updates == []
+
+    @responses.activate
+    def test_validators_not_stored_when_changes_could_not_be_applied(
+        self, app, lecture_an, article1_an
+    ):
+        from sqlalchemy.orm.exc import StaleDataError
+
+        from zam_repondeur.models import Amendement, DBSession
+        from zam_repondeur.services.fetch.amendements import UpdateAmendement
+        from zam_repondeur.services.fetch.an.amendements import (
+            AssembleeNationale,
+            build_url,
+        )
+        from zam_repondeur.services.progress import repository
+
+        with transaction.manager:
+            DBSession.add_all([lecture_an, article1_an])
+            Amendement.create(
+                lecture=lecture_an, article=article1_an, num=177, corps="Ancien"
+            )
+
+        url = build_url(lecture_an, 177)
+        liste = LISTE_ONE_AMENDEMENT.replace('numero="1"', 'numero="177"')
+
+        source = AssembleeNationale(
+            settings={"zam.fetch.an.batch_size": "5", "zam.fetch.an.max_404": "5"}
+        )
+
+        DBSession.add(lecture_an)
+        with setup_mock_responses(
+            lecture=lecture_an,
+            liste=liste,
+            amendements=[("177", read_sample_data("an/269/177.xml"))],
+        ) as mock_resp:
+            mock_resp.replace(
+                responses.GET,
+                url,
+                body=read_sample_data("an/269/177.xml"),
+                headers={"ETag": '"abc"'},
+            )
+            changes = source.collect_changes(lecture_an)
+
+        # The amendement keeps being changed concurrently
+        with patch.object(UpdateAmendement, "apply", side_effect=StaleDataError):
+            result = source.apply_changes(lecture_an, changes)
+        transaction.commit()
+
+        assert result.errored == {177}
+        assert url not in repository.get_validators(str(lecture_an.pk))
+
+        # So it is fetched again on the next run
+        DBSession.add(lecture_an)
+        with setup_mock_responses(
+            lecture=lecture_an,
+            liste=liste,
+            amendements=[("177", read_sample_data("an/269/177.xml"))],
+        ):
+            changes = source.collect_changes(lecture_an)
+
+        assert changes.unchanged == []
+        assert [action.num for action in changes.updates] == [177]
+
+    def test_validators_expire(self, app, lecture_an):
+        from zam_repondeur.services.fetch.http import Validators
+        from zam_repondeur.services.progress import repository
+
+        repository.set_validators(
+            str(lecture_an.pk),
+            {"https://example.com/1.xml": Validators(etag='"abc"', last_modified="")},
+        )
+
+        ttl = repository.connection.ttl(f"fetch.validators.{lecture_an.pk}")
+        assert 0 < ttl <= repository.validators_ttl * 60
+
 
 @pytest.mark.parametrize(
     "division,type_,num,mult,pos",
@@ -1493,3 +2054,52 @@ def test_parse_mission_visee(text, expected):
     from zam_repondeur.services.fetch.an.amendements import ANAmendementData
 
     assert ANAmendementData.parse_mission_visee(text) == expected
+
+
+@pytest.mark.parametrize(
+    "basename",
+    [
+        "an/269/177.xml",
+        "an/1255/398.xml",
+        "an/1408-CION-SOC/AS1.xml",
+        "an/1490/193.xml",
+        "an/2024/319.xml",
+        "an/911/3.xml",
+    ],
+)
+def test_lxml_parser_extracts_the_same_fields(app, basename):
+    import xmltodict
+
+    from zam_repondeur.services.fetch.an.amendements import ANAmendementData
+    from zam_repondeur.services.fetch.an.parse import parse_amendement
+
+    content = (SAMPLE_DATA_DIR / basename).read_bytes()
+
+    def extract(amend_data):
+        return [
+            amend_data.get_num(),
+            amend_data.get_rectif(),
+            amend_data.get_parent_raw_num(),
+            amend_data.get_division(),
+            amend_data.get_matricule(),
+            amend_data.get_groupe(),
+            amend_data.get_auteur(),
+            amend_data.get_mission_ref(),
+            amend_data.get_corps(),
+            amend_data.get_expose(),
+            amend_data.get_sort(),
+            amend_data.get_date_depot(),
+            amend_data.get_tri_amendement(),
+        ]
+
+    expected = extract(
+        ANAmendementData(xmltodict.parse(content, force_list=("programmeAmdt",)))
+    )
+    assert extract(ANAmendementData(parse_amendement(content))) == expected
+
+
+def test_unknown_parser():
+    from zam_repondeur.services.fetch.an.amendements import AssembleeNationale
+
+    with pytest.raises(ValueError):
+        AssembleeNationale(settings={"zam.fetch.an.parser": "regex"})
@@ -1,7 +1,9 @@
 import json
+import time
 from datetime import date
 from operator import attrgetter
 from pathlib import Path
+from unittest.mock import patch
 
 import pytest
 import responses
@@ -218,6 +220,59 @@ def test_aspire_senat(app, lecture_senat, settings):
     assert sous_amendement.parent.rectif == 1
 
 
+@responses.activate
+def test_aspire_senat_in_batches(app, lecture_senat, settings):
+    from zam_repondeur.models import Amendement, DBSession
+    from zam_repondeur.services.fetch.amendements import FetchResult
+    from zam_repondeur.services.fetch.senat.amendements import Senat
+
+    csv_url = (
+        "https://www.senat.fr/amendements/2017-2018/63/jeu_complet_2017-2018_63.csv"
+    )
+    responses.add(
+        responses.GET,
+        csv_url,
+        body=read_sample_data("jeu_complet_2017-2018_63.csv"),
+        status=200,
+    )
+    responses.add(
+        responses.GET,
+        "https://data.senat.fr/data/senateurs/ODSEN_GENERAL.csv",
+        body=read_sample_data("ODSEN_GENERAL.csv"),
+        status=200,
+    )
+    responses.add(
+        responses.GET,
+        "https://www.senat.fr/enseance/2017-2018/63/liste_discussion.json",
+        json=json.loads(read_sample_data("liste_discussion_63.json")),
+        status=200,
+    )
+
+    DBSession.add(lecture_senat)
+
+    source = Senat(settings={**settings, "zam.fetch.senat.batch_size": "250"})
+
+    result = FetchResult.create()
+    start_indexes = []
+    start_index = 0
+    while start_index is not None:
+        start_indexes.append(start_index)
+        batch_result = source.fetch(lecture_senat, start_index=start_index)
+        result += batch_result
+        start_index = batch_result.next_start_index
+
+    assert start_indexes == [0, 250, 500]
+    assert len(result.fetched) == 595
+    assert len(result.created) == 595
+
+    # The CSV file is only downloaded once
+    assert len([call for call in responses.calls if call.request.url == csv_url]) == 1
+
+    # Parents are created before their "sous-amendements"
+    sous_amendement = Amendement.get(lecture_senat, 596)
+    assert sous_amendement.parent.num == 229
+
+
 @responses.activate
 def test_aspire_senat_again_with_irrecevable(app, lecture_senat, settings):
     from zam_repondeur.models import Amendement, DBSession
@@ -288,6 +343,194 @@ def test_aspire_senat_again_with_irrecevable(app, lecture_senat, settings):
     )
 
 
+@responses.activate
+def test_aspire_senat_again_unchanged_is_skipped(app, lecture_senat, settings):
+    from zam_repondeur.models import Amendement, DBSession
+    from zam_repondeur.services.fetch.senat import amendements
+    from zam_repondeur.services.fetch.senat.amendements import Senat
+
+    responses.add(
+        responses.GET,
+        "https://www.senat.fr/amendements/2017-2018/63/jeu_complet_2017-2018_63.csv",
+        body=read_sample_data("jeu_complet_2017-2018_63.csv"),
+        status=200,
+    )
+    responses.add(
+        responses.GET,
+        "https://data.senat.fr/data/senateurs/ODSEN_GENERAL.csv",
+        body=read_sample_data("ODSEN_GENERAL.csv"),
+        status=200,
+    )
+    responses.add(
+        responses.GET,
+        "https://www.senat.fr/enseance/2017-2018/63/liste_discussion.json",
+        json=json.loads(read_sample_data("liste_discussion_63.json")),
+        status=200,
+    )
+
+    DBSession.add(lecture_senat)
+
+    source = Senat(settings=settings)
+
+    source.fetch(lecture_senat)
+    amendement = Amendement.get(lecture_senat, 1)
+    assert amendement.source_fingerprint is not None
+    assert len(amendement.events) == 3
+
+    # The HTML is not cleaned again, and nothing is updated
+    with patch.object(amendements, "clean_html") as mock_clean_html:
+        result = source.fetch(lecture_senat)
+    assert 1 in result.fetched
+    mock_clean_html.assert_not_called()
+    assert len(Amendement.get(lecture_senat, 1).events) == 3
+
+
+@responses.activate
+def test_aspire_senat_again_with_concurrent_change(app, lecture_senat, settings):
+    from zam_repondeur.models import Amendement, DBSession
+    from zam_repondeur.services.fetch.senat.amendements import Senat
+
+    sample_data = read_sample_data("jeu_complet_2017-2018_63.csv")
+
+    responses.add(
+        responses.GET,
+        "https://www.senat.fr/amendements/2017-2018/63/jeu_complet_2017-2018_63.csv",
+        body=sample_data,
+        status=200,
+    )
+    # On second call we want a different sort.
+    responses.add(
+        responses.GET,
+        "https://www.senat.fr/amendements/2017-2018/63/jeu_complet_2017-2018_63.csv",
+        body=sample_data.decode("latin-1")
+        .replace(
+            "Adopté\t//www.senat.fr/amendements/2017-2018/63/Amdt_1.html",
+            "Rejeté\t//www.senat.fr/amendements/2017-2018/63/Amdt_1.html",
+        )
+        .encode("latin-1"),
+        status=200,
+    )
+    responses.add(
+        responses.GET,
+        "https://data.senat.fr/data/senateurs/ODSEN_GENERAL.csv",
+        body=read_sample_data("ODSEN_GENERAL.csv"),
+        status=200,
+    )
+    responses.add(
+        responses.GET,
+        "https://www.senat.fr/enseance/2017-2018/63/liste_discussion.json",
+        json=json.loads(read_sample_data("liste_discussion_63.json")),
+        status=200,
+    )
+
+    DBSession.add(lecture_senat)
+
+    source = Senat(settings=settings)
+
+    source.fetch(lecture_senat)
+    amendement = Amendement.get(lecture_senat, 1)
+    version = amendement.version
+
+    changes = source.collect_changes(lecture_senat)
+
+    # Someone else changes the amendement in the meantime
+    DBSession.execute(
+        Amendement.__table__.update()
+        .where(Amendement.pk == amendement.pk)
+        .values(version=Amendement.version + 1, resume="Concurrent")
+    )
+
+    result = source.apply_changes(lecture_senat, changes)
+
+    # The update is applied again on fresh data
+    assert source.apply_stats.conflicts == 1
+    assert 1 in result.fetched
+    assert 1 not in result.errored
+    amendement = Amendement.get(lecture_senat, 1)
+    assert amendement.sort == "Rejeté"
+    assert amendement.resume == "Concurrent"
+    assert amendement.version == version + 2
+
+
+@responses.activate
+def test_aspire_senat_again_with_concurrent_transfer(
+    app, lecture_senat, user_david_table_an, user_ronan_table_an, settings
+):
+    from sqlalchemy.orm import Session
+
+    from zam_repondeur.models import Amendement, DBSession, UserTable
+    from zam_repondeur.models.amendement import AmendementLocation
+    from zam_repondeur.models.events.amendement import AmendementTransfere
+    from zam_repondeur.services.fetch.senat.amendements import Senat
+
+    sample_data = read_sample_data("jeu_complet_2017-2018_63.csv")
+
+    responses.add(
+        responses.GET,
+        "https://www.senat.fr/amendements/2017-2018/63/jeu_complet_2017-2018_63.csv",
+        body=sample_data,
+        status=200,
+    )
+    # On second call we want an irrecevable (that puts it back on the index).
+    responses.add(
+        responses.GET,
+        "https://www.senat.fr/amendements/2017-2018/63/jeu_complet_2017-2018_63.csv",
+        body=sample_data.decode("latin-1")
+        .replace(
+            "Adopté\t//www.senat.fr/amendements/2017-2018/63/Amdt_1.html",
+            "Irrecevable\t//www.senat.fr/amendements/2017-2018/63/Amdt_1.html",
+        )
+        .encode("latin-1"),
+        status=200,
+    )
+    responses.add(
+        responses.GET,
+        "https://data.senat.fr/data/senateurs/ODSEN_GENERAL.csv",
+        body=read_sample_data("ODSEN_GENERAL.csv"),
+        status=200,
+    )
+    responses.add(
+        responses.GET,
+        "https://www.senat.fr/enseance/2017-2018/63/liste_discussion.json",
+        json=json.loads(read_sample_data("liste_discussion_63.json")),
+        status=200,
+    )
+
+    DBSession.add(lecture_senat)
+
+    source = Senat(settings=settings)
+
+    source.fetch(lecture_senat)
+    amendement = Amendement.get(lecture_senat, 1)
+    DBSession.add(user_david_table_an)
+    user_david_table_an.add_amendement(amendement)
+    DBSession.flush()
+    version = amendement.location.version
+
+    changes = source.collect_changes(lecture_senat)
+
+    # Meanwhile, a user transfers the amendement to Ronan (in their own session)
+    other_session = Session(bind=DBSession.connection())
+    location = other_session.query(AmendementLocation).get(amendement.location.pk)
+    location.user_table = other_session.query(UserTable).get(user_ronan_table_an.pk)
+    other_session.flush()
+    other_session.close()
+
+    result = source.apply_changes(lecture_senat, changes)
+
+    # The fetch noticed the transfer, and put it back on the index from Ronan's table
+    assert source.apply_stats.conflicts == 1
+    assert 1 in result.fetched
+    assert 1 not in result.errored
+    amendement = Amendement.get(lecture_senat, 1)
+    assert amendement.location.user_table is None
+    assert amendement.location.version == version + 2
+    transfer_event = next(
+        event for event in amendement.events if isinstance(event, AmendementTransfere)
+    )
+    assert transfer_event.data["old_value"] == "Ronan (ronan@exemple.gouv.fr)"
+
+
 @responses.activate
 def test_aspire_senat_again_with_irrecevable_transfers_to_index(
     app, lecture_senat, user_david_table_an, settings
@@ -538,34 +781,6 @@ def test_fetch_all(lecture_senat):
     }
 
 
-@responses.activate
-def test_fetch_all_with_dry_run(lecture_senat):
-    from zam_repondeur.services.fetch.senat.amendements import _fetch_all
-
-    sample_data = read_sample_data("jeu_complet_2017-2018_63.csv")
-
-    responses.add(
-        responses.GET,
-        "https://www.senat.fr/amendements/2017-2018/63/jeu_complet_2017-2018_63.csv",
-        body=sample_data,
-        status=200,
-    )
-    responses.add(
-        responses.GET,
-        "https://www.senat.fr/amendements/2017-2018/63/jeu_complet_2017-2018_63.csv",
-        body=sample_data,
-        status=200,
-    )
-
-    items = _fetch_all(lecture_senat, dry_run=True)
-    assert len(items) == 0
-
-    items = _fetch_all(lecture_senat, dry_run=False)
-    assert len(items) == 595
-
-    assert items[0]["Numéro "] == "1 rect."
-
-
 @pytest.mark.parametrize(
     "filename",
     [
@@ -606,6 +821,160 @@ def test_fetch_all_buggy_csv(lecture_senat, filename):
         assert item["Objet "].startswith("<body>") or item["Objet "] == ""
 
 
+@responses.activate
+def test_fetch_all_filter_partie(lecture_plf_2e_partie):
+    from zam_repondeur.services.fetch.senat.amendements import _fetch_all
+
+    responses.add(
+        responses.GET,
+        "https://www.senat.fr/amendements/2018-2019/146/jeu_complet_2018-2019_146.csv",
+        body=read_sample_data("jeu_complet_2018-2019_146.csv"),
+        status=200,
+    )
+
+    items = _fetch_all(lecture_plf_2e_partie, filter_partie=True)
+
+    assert len(items) == 35
+    assert all(item["Numéro "].startswith("II-") for item in items)
+
+
+@pytest.mark.parametrize("headers", [{"ETag": '"1234"'}, {}])
+@responses.activate
+def test_fetch_all_parsed_once_for_both_parties(
+    app, lecture_plf_1re_partie, lecture_plf_2e_partie, headers
+):
+    from zam_repondeur.services.fetch.senat.amendements import _fetch_all, _parse_rows
+
+    responses.add(
+        responses.GET,
+        "https://www.senat.fr/amendements/2018-2019/146/jeu_complet_2018-2019_146.csv",
+        body=read_sample_data("jeu_complet_2018-2019_146.csv"),
+        status=200,
+        headers=headers,
+    )
+
+    with patch(
+        "zam_repondeur.services.fetch.senat.amendements._parse_rows", wraps=_parse_rows
+    ) as mock_parse_rows:
+        items_1 = _fetch_all(lecture_plf_1re_partie, filter_partie=True, cache_ttl=1)
+        items_2 = _fetch_all(lecture_plf_2e_partie, filter_partie=True, cache_ttl=1)
+
+    assert mock_parse_rows.call_count == 1
+    assert len(items_1) == 1005
+    assert len(items_2) == 35
+    assert all(item["Numéro "].startswith("II-") for item in items_2)
+
+
+@responses.activate
+def test_fetch_all_too_big_to_be_cached(app, lecture_senat):
+    from zam_repondeur.services.fetch.senat.amendements import _fetch_all, _parse_rows
+    from zam_repondeur.services.progress import repository as progress_repository
+
+    url = "https://www.senat.fr/amendements/2017-2018/63/jeu_complet_2017-2018_63.csv"
+    responses.add(
+        responses.GET,
+        url,
+        body=read_sample_data("jeu_complet_2017-2018_63.csv"),
+        status=200,
+    )
+
+    with patch(
+        "zam_repondeur.services.fetch.senat.amendements._parse_rows", wraps=_parse_rows
+    ) as mock_parse_rows:
+        items_1 = _fetch_all(lecture_senat, cache_ttl=1, cache_max_size=1024)
+        items_2 = _fetch_all(lecture_senat, cache_ttl=1, cache_max_size=1024)
+
+    assert mock_parse_rows.call_count == 2
+    assert items_1 == items_2
+    assert not progress_repository.connection.keys("fetch.parsed_file.*")
+
+
+@responses.activate
+def test_aspire_senat_too_big_to_be_cached_parsed_once_per_run(
+    app, lecture_senat, settings
+):
+    from zam_repondeur.models import DBSession
+    from zam_repondeur.services.fetch.senat.amendements import Senat, _parse_rows
+    from zam_repondeur.services.progress import repository as progress_repository
+
+    responses.add(
+        responses.GET,
+        "https://www.senat.fr/amendements/2017-2018/63/jeu_complet_2017-2018_63.csv",
+        body=read_sample_data("jeu_complet_2017-2018_63.csv"),
+        status=200,
+    )
+    responses.add(
+        responses.GET,
+        "https://data.senat.fr/data/senateurs/ODSEN_GENERAL.csv",
+        body=read_sample_data("ODSEN_GENERAL.csv"),
+        status=200,
+    )
+    responses.add(
+        responses.GET,
+        "https://www.senat.fr/enseance/2017-2018/63/liste_discussion.json",
+        json=json.loads(read_sample_data("liste_discussion_63.json")),
+        status=200,
+    )
+
+    DBSession.add(lecture_senat)
+
+    source = Senat(
+        settings={
+            **settings,
+            "zam.fetch.senat.batch_size": "250",
+            "zam.fetch.senat.parsed_files_max_size": "1",
+        }
+    )
+
+    with patch(
+        "zam_repondeur.services.fetch.senat.amendements._parse_rows", wraps=_parse_rows
+    ) as mock_parse_rows:
+        start_index = 0
+        while start_index is not None:
+            changes = source.collect_changes(lecture_senat, start_index=start_index)
+            start_index = changes.next_start_index
+
+    # Not shared with other lectures, but reused for all batches of this one
+    assert mock_parse_rows.call_count == 1
+    assert not progress_repository.connection.keys("fetch.parsed_file.*")
+
+
+@responses.activate
+def test_fetch_all_parsed_again_when_changed(app, lecture_senat):
+    from zam_repondeur.services.fetch.senat.amendements import _fetch_all
+
+    url = "https://www.senat.fr/amendements/2017-2018/63/jeu_complet_2017-2018_63.csv"
+    sample_data = read_sample_data("jeu_complet_2017-2018_63.csv")
+    responses.add(responses.GET, url, body=sample_data, status=200)
+    responses.add(
+        responses.GET,
+        url,
+        body=sample_data.decode("latin-1")
+        .replace(
+            "Adopté\t//www.senat.fr/amendements/2017-2018/63/Amdt_1.html",
+            "Irrecevable\t//www.senat.fr/amendements/2017-2018/63/Amdt_1.html",
+        )
+        .encode("latin-1"),
+        status=200,
+    )
+
+    items = _fetch_all(lecture_senat, cache_ttl=1)
+    assert items[0]["Sort "] == "Adopté"
+
+    items = _fetch_all(lecture_senat, cache_ttl=1)
+    assert items[0]["Sort "] == "Irrecevable"
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 1000])
+def test_iter_lines(chunk_size):
+    from zam_repondeur.services.fetch.senat.amendements import _iter_lines
+
+    data = "sep=\t\r\nNuméro \tObjet \r\n1\t<body>é</body>\r\n\n2\t\r3".encode("cp1252")
+    chunks = [data[i : i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+    assert list(_iter_lines(chunks)) == data.decode("cp1252").splitlines()
+
+
 @responses.activate
 def test_fetch_all_commission(db):
     from zam_repondeur.models import Chambre, Dossier, Lecture, Phase, Texte, TypeTexte
@@ -661,6 +1030,27 @@ def test_fetch_all_commission(db):
     }
 
 
+@responses.activate
+def test_fetch_all_skips_incomplete_lines(lecture_senat, caplog):
+    from zam_repondeur.services.fetch.senat.amendements import _fetch_all
+
+    lines = read_sample_data("jeu_complet_2017-2018_63.csv").splitlines(keepends=True)
+    lines[2:2] = [b"\r\n", b"Amt\r\n"]  # blank and truncated rows
+
+    responses.add(
+        responses.GET,
+        "https://www.senat.fr/amendements/2017-2018/63/jeu_complet_2017-2018_63.csv",
+        body=b"".join(lines),
+        status=200,
+    )
+
+    items = _fetch_all(lecture_senat)
+
+    assert len(items) == 595
+    assert items[0]["Numéro "] == "1 rect."
+    assert "Ligne incomplète ignorée : 'Amt'" in caplog.text
+
+
 @responses.activate
 def test_fetch_all_not_found(lecture_senat):
     from zam_repondeur.services.fetch.senat.amendements import NotFound, _fetch_all
@@ -743,6 +1133,41 @@ def test_fetch_discussion_details_empty_when_url_not_found(lecture_senat):
     assert list(_fetch_discussion_details(lecture_senat)) == []
 
 
+@responses.activate
+def test_fetch_discussion_details_in_mission_order(lecture_plf_2e_partie):
+    from zam_repondeur.services.fetch.engine import FetchEngine
+    from zam_repondeur.services.fetch.senat.derouleur import _fetch_discussion_details
+
+    base_url = "https://www.senat.fr/enseance/2018-2019/146/"
+    json_data_103394 = json.loads(read_sample_data("liste_discussion_103394.json"))
+    json_data_103395 = json.loads(read_sample_data("liste_discussion_103395.json"))
+
+    def slow_response(request):
+        time.sleep(0.2)
+        return (200, {}, json.dumps(json_data_103395))
+
+    # This mission comes first, but is received last
+    responses.add_callback(
+        responses.GET, base_url + "liste_discussion_103395.json", callback=slow_response
+    )
+    responses.add(
+        responses.GET,
+        base_url + "liste_discussion_103394.json",
+        json=json_data_103394,
+        status=200,
+    )
+    for i in range(103396, 103445 + 1):
+        responses.add(
+            responses.GET, base_url + f"liste_discussion_{i}.json", status=404
+        )
+
+    data = list(
+        _fetch_discussion_details(lecture_plf_2e_partie, FetchEngine(max_workers=4))
+    )
+
+    assert [json_data for json_data, _ in data] == [json_data_103395, json_data_103394]
+
+
 @responses.activate
 def test_fetch_and_parse_discussion_details_empty_and_logs_when_url_not_found(
     lecture_senat, caplog
@@ -768,6 +1193,39 @@ def test_fetch_and_parse_discussion_details_empty_and_logs_when_url_not_found(
     assert f"Could not fetch {url}" in [rec.message for rec in caplog.records]
 
 
+@responses.activate
+def test_fetch_discussion_details_skips_rate_limited_missions(
+    lecture_plf_2e_partie, caplog
+):
+    from zam_repondeur.services.fetch.engine import FetchEngine
+    from zam_repondeur.services.fetch.senat.derouleur import _fetch_discussion_details
+
+    base_url = "https://www.senat.fr/enseance/2018-2019/146/"
+    json_data_103394 = json.loads(read_sample_data("liste_discussion_103394.json"))
+
+    responses.add(responses.GET, base_url + "liste_discussion_103395.json", status=503)
+    responses.add(
+        responses.GET,
+        base_url + "liste_discussion_103394.json",
+        json=json_data_103394,
+        status=200,
+    )
+    for i in range(103396, 103445 + 1):
+        responses.add(
+            responses.GET, base_url + f"liste_discussion_{i}.json", status=404
+        )
+
+    data = list(
+        _fetch_discussion_details(
+            lecture_plf_2e_partie, FetchEngine(max_workers=4, max_retries=0)
+        )
+    )
+
+    assert [json_data for json_data, _ in data] == [json_data_103394]
+    url = base_url + "liste_discussion_103395.json"
+    assert f"Could not fetch {url}" in [rec.message for rec in caplog.records]
+
+
 @responses.activate
 def test_fetch_and_parse_discussion_details_parent_before(lecture_senat, caplog):
     from zam_repondeur.models import DBSession
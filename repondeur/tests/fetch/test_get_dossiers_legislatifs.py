@@ -12,16 +12,14 @@ DOSSIERS = HERE / "sample_data" / "Dossiers_Legislatifs_XV.json.zip"
 
 @pytest.fixture(scope="module")
 def dossiers_and_textes():
-    from zam_repondeur.services.fetch.an.common import extract_from_zip
     from zam_repondeur.services.fetch.an.dossiers.dossiers_legislatifs import (
         get_dossiers_legislatifs_and_textes,
     )
 
     with patch(
-        "zam_repondeur.services.fetch.an.dossiers.dossiers_legislatifs"
-        ".extract_from_remote_zip"
-    ) as extract:
-        extract.return_value = extract_from_zip(open(DOSSIERS, "rb"))
+        "zam_repondeur.services.fetch.an.dossiers.dossiers_legislatifs.download_zip",
+        side_effect=lambda url, archives=None: open(DOSSIERS, "rb"),
+    ):
         dossiers_by_uid, textes_by_uid = get_dossiers_legislatifs_and_textes(15)
 
     return dossiers_by_uid, textes_by_uid
@@ -714,6 +712,26 @@ class TestGenLectures:
         assert "Commission saisie pour avis" in lectures[1].titre
         assert "Séance publique" in lectures[2].titre
 
+    def test_gen_lectures_reports_missing_textes(self, dossier_essoc, textes):
+        from zam_repondeur.services.fetch.an.dossiers.dossiers_legislatifs import (
+            KnownTextes,
+            gen_lectures,
+        )
+
+        acte = dossier_essoc["actesLegislatifs"]["acteLegislatif"][0]
+        lectures = list(gen_lectures(acte, textes, "DLR5L15N36159"))
+        unpublished = lectures[1].texte.uid  # séance publique
+        missing = []
+        known_textes = KnownTextes(get_texte=None, on_missing=missing.append)
+        known_textes.update(
+            (uid, texte) for uid, texte in textes.items() if uid != unpublished
+        )
+
+        lectures = list(gen_lectures(acte, known_textes, "DLR5L15N36159"))
+
+        assert len(lectures) == 1
+        assert missing == [unpublished]
+
 
 def test_walk_actes(dossier_essoc, textes):
     from zam_repondeur.models.phase import Phase
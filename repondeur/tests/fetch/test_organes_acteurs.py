@@ -1,9 +1,11 @@
 import json
 import os
+from io import BufferedReader, BytesIO
 from pathlib import Path
 from unittest.mock import patch
 
 import pytest
+import responses
 
 HERE = Path(os.path.dirname(__file__))
 ORGANES_ACTEURS = HERE / "sample_data" / "AMO30_subset.json.zip"
@@ -27,7 +29,7 @@ def test_get_organes_acteurs(sample_data):
 
     with patch(
         "zam_repondeur.services.fetch.an.organes_acteurs.fetch_organes_acteurs",
-        return_value=sample_data,
+        side_effect=lambda skip=None, archives=None: iter(sample_data.items()),
     ):
         organes, acteurs = get_organes_acteurs()
 
@@ -66,3 +68,104 @@ def test_extract_acteurs(sample_data):
     )
 
     assert "PA718838" in acteurs
+
+
+class ReadTracker(BufferedReader):
+    """
+    Response body that keeps track of how much is read at once
+    """
+
+    def __init__(self, content):
+        super().__init__(BytesIO(content))
+        self.reads = []
+
+    def read(self, size=-1):
+        self.reads.append(size)
+        return super().read(size)
+
+
+@responses.activate
+def test_download_zip_streams_to_disk(app):
+    from zam_repondeur.services.fetch.an.common import (
+        DOWNLOAD_CHUNK_SIZE,
+        download_zip,
+    )
+
+    content = ORGANES_ACTEURS.read_bytes()
+    body = ReadTracker(content)
+    url = "http://data.assemblee-nationale.fr/static/openData/AMO30.json.zip"
+    responses.add(
+        responses.GET,
+        url,
+        body=body,
+        stream=True,
+        status=200,
+        content_type="application/zip",
+    )
+
+    with patch("cachecontrol.adapter.CallbackFileWrapper") as cache_buffer:
+        with download_zip(url) as zip_file:
+            assert zip_file.read() == content
+
+    # The body was read in chunks, and never buffered by the HTTP cache
+    assert body.reads
+    assert all(0 < size <= DOWNLOAD_CHUNK_SIZE for size in body.reads)
+    cache_buffer.assert_not_called()
+
+
+@responses.activate
+def test_download_zip_not_modified(app):
+    from zam_repondeur.services.fetch.an.common import KnownArchives, download_zip
+    from zam_repondeur.services.fetch.exceptions import NotModified
+    from zam_repondeur.services.fetch.http import Validators
+
+    url = "http://data.assemblee-nationale.fr/static/openData/AMO30.json.zip"
+    responses.add(responses.GET, url, status=304)
+
+    class Archives(KnownArchives):
+        def validators(self, url):
+            return Validators(etag='"abc"', last_modified="")
+
+        def reuse(self, url):
+            return True
+
+    with pytest.raises(NotModified):
+        with download_zip(url, Archives()):
+            pass
+
+    assert responses.calls[0].request.headers["If-None-Match"] == '"abc"'
+
+
+@responses.activate
+def test_download_zip_not_modified_but_not_reusable(app):
+    from zam_repondeur.services.fetch.an.common import KnownArchives, download_zip
+    from zam_repondeur.services.fetch.http import Validators
+
+    content = ORGANES_ACTEURS.read_bytes()
+    url = "http://data.assemblee-nationale.fr/static/openData/AMO30.json.zip"
+    responses.add(responses.GET, url, status=304)
+    responses.add(
+        responses.GET,
+        url,
+        body=content,
+        status=200,
+        content_type="application/zip",
+        headers={"ETag": '"def"'},
+    )
+
+    class Archives(KnownArchives):
+        downloaded_with = None
+
+        def validators(self, url):
+            return Validators(etag='"abc"', last_modified="")
+
+        def downloaded(self, url, validators):
+            self.downloaded_with = validators
+
+    archives = Archives()
+    with download_zip(url, archives) as zip_file:
+        assert zip_file.read() == content
+
+    # We download it again, without the validators
+    assert "If-None-Match" not in responses.calls[1].request.headers
+    assert archives.downloaded_with == Validators(etag='"def"', last_modified="")
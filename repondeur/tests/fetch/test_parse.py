@@ -6,7 +6,11 @@ import pytest
 def test_parse_from_csv(lecture_senat, settings):
 
     from zam_repondeur.models import DBSession
-    from zam_repondeur.services.fetch.senat.amendements import Senat
+    from zam_repondeur.services.fetch.senat.amendements import (
+        CreateSenatAmendement,
+        Senat,
+        SenatData,
+    )
 
     amend = {
         "Alinéa": " ",
@@ -26,9 +30,12 @@ def test_parse_from_csv(lecture_senat, settings):
     DBSession.add(lecture_senat)
 
     source = Senat(settings=settings)
-    amendement, created = source.parse_from_csv(amend, lecture_senat)
+    data = SenatData(rows=[amend], discussion_details={}, groupes={})
+    num, action = source.inspect_row(lecture_senat, amend, data)
 
-    assert created
+    assert isinstance(action, CreateSenatAmendement)
+    action.apply(lecture_senat)
+    amendement = lecture_senat.find_amendement(num)
     assert amendement.num == 1
     assert amendement.rectif == 1
     assert amendement.num_disp == "1 rect."
@@ -49,7 +56,11 @@ def test_parse_from_csv(lecture_senat, settings):
 def test_parse_from_csv_unparsable_article(lecture_senat, settings):
 
     from zam_repondeur.models import DBSession
-    from zam_repondeur.services.fetch.senat.amendements import Senat
+    from zam_repondeur.services.fetch.senat.amendements import (
+        CreateSenatAmendement,
+        Senat,
+        SenatData,
+    )
 
     amend = {
         "Alinéa": " ",
@@ -69,9 +80,12 @@ def test_parse_from_csv_unparsable_article(lecture_senat, settings):
     DBSession.add(lecture_senat)
 
     source = Senat(settings=settings)
-    amendement, created = source.parse_from_csv(amend, lecture_senat)
+    data = SenatData(rows=[amend], discussion_details={}, groupes={})
+    num, action = source.inspect_row(lecture_senat, amend, data)
 
-    assert created
+    assert isinstance(action, CreateSenatAmendement)
+    action.apply(lecture_senat)
+    amendement = lecture_senat.find_amendement(num)
     assert amendement.num == 1
     assert amendement.rectif == 1
     assert amendement.num_disp == "1 rect."
@@ -16,7 +16,7 @@ def mock_dossiers():
     )
 
     with patch(
-        "zam_repondeur.services.data.get_dossiers_legislatifs_and_textes"
+        "zam_repondeur.services.data.iter_dossiers_legislatifs_and_textes"
     ) as m_dossiers:
         textes = {
             "PRJLANR5L15B0269": TexteRef(
@@ -187,5 +187,8 @@ def mock_dossiers():
                 ],
             ),
         }
-        m_dossiers.return_value = dossiers, textes
+        m_dossiers.side_effect = lambda *legislatures, **kwargs: (
+            (f"json/{item.uid}.json", item)
+            for item in [*textes.values(), *dossiers.values()]
+        )
         yield
@@ -1200,6 +1200,14 @@ SAMPLE_ACTEURS = {
 
 @pytest.yield_fixture(scope="session", autouse=True)
 def mock_organes_acteurs():
-    with patch("zam_repondeur.services.data.get_organes_acteurs") as m_organes:
-        m_organes.return_value = (SAMPLE_ORGANES, SAMPLE_ACTEURS)
+    def iter_organes_acteurs(skip=None, archives=None):
+        for uid, organe in SAMPLE_ORGANES.items():
+            yield f"json/organe/{uid}.json", "organe", uid, organe
+        for uid, acteur in SAMPLE_ACTEURS.items():
+            yield f"json/acteur/{uid}.json", "acteur", uid, acteur
+
+    with patch(
+        "zam_repondeur.services.data.iter_organes_acteurs",
+        side_effect=iter_organes_acteurs,
+    ):
         yield
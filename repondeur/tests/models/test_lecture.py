@@ -172,3 +172,51 @@ class TestSimilairesMap:
             666: {amdt_666},
             999: {amdt_999},
         }
+
+
+class TestLectureIndex:
+    def test_find_amendement(self, lecture_an, amendements_an):
+        from zam_repondeur.models import DBSession, Lecture
+
+        lecture_an = DBSession.query(Lecture).one()
+
+        assert lecture_an.find_amendement(666).num == 666
+        assert lecture_an.find_amendement(999).num == 999
+        assert lecture_an.find_amendement(42) is None
+
+    def test_find_article(self, lecture_an, article1_an):
+        from zam_repondeur.models import DBSession, Lecture
+        from zam_repondeur.models.division import SubDiv
+
+        lecture_an = DBSession.query(Lecture).one()
+
+        article = lecture_an.find_article(SubDiv("article", "1", "", ""))
+        assert article.pk == article1_an.pk
+        assert lecture_an.find_article(SubDiv("article", "2", "", "")) is None
+
+    def test_index_is_updated_when_creating(self, lecture_an, article1_an):
+        from zam_repondeur.models import Amendement, DBSession
+        from zam_repondeur.models.division import SubDiv
+
+        DBSession.add_all([lecture_an, article1_an])
+        assert lecture_an.find_amendement(42) is None
+
+        amendement = Amendement.create(lecture=lecture_an, article=article1_an, num=42)
+        article, created = lecture_an.find_or_create_article(
+            SubDiv("article", "2", "", "")
+        )
+
+        assert created
+        assert lecture_an.find_amendement(42) is amendement
+        assert lecture_an.find_article(SubDiv("article", "2", "", "")) is article
+
+    def test_index_is_updated_when_removing(self, lecture_an, amendements_an):
+        from zam_repondeur.models import DBSession
+
+        DBSession.add(lecture_an)
+        amendement = lecture_an.find_amendement(666)
+
+        lecture_an.amendements.remove(amendement)
+
+        assert lecture_an.find_amendement(666) is None
+        assert lecture_an.find_amendement(999) is not None
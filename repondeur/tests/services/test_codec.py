@@ -0,0 +1,97 @@
+from datetime import date
+
+import pytest
+
+
+@pytest.fixture
+def texte_ref():
+    from zam_repondeur.models.chambre import Chambre
+    from zam_repondeur.services.fetch.an.dossiers.models import TexteRef, TypeTexte
+
+    return TexteRef(
+        uid="PRJLANR5L15B0269",
+        type_=TypeTexte.PROJET,
+        chambre=Chambre.AN,
+        legislature=15,
+        numero=269,
+        titre_long="projet de loi de financement de la sécurité sociale pour 2018",
+        titre_court="PLFSS pour 2018",
+        date_depot=date(2017, 10, 11),
+    )
+
+
+@pytest.fixture
+def dossier_ref(texte_ref):
+    from zam_repondeur.models.chambre import Chambre
+    from zam_repondeur.models.phase import Phase
+    from zam_repondeur.services.fetch.an.dossiers.models import DossierRef, LectureRef
+
+    return DossierRef(
+        uid="DLR5L15N36030",
+        titre="Sécurité sociale : loi de financement 2018",
+        slug="securite-sociale-loi-de-financement-2018",
+        an_url="http://www.assemblee-nationale.fr/dyn/15/dossiers/alt/plfss_2018",
+        senat_url="https://www.senat.fr/dossier-legislatif/plfss2018.html",
+        lectures=[
+            LectureRef(
+                chambre=Chambre.AN,
+                phase=Phase.PREMIERE_LECTURE,
+                titre="Première lecture – Commission saisie au fond",
+                texte=texte_ref,
+                organe="PO420120",
+                partie=partie,
+            )
+            for partie in [1, 2]
+        ],
+    )
+
+
+def test_roundtrip_texte_ref(texte_ref):
+    from zam_repondeur.services.codec import decode, encode
+
+    assert decode(encode(texte_ref)) == texte_ref
+
+
+def test_roundtrip_texte_ref_without_date(texte_ref):
+    from dataclasses import replace
+
+    from zam_repondeur.services.codec import decode, encode
+
+    texte_ref = replace(texte_ref, legislature=None, date_depot=None)
+
+    assert decode(encode(texte_ref)) == texte_ref
+
+
+def test_roundtrip_dossier_ref(dossier_ref):
+    from zam_repondeur.services.codec import decode, encode
+
+    decoded = decode(encode(dossier_ref))
+
+    assert decoded == dossier_ref
+    assert decoded.lectures[0].texte is decoded.lectures[1].texte
+
+
+def test_roundtrip_senateur():
+    from zam_repondeur.services.codec import decode, encode
+    from zam_repondeur.services.fetch.senat.senateurs.models import Senateur
+
+    senateur = Senateur(
+        matricule="89017R", qualite="M.", nom="Adnot", prenom="Philippe", groupe="NI"
+    )
+
+    assert decode(encode(senateur)) == senateur
+
+
+def test_encoded_data_is_smaller_than_pickle(dossier_ref):
+    import pickle  # nosec
+
+    from zam_repondeur.services.codec import encode
+
+    assert len(encode(dossier_ref)) < len(pickle.dumps(dossier_ref))
+
+
+def test_unknown_format_is_rejected():
+    from zam_repondeur.services.codec import decode
+
+    with pytest.raises(ValueError):
+        decode(b"\x80\x03N.")
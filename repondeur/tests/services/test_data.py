@@ -1,3 +1,13 @@
+from datetime import date
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+import pytest
+
+HERE = Path(__file__)
+SAMPLE_DATA_DIR = HERE.parent.parent / "fetch" / "sample_data" / "senat"
+
+
 def test_list_opendata_dossiers(app):
     from zam_repondeur.services.data import repository
 
@@ -6,6 +16,42 @@ def test_list_opendata_dossiers(app):
     assert "DLR5L15N36030" in dossiers
 
 
+def test_list_opendata_textes(app):
+    from zam_repondeur.services.data import repository
+
+    textes = repository.list_opendata_textes()
+
+    assert "PRJLANR5L15B0269" in textes
+
+
+def test_list_senat_scraping_dossiers(app):
+    from zam_repondeur.services.data import repository
+
+    dossiers = repository.list_senat_scraping_dossiers()
+
+    assert "ppl18-454" in dossiers
+
+
+@pytest.mark.parametrize(
+    "list_method,index_key,uid",
+    [
+        ("list_opendata_dossiers", "an.opendata.index.dossiers", "DLR5L15N36030"),
+        ("list_opendata_textes", "an.opendata.index.textes", "PRJLANR5L15B0269"),
+        ("list_senat_scraping_dossiers", "senat.scraping.index.dossiers", "ppl18-454"),
+    ],
+)
+def test_list_without_index(app, list_method, index_key, uid):
+    from zam_repondeur.services.data import repository
+
+    # Data loaded before the index sets existed
+    prefixed_key = repository._read_prefix() + index_key
+    repository.connection.rename(prefixed_key, prefixed_key + ".saved")
+    try:
+        assert uid in getattr(repository, list_method)()
+    finally:
+        repository.connection.rename(prefixed_key + ".saved", prefixed_key)
+
+
 def test_get_opendata_dossier_ref(app):
     from zam_repondeur.services.data import repository
     from zam_repondeur.services.fetch.an.dossiers.models import DossierRef
@@ -15,6 +61,26 @@ def test_get_opendata_dossier_ref(app):
     assert isinstance(dossier_ref, DossierRef)
 
 
+def test_get_opendata_dossier_ref_by_an_url(app):
+    from zam_repondeur.services.data import repository
+
+    dossier_ref = repository.get_opendata_dossier_ref_by_an_url(
+        "http://www.assemblee-nationale.fr/dyn/15/dossiers/plfss_2018"
+    )
+
+    assert dossier_ref.uid == "DLR5L15N36030"
+
+
+def test_get_opendata_dossier_ref_by_senat_url(app):
+    from zam_repondeur.services.data import repository
+
+    dossier_ref = repository.get_opendata_dossier_ref_by_senat_url(
+        "https://www.senat.fr/dossier-legislatif/plfss2018.html"
+    )
+
+    assert dossier_ref.uid == "DLR5L15N36030"
+
+
 def test_get_opendata_texte(app):
     from zam_repondeur.services.data import repository
     from zam_repondeur.services.fetch.an.dossiers.models import TexteRef
@@ -47,3 +113,386 @@ def test_get_senat_scraping_dossier_ref(app):
     dossier_ref = repository.get_senat_scraping_dossier_ref("ppl18-454")
 
     assert isinstance(dossier_ref, DossierRef)
+
+
+def test_get_senateurs(app):
+    from zam_repondeur.services.data import repository
+
+    with patch.object(
+        repository.connection, "mget", wraps=repository.connection.mget
+    ) as mget:
+        senateurs = repository.get_senateurs(["89017R", "99999Z", "89017R"])
+
+    assert list(senateurs) == ["89017R"]
+    assert senateurs["89017R"].groupe == "NI"
+    mget.assert_called_once()
+
+
+def parse_sample_senateurs():
+    from zam_repondeur.services.fetch.senat.senateurs.parse import parse_senateurs
+
+    filename = SAMPLE_DATA_DIR / "ODSEN_GENERAL.csv"
+    with filename.open("r", encoding="cp1252") as file_:
+        return parse_senateurs(file_)
+
+
+class TestVersionedData:
+    def test_load_data_publishes_a_new_generation(self, app):
+        from zam_repondeur.services.data import repository
+
+        generation = repository.get_current_generation()
+
+        with patch(
+            "zam_repondeur.services.data.fetch_and_parse_senateurs",
+            side_effect=parse_sample_senateurs,
+        ):
+            repository.load_data()
+
+        assert repository.get_current_generation() > generation
+        assert isinstance(repository.get_opendata_organe("PO717460"), dict)
+        assert repository.get_senateur("89017R").groupe == "NI"
+
+    def test_failed_load_keeps_previous_generation(self, app):
+        from zam_repondeur.services.data import repository
+
+        generation = repository.get_current_generation()
+
+        with patch(
+            "zam_repondeur.services.data.fetch_and_parse_senateurs",
+            side_effect=RuntimeError,
+        ):
+            with pytest.raises(RuntimeError):
+                repository.load_data()
+
+        assert repository.get_current_generation() == generation
+        assert isinstance(repository.get_opendata_organe("PO717460"), dict)
+        assert repository.get_senateur("89017R").groupe == "NI"
+
+    def test_older_load_does_not_publish_over_a_newer_one(self, app):
+        from zam_repondeur.services.data import repository
+
+        generation, prefix = repository._get_published()
+
+        # A slower load that started before the one currently published
+        # (generation 0 is never allocated, so it's not the previous one either)
+        older_prefix = repository._prefix_for_generation(0)
+        repository.connection.set(older_prefix + "senateur.89017R", b"")
+        repository._publish(0, older_prefix)
+
+        assert repository._get_published() == (generation, prefix)
+        assert repository.get_senateur("89017R").groupe == "NI"
+        assert not repository.connection.exists(older_prefix + "senateur.89017R")
+
+
+class TestDataCache:
+    def test_cache_hits_and_misses(self):
+        from zam_repondeur.services.data import DataCache
+
+        cache = DataCache(max_size=10)
+        load = Mock(return_value={"libelle": "Foo"})
+
+        assert cache.get(1, "PO1", load) == {"libelle": "Foo"}
+        assert cache.get(1, "PO1", load) == {"libelle": "Foo"}
+
+        load.assert_called_once()
+        assert cache.stats() == {"generation": 1, "size": 1, "hits": 1, "misses": 1}
+
+    def test_get_many_loads_missing_keys_at_once(self):
+        from zam_repondeur.services.data import DataCache
+
+        cache = DataCache(max_size=10)
+        cache.get(1, "PO1", lambda: "one")
+        load_many = Mock(return_value=["two", "three"])
+
+        values = cache.get_many(1, ["PO1", "PO2", "PO3", "PO2"], load_many)
+
+        assert values == {"PO1": "one", "PO2": "two", "PO3": "three"}
+        load_many.assert_called_once_with(["PO2", "PO3"])
+        assert cache.get(1, "PO3", lambda: "reloaded") == "three"
+
+    def test_new_generation_drops_entries(self):
+        from zam_repondeur.services.data import DataCache
+
+        cache = DataCache(max_size=10)
+        cache.get(1, "PO1", lambda: "old")
+
+        assert cache.get(2, "PO1", lambda: "new") == "new"
+        assert cache.get(2, "PO1", lambda: "newer") == "new"
+
+    def test_cache_is_bounded(self):
+        from zam_repondeur.services.data import DataCache
+
+        cache = DataCache(max_size=2)
+        for key in ["PO1", "PO2", "PO3"]:
+            cache.get(1, key, lambda: key)
+
+        assert cache.stats()["size"] == 2
+        assert cache.get(1, "PO1", lambda: "reloaded") == "reloaded"
+
+
+def test_bulk_writes_are_flushed_in_chunks(app):
+    from zam_repondeur.services.data import DataRepository, repository
+
+    data_repository = DataRepository()
+    data_repository.connection = repository.connection
+    data_repository.versioned = False
+    data_repository.write_chunk_size = 2
+
+    with patch.object(
+        data_repository, "_flush_pipeline", wraps=data_repository._flush_pipeline
+    ) as flush:
+        with data_repository._bulk_writes("test"):
+            for i in range(5):
+                data_repository._set_json_data(f"test.bulk.{i}", i)
+
+    assert flush.call_count == 3  # two full chunks, then the remainder
+    assert data_repository._get_json_data("test.bulk.4") == 4
+    repository.connection.delete(*(f"test.bulk.{i}" for i in range(5)))
+
+
+def test_data_lock_is_only_held_to_write_downloaded_data(app):
+    from redis_lock import Lock
+
+    from zam_repondeur.services.data import DataRepository, repository
+
+    data_repository = DataRepository()
+    data_repository.connection = repository.connection
+    data_repository.versioned = False
+    data_repository.write_chunk_size = 2
+
+    lock = Lock(repository.connection, "data")
+    locked_while_downloading = []
+
+    def iter_organes_acteurs(skip, archives):
+        for i in range(5):
+            locked_while_downloading.append(lock.locked())
+            yield f"json/organe/PO{i}.json", "organe", f"PO{i}", {"uid": f"PO{i}"}
+
+    with patch(
+        "zam_repondeur.services.data.iter_organes_acteurs",
+        side_effect=iter_organes_acteurs,
+    ), patch.object(
+        data_repository, "_flush_pipeline", wraps=data_repository._flush_pipeline
+    ) as flush:
+        data_repository._load_opendata_organes_acteurs()
+
+    assert locked_while_downloading == [False] * 5
+    assert flush.call_count == 1  # all at once, while holding the lock
+    assert data_repository.get_opendata_organe("PO4") == {"uid": "PO4"}
+
+    manifest_key = data_repository._key_for_manifest("organes_acteurs")
+    repository.connection.delete(
+        manifest_key,
+        data_repository._key_for_archives("organes_acteurs"),
+        *(data_repository._key_for_opendata_organe(f"PO{i}") for i in range(5)),
+    )
+
+
+class TestSourceManifest:
+    def make_manifest(self, previous, copied):
+        from zam_repondeur.services.data import SourceManifest
+
+        def copy(entries):
+            copied.extend(filename for filename, _ in entries)
+            return set()
+
+        return SourceManifest(previous=previous, copy=copy, batch_size=10)
+
+    def test_unchanged_files_are_skipped_and_copied(self):
+        from zam_repondeur.services.data import ManifestEntry
+
+        previous = {
+            "json/organe/PO1.json": ManifestEntry("abc-1", keys=["organes.PO1"]),
+            "json/organe/PO2.json": ManifestEntry("def-2", keys=["organes.PO2"]),
+        }
+        copied = []
+        manifest = self.make_manifest(previous, copied)
+
+        assert manifest.skip("json/organe/PO1.json", "abc-1")
+        assert not manifest.skip("json/organe/PO2.json", "xyz-3")
+        assert not manifest.skip("json/organe/PO3.json", "ghi-4")
+        manifest.flush()
+
+        assert copied == ["json/organe/PO1.json"]
+        assert manifest.entries["json/organe/PO1.json"].keys == ["organes.PO1"]
+        assert manifest.entries["json/organe/PO2.json"].keys == []
+
+    def test_dossiers_referencing_changed_textes_are_parsed_again(self):
+        from zam_repondeur.services.data import ManifestEntry
+
+        previous = {
+            "json/dossierParlementaire/DL1.json": ManifestEntry(
+                "abc-1", textes=["PRJLANR5L15B0269"]
+            ),
+        }
+        copied = []
+        manifest = self.make_manifest(previous, copied)
+        manifest.changed_textes.add("PRJLANR5L15B0269")
+
+        assert not manifest.skip("json/dossierParlementaire/DL1.json", "abc-1")
+
+    def test_files_of_unmodified_archive_are_skipped_and_copied(self):
+        from zam_repondeur.services.data import ArchiveEntry, ManifestEntry
+        from zam_repondeur.services.fetch.http import Validators
+
+        url = "http://data.assemblee-nationale.fr/AMO30.json.zip"
+        previous = {
+            "json/organe/PO1.json": ManifestEntry("abc-1", keys=["organes.PO1"]),
+            "json/organe/PO2.json": ManifestEntry("def-2", keys=["organes.PO2"]),
+        }
+        previous_archive = ArchiveEntry(
+            '"abc"', "", filenames=["json/organe/PO1.json", "json/organe/PO2.json"]
+        )
+        copied = []
+        manifest = self.make_manifest(previous, copied)
+        manifest.previous_archives = {url: previous_archive}
+
+        assert manifest.validators(url) == Validators(etag='"abc"', last_modified="")
+        assert manifest.reuse(url)
+        manifest.flush()
+
+        assert copied == ["json/organe/PO1.json", "json/organe/PO2.json"]
+        assert manifest.entries.keys() == previous.keys()
+        assert manifest.archives == {url: previous_archive}
+
+    def test_unmodified_archive_is_not_reused_with_missing_files(self):
+        from zam_repondeur.services.data import ArchiveEntry, ManifestEntry
+
+        url = "http://data.assemblee-nationale.fr/AMO30.json.zip"
+        previous = {
+            "json/organe/PO1.json": ManifestEntry("abc-1", keys=["organes.PO1"]),
+        }
+        copied = []
+        manifest = self.make_manifest(previous, copied)
+        manifest.previous_archives = {
+            url: ArchiveEntry(
+                '"abc"', "", filenames=["json/organe/PO1.json", "json/organe/PO2.json"]
+            )
+        }
+
+        assert not manifest.reuse(url)
+        manifest.flush()
+
+        assert copied == []
+        assert manifest.entries == {}
+
+    def test_files_of_downloaded_archive_are_recorded(self):
+        from zam_repondeur.services.fetch.http import Validators
+
+        url = "http://data.assemblee-nationale.fr/AMO30.json.zip"
+        manifest = self.make_manifest(previous={}, copied=[])
+
+        manifest.downloaded(url, Validators(etag='"def"', last_modified=""))
+        manifest.skip("json/organe/PO1.json", "abc-1")
+
+        assert manifest.archives[url].etag == '"def"'
+        assert manifest.archives[url].filenames == ["json/organe/PO1.json"]
+
+    def test_entry_roundtrip(self):
+        from zam_repondeur.services.data import ManifestEntry
+
+        entry = ManifestEntry(
+            "abc-1", keys=["textes.T1"], indexes=[("index.textes", "T1")]
+        )
+
+        assert ManifestEntry.loads(entry.dumps().encode("utf-8")) == entry
+
+
+def test_dossier_is_parsed_again_when_its_texte_is_published(app):
+    from zam_repondeur.models.chambre import Chambre
+    from zam_repondeur.models.phase import Phase
+    from zam_repondeur.services.data import DataRepository, repository
+    from zam_repondeur.services.fetch.an.dossiers.models import (
+        DossierRef,
+        LectureRef,
+        TexteRef,
+        TypeTexte,
+    )
+
+    data_repository = DataRepository()
+    data_repository.connection = repository.connection
+    data_repository.versioned = False
+
+    texte = TexteRef(
+        uid="PRJLANR5L15B9999",
+        type_=TypeTexte.PROJET,
+        chambre=Chambre.AN,
+        legislature=15,
+        numero=9999,
+        titre_long="projet de loi pas encore publié",
+        titre_court="Pas encore publié",
+        date_depot=date(2019, 6, 1),
+    )
+    published = False
+    nb_parsed = 0
+
+    def iter_dossiers(*legislatures, skip, get_texte, on_missing_texte, archives):
+        nonlocal nb_parsed
+        if published and not skip("json/document/T.json", "texte-1"):
+            yield "json/document/T.json", texte
+        if not skip("json/dossierParlementaire/D.json", "dossier-1"):
+            nb_parsed += 1
+            if published:
+                lectures = [
+                    LectureRef(
+                        chambre=Chambre.AN,
+                        titre="Première lecture – Séance publique",
+                        phase=Phase.PREMIERE_LECTURE,
+                        texte=texte,
+                        organe="PO717460",
+                    )
+                ]
+            else:
+                on_missing_texte(texte.uid)
+                lectures = []
+            yield "json/dossierParlementaire/D.json", DossierRef(
+                uid="DLR5L15N99999",
+                titre="Pas encore publié",
+                slug="pas-encore-publie",
+                an_url="",
+                senat_url=None,
+                lectures=lectures,
+            )
+
+    with patch(
+        "zam_repondeur.services.data.iter_dossiers_legislatifs_and_textes",
+        side_effect=iter_dossiers,
+    ):
+        data_repository._load_opendata_dossiers_textes()
+        published = True
+        data_repository._load_opendata_dossiers_textes()
+
+    assert nb_parsed == 2
+    dossier_ref = data_repository.get_opendata_dossier_ref("DLR5L15N99999")
+    assert [lecture.texte.uid for lecture in dossier_ref.lectures] == [texte.uid]
+
+    manifest_key = data_repository._key_for_manifest("dossiers_textes")
+    for entry in data_repository._get_manifest(manifest_key).values():
+        for key in entry.keys:
+            repository.connection.delete(key)
+        for key, member in entry.indexes:
+            repository.connection.srem(key, member)
+    repository.connection.delete(manifest_key)
+
+
+def test_convert_legacy_data(app):
+    import pickle  # nosec
+
+    from zam_repondeur.services.data import repository
+
+    dossier_ref = repository.get_opendata_dossier_ref("DLR5L15N36030")
+    key = repository._key_for_opendata_dossier_by_an_url(dossier_ref.normalized_an_url)
+    repository._set_raw_data(key, pickle.dumps(dossier_ref))
+
+    assert (
+        repository.get_opendata_dossier_ref_by_an_url(dossier_ref.normalized_an_url)
+        == dossier_ref
+    )
+
+    assert repository.convert_legacy_data() == 1
+
+    assert repository._get_raw_data(key) == b"DLR5L15N36030"
+    assert (
+        repository.get_opendata_dossier_ref_by_an_url(dossier_ref.normalized_an_url)
+        == dossier_ref
+    )
@@ -1,3 +1,4 @@
+import pytest
 import transaction
 from huey.storage import MemoryStorage
 
@@ -43,3 +44,381 @@ class TestTransactionalHuey:
 
         assert called is True
         assert huey.pending_count() == 0
+
+
+class TestCoalescing:
+    def test_duplicate_task_is_merged(self):
+        from zam_repondeur.tasks.queue import TransactionalHuey
+
+        huey = TransactionalHuey(storage_class=MemoryStorage)
+
+        @huey.task(coalesce=True)
+        def my_task(pk):
+            pass
+
+        with transaction.manager:
+            my_task(1)
+            my_task(1)
+            my_task(2)
+
+        assert huey.pending_count() == 2
+        assert huey.pending_depth(my_task, 1) == 2
+        assert huey.pending_depth(my_task, 2) == 1
+
+    def test_task_is_enqueued_again_once_started(self):
+        from zam_repondeur.tasks.queue import TransactionalHuey
+
+        huey = TransactionalHuey(storage_class=MemoryStorage)
+
+        @huey.task(coalesce=True)
+        def my_task(pk):
+            pass
+
+        with transaction.manager:
+            my_task(1)
+
+        huey.execute(huey.dequeue())
+        assert huey.pending_depth(my_task, 1) == 0
+
+        with transaction.manager:
+            my_task(1)
+
+        assert huey.pending_count() == 1
+        assert huey.pending_depth(my_task, 1) == 1
+
+    def test_forced_task_replaces_pending_one(self):
+        from zam_repondeur.tasks.queue import TransactionalHuey
+
+        huey = TransactionalHuey(storage_class=MemoryStorage)
+
+        calls = []
+
+        @huey.task(coalesce=True)
+        def my_task(pk, force=False):
+            calls.append((pk, force))
+
+        with transaction.manager:
+            my_task(1)
+            my_task(1, force=True)
+            my_task(1)
+
+        assert huey.pending_depth(my_task, 1) == 3
+
+        while huey.pending_count():
+            huey.execute(huey.dequeue())
+
+        assert calls == [(1, True)]
+
+    def test_scheduled_pending_task_is_not_enqueued_again(self):
+        from zam_repondeur.tasks.queue import TransactionalHuey
+
+        huey = TransactionalHuey(storage_class=MemoryStorage)
+
+        @huey.task(coalesce=True)
+        def my_task(pk):
+            pass
+
+        with transaction.manager:
+            my_task.schedule(args=(1,), delay=60)
+
+        huey.add_schedule(huey.dequeue())  # not ready to run yet
+
+        with transaction.manager:
+            my_task.schedule(args=(1,), delay=120)
+
+        assert huey.pending_count() == 0
+        assert huey.scheduled_count() == 1
+        assert huey.pending_depth(my_task, 1) == 2
+
+    def test_dequeued_task_that_never_ran_is_enqueued_again(self):
+        from zam_repondeur.tasks.queue import TransactionalHuey
+
+        huey = TransactionalHuey(storage_class=MemoryStorage)
+
+        @huey.task(coalesce=True)
+        def my_task(pk):
+            pass
+
+        with transaction.manager:
+            my_task(1)
+
+        huey.dequeue()  # the worker crashes before executing it
+
+        with transaction.manager:
+            my_task(1)
+
+        assert huey.pending_count() == 1
+
+    def test_revoked_pending_task_is_enqueued_again(self):
+        from zam_repondeur.tasks.queue import TransactionalHuey
+
+        huey = TransactionalHuey(storage_class=MemoryStorage)
+
+        @huey.task(coalesce=True)
+        def my_task(pk):
+            pass
+
+        with transaction.manager:
+            my_task(1)
+
+        huey.revoke_by_id(huey.pending()[0].id)
+
+        with transaction.manager:
+            my_task(1)
+
+        assert huey.pending_count() == 2
+        assert huey.pending_depth(my_task, 1) == 1
+
+    def test_tasks_with_other_keyword_arguments_are_not_merged(self):
+        from zam_repondeur.tasks.queue import TransactionalHuey
+
+        huey = TransactionalHuey(storage_class=MemoryStorage)
+
+        @huey.task(coalesce=True)
+        def my_task(pk, user_pk=None):
+            pass
+
+        with transaction.manager:
+            my_task(1, user_pk=1)
+            my_task(1, user_pk=2)
+            my_task(1, user_pk=2)
+
+        assert huey.pending_count() == 2
+        assert huey.pending_depth(my_task, 1, user_pk=1) == 1
+        assert huey.pending_depth(my_task, 1, user_pk=2) == 2
+
+    def test_tasks_are_not_merged_by_default(self):
+        from zam_repondeur.tasks.queue import TransactionalHuey
+
+        huey = TransactionalHuey(storage_class=MemoryStorage)
+
+        @huey.task()
+        def my_task(pk):
+            pass
+
+        with transaction.manager:
+            my_task(1)
+            my_task(1)
+
+        assert huey.pending_count() == 2
+        assert huey.pending_depth(my_task, 1) == 0
+
+    def test_task_with_higher_priority_replaces_pending_one(self):
+        from zam_repondeur.tasks.queue import PRIORITY_INTERACTIVE, TransactionalHuey
+
+        huey = TransactionalHuey(storage_class=MemoryStorage)
+
+        @huey.task(coalesce=True)
+        def my_task(pk):
+            pass
+
+        with transaction.manager:
+            my_task(1)
+            my_task(1, priority=PRIORITY_INTERACTIVE)
+            my_task(1)
+
+        assert huey.pending_depth(my_task, 1) == 3
+
+        executed = []
+        while huey.pending_count():
+            task = huey.dequeue()
+            if not huey.is_revoked(task):
+                executed.append(task.priority)
+            huey.execute(task)
+
+        assert executed == [PRIORITY_INTERACTIVE]
+
+
+class TestPriorities:
+    def test_interactive_tasks_run_before_background_ones(self):
+        from zam_repondeur.tasks.queue import (
+            PRIORITY_BACKGROUND,
+            PRIORITY_INTERACTIVE,
+            TransactionalHuey,
+        )
+
+        huey = TransactionalHuey(storage_class=MemoryStorage)
+
+        calls = []
+
+        @huey.task()
+        def my_task(name):
+            calls.append(name)
+
+        with transaction.manager:
+            my_task("bulk", priority=PRIORITY_BACKGROUND)
+            my_task("default")
+            my_task("refresh", priority=PRIORITY_INTERACTIVE)
+
+        while huey.pending_count():
+            huey.execute(huey.dequeue())
+
+        assert calls == ["refresh", "default", "bulk"]
+
+    def test_priority_is_inherited_by_tasks_enqueued_from_a_task(self):
+        from zam_repondeur.tasks.queue import PRIORITY_INTERACTIVE, TransactionalHuey
+
+        huey = TransactionalHuey(storage_class=MemoryStorage)
+
+        @huey.task()
+        def child_task():
+            pass
+
+        @huey.task()
+        def parent_task():
+            child_task()
+
+        with transaction.manager:
+            parent_task(priority=PRIORITY_INTERACTIVE)
+
+        huey.execute(huey.dequeue())
+
+        assert huey.dequeue().priority == PRIORITY_INTERACTIVE
+
+    def test_queue_wait_is_measured_per_lane(self):
+        from zam_repondeur.tasks.queue import (
+            LANE_BACKGROUND,
+            LANE_DEFAULT,
+            LANE_INTERACTIVE,
+            PRIORITY_BACKGROUND,
+            TransactionalHuey,
+        )
+
+        huey = TransactionalHuey(storage_class=MemoryStorage)
+
+        @huey.task()
+        def my_task():
+            pass
+
+        with transaction.manager:
+            my_task(priority=PRIORITY_BACKGROUND)
+            my_task(priority=PRIORITY_BACKGROUND)
+            my_task()
+
+        while huey.pending_count():
+            huey.execute(huey.dequeue())
+
+        stats = huey.queue_wait_stats()
+        assert stats[LANE_INTERACTIVE]["count"] == 0
+        assert stats[LANE_DEFAULT]["count"] == 1
+        assert stats[LANE_BACKGROUND]["count"] == 2
+        assert stats[LANE_BACKGROUND]["max"] >= stats[LANE_BACKGROUND]["mean"] >= 0
+
+    def test_enqueue_times_of_tasks_that_never_ran_are_pruned(self):
+        from zam_repondeur.tasks.queue import TransactionalHuey
+
+        huey = TransactionalHuey(storage_class=MemoryStorage)
+
+        @huey.task()
+        def my_task():
+            pass
+
+        with transaction.manager:
+            my_task()
+            my_task()
+
+        huey.dequeue()  # lost
+
+        assert huey.prune_enqueued_at(max_age=3600) == 0
+        assert huey.prune_enqueued_at(max_age=-1) == 2
+
+        huey.execute(huey.dequeue())  # still runs, without a queue wait
+
+        assert huey.queue_wait_stats()["default"]["count"] == 0
+
+
+class TestLanesRedisStorage:
+    @pytest.fixture(params=[False, True], ids=["non-blocking", "blocking"])
+    def huey(self, request, settings):
+        from zam_repondeur.tasks.queue import LanesRedisStorage, TransactionalHuey
+
+        huey = TransactionalHuey(
+            name="test-lanes",
+            storage_class=LanesRedisStorage,
+            url=settings["zam.tasks.redis_url"],
+            blocking=request.param,
+            read_timeout=1,
+        )
+        huey.flush()
+        yield huey
+        huey.flush()
+
+    def test_lanes_are_dequeued_in_order(self, huey):
+        from zam_repondeur.tasks.queue import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+
+        calls = []
+
+        @huey.task()
+        def my_task(name):
+            calls.append(name)
+
+        # One transaction per task, as their order within a transaction is arbitrary
+        for name, priority in [
+            ("bulk 1", PRIORITY_BACKGROUND),
+            ("default 1", None),
+            ("bulk 2", PRIORITY_BACKGROUND),
+            ("refresh 1", PRIORITY_INTERACTIVE),
+            ("default 2", None),
+            ("refresh 2", PRIORITY_INTERACTIVE),
+        ]:
+            with transaction.manager:
+                my_task(name, priority=priority)
+
+        while huey.pending_count():
+            huey.execute(huey.dequeue())
+
+        assert calls == [
+            "refresh 1",
+            "refresh 2",
+            "default 1",
+            "default 2",
+            "bulk 1",
+            "bulk 2",
+        ]
+        assert huey.dequeue() is None
+
+    def test_default_lane_is_the_huey_queue(self, huey):
+        from zam_repondeur.tasks.queue import LANE_DEFAULT
+
+        @huey.task()
+        def my_task():
+            pass
+
+        with transaction.manager:
+            my_task()
+
+        storage = huey.storage
+        assert storage.lane_key(LANE_DEFAULT) == storage.queue_key
+        assert storage.conn.llen(storage.queue_key) == 1
+        assert storage.lane_size(LANE_DEFAULT) == 1
+
+    def test_queue_size_and_flush_cover_all_lanes(self, huey):
+        from zam_repondeur.tasks.queue import (
+            LANE_BACKGROUND,
+            LANE_DEFAULT,
+            LANE_INTERACTIVE,
+            PRIORITY_BACKGROUND,
+            PRIORITY_INTERACTIVE,
+        )
+
+        @huey.task()
+        def my_task():
+            pass
+
+        with transaction.manager:
+            my_task(priority=PRIORITY_BACKGROUND)
+            my_task(priority=PRIORITY_BACKGROUND)
+            my_task()
+            my_task(priority=PRIORITY_INTERACTIVE)
+
+        storage = huey.storage
+        assert storage.lane_size(LANE_INTERACTIVE) == 1
+        assert storage.lane_size(LANE_DEFAULT) == 1
+        assert storage.lane_size(LANE_BACKGROUND) == 2
+        assert huey.pending_count() == 4
+        assert len(huey.pending()) == 4
+
+        storage.flush_queue()
+
+        assert huey.pending_count() == 0
+        assert not any(storage.conn.exists(key) for key in storage.lane_keys)
@@ -100,7 +100,7 @@ def test_post_form(app, lecture_an, lecture_an_url, article1_an, user_david):
     assert "Rafraîchissement des amendements en cours." in resp.text
 
     # Default progress status for dummy progress bar is set.
-    assert lecture_an.get_fetch_progress() == {"current": 1, "total": 10}
+    assert lecture_an.get_fetch_progress() == {"current": 1, "total": 5}
 
     # If we fetch again the journal, the refresh button is not present anymore.
     resp = app.get(
@@ -18,6 +18,8 @@ BASE_SETTINGS = {
     "zam.auth_cookie_duration": 7 * 24 * 3600,  # a user stays identified for 7 days
     "zam.auth_cookie_secure": True,  # disable for local HTTP access in development
     "zam.legislatures": "14,15",
+    # Load open data into a new generation of keys, then switch readers atomically.
+    "zam.data.versioned": True,
     "huey.workers": (cpu_count() // 2) + 1,
     # Intervals in seconds for notifications checks:
     # Keep it low: potential data loss for the user.
@@ -87,7 +89,14 @@ def setup_database(config: Configurator, settings: dict) -> None:
 
     config.include("pyramid_tm")
 
-    engine = engine_from_config(settings, "sqlalchemy.", pool_size=pool_size)
+    # Updates of versioned rows (see Amendement.version) use RETURNING, which
+    # psycopg2 can't combine with executemany(). The "batch" executemany mode
+    # avoids that, but it applies to the whole engine: other executemany() calls
+    # are batched too, and since batches give no reliable rowcounts, SQLAlchemy
+    # issues the UPDATEs of versioned rows one by one (to check their versions).
+    engine = engine_from_config(
+        settings, "sqlalchemy.", pool_size=pool_size, executemany_mode="batch"
+    )
     DBSession.configure(bind=engine)
     Base.metadata.bind = engine
 
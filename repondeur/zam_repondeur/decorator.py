@@ -1,7 +1,40 @@
-from typing import TYPE_CHECKING
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, Dict, TypeVar, cast
 
 if TYPE_CHECKING:
     # let mypy think that @reify is like a @property
     reify = property
 else:
     from pyramid.decorator import reify  # noqa
+
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_memoized: Dict[str, Any] = {}
+
+
+def memoize(maxsize: int) -> Callable[[F], F]:
+    """
+    Bounded (LRU) memoization, for pure functions called many times with few
+    distinct arguments (e.g. parsing of libellés)
+
+    Results are shared, so they must be immutable.
+    """
+
+    def decorator(func: F) -> F:
+        cached = lru_cache(maxsize=maxsize)(func)
+        _memoized[f"{func.__module__}.{func.__qualname__}"] = cached
+        return cast(F, cached)
+
+    return decorator
+
+
+def memoize_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Hits and misses of memoized functions, since the start of the process
+    """
+    stats = {}
+    for name, cached in _memoized.items():
+        info = cached.cache_info()
+        stats[name] = {"size": info.currsize, "hits": info.hits, "misses": info.misses}
+    return stats
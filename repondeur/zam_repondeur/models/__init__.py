@@ -2,7 +2,7 @@ from typing import Any, Tuple, Type, TypeVar
 
 from pyramid_retry import mark_error_retryable
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.orm.exc import NoResultFound, StaleDataError
 
 from .amendement import AVIS, Amendement, AmendementList  # noqa
 from .article import Article, ArticleUserContent  # noqa
@@ -50,6 +50,7 @@ from .texte import Texte, TypeTexte  # noqa
 from .users import AllowedEmailPattern, Team, User  # noqa
 
 mark_error_retryable(IntegrityError)
+mark_error_retryable(StaleDataError)  # concurrent change of a versioned row
 
 
 def _get_one(model: Any, options: Any = None, **kwargs: Any) -> Tuple[Any, bool]:
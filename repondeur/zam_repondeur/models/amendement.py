@@ -36,7 +36,7 @@ from sqlalchemy import (
 from sqlalchemy.orm import backref, column_property, foreign, relationship, remote
 
 from zam_repondeur.constants import GROUPS_COLORS
-from zam_repondeur.decorator import reify
+from zam_repondeur.decorator import memoize, reify
 from zam_repondeur.services.amendements import repository as amendements_repository
 
 from .base import Base, DBSession
@@ -65,6 +65,10 @@ AVIS = [
 
 GroupingKey = Tuple[str, str, str, str]
 
+# Amendement numbers are parsed again on every refresh (and several times per
+# refresh for the Sénat), this is enough for the largest lectures
+PARSE_NUM_CACHE_SIZE = 16384
+
 
 class ReponseTuple(NamedTuple):
     avis: str
@@ -101,6 +105,10 @@ class AmendementUserContent(Base):
     )
     amendement: "Amendement" = relationship("Amendement", back_populates="user_content")
 
+    # See Amendement.version
+    version: int = Column(Integer, nullable=False, server_default="1")
+    __mapper_args__ = {"version_id_col": version}
+
     __repr_keys__ = ("pk", "amendement_pk", "avis")
 
     @property
@@ -176,6 +184,10 @@ class AmendementLocation(Base):
     batch_pk: int = Column(Integer, ForeignKey("batches.pk"), nullable=True)
     batch: Optional[Batch] = relationship(Batch, back_populates="amendements_locations")
 
+    # See Amendement.version (transfers by users and by the fetch can conflict)
+    version: int = Column(Integer, nullable=False, server_default="1")
+    __mapper_args__ = {"version_id_col": version}
+
     __repr_keys__ = ("pk", "amendement_pk")
 
 
@@ -226,6 +238,17 @@ class Amendement(Base):
     resume: Optional[str] = Column(Text, nullable=True)  # résumé du corps
     alinea: Optional[str] = Column(Text, nullable=True)  # libellé de l'alinéa ciblé
 
+    # Hash of the data we got from the source (AN or Sénat) the last time, to skip
+    # unchanged amendements without comparing all fields (must be reset when these
+    # fields are changed from elsewhere).
+    source_fingerprint: Optional[str] = Column(Text, nullable=True)
+
+    # Incremented on each update, which only succeeds if the row still has the
+    # version we loaded, so that concurrent changes are detected without locking
+    # (a StaleDataError is raised on flush otherwise, and web requests are retried).
+    version: int = Column(Integer, nullable=False, server_default="1")
+    __mapper_args__ = {"version_id_col": version}
+
     # Relations.
     parent_pk: Optional[int] = Column(
         Integer, ForeignKey("amendements.pk"), nullable=True
@@ -322,6 +345,7 @@ class Amendement(Base):
         batch: Optional[Batch] = None,
         mission_titre: Optional[str] = None,
         mission_titre_court: Optional[str] = None,
+        source_fingerprint: Optional[str] = None,
         avis: Optional[str] = None,
         objet: Optional[str] = None,
         reponse: Optional[str] = None,
@@ -349,6 +373,7 @@ class Amendement(Base):
             parent=parent,
             mission_titre=mission_titre,
             mission_titre_court=mission_titre_court,
+            source_fingerprint=source_fingerprint,
             created_at=now,
         )
         location = AmendementLocation(amendement=amendement, batch=batch)
@@ -446,6 +471,7 @@ class Amendement(Base):
     )
 
     @staticmethod
+    @memoize(maxsize=PARSE_NUM_CACHE_SIZE)
     def parse_num(text: str) -> Tuple[int, int]:
         if text == "":
             return 0, 0
@@ -1,5 +1,5 @@
 from datetime import datetime, timedelta
-from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
 
 from sqlalchemy import (
     Column,
@@ -9,6 +9,7 @@ from sqlalchemy import (
     Index,
     Integer,
     Text,
+    event,
     func,
     select,
 )
@@ -349,12 +350,12 @@ class Lecture(Base, LastEventMixin):
         assert self.texte.session_str is not None  # nosec (mypy hint)
         return self.texte.session_str
 
+    @reify
+    def index(self) -> "LectureIndex":
+        return LectureIndex(amendements=self.amendements, articles=self.articles)
+
     def find_article(self, subdiv: SubDiv) -> Optional[Article]:
-        article: Article
-        for article in self.articles:
-            if article.matches(subdiv):
-                return article
-        return None
+        return self.index.find_article(subdiv)
 
     def find_or_create_article(self, subdiv: SubDiv) -> Tuple[Article, bool]:
         article = self.find_article(subdiv)
@@ -371,11 +372,7 @@ class Lecture(Base, LastEventMixin):
         return article, created
 
     def find_amendement(self, num: int) -> Optional[Amendement]:
-        amendement: Amendement
-        for amendement in self.amendements:
-            if amendement.num == num:
-                return amendement
-        return None
+        return self.index.find_amendement(num)
 
     def find_or_create_amendement(
         self, num: int, article: Article
@@ -405,3 +402,105 @@ class Lecture(Base, LastEventMixin):
         from zam_repondeur.services.progress import repository  # avoid circular imports
 
         return repository.get_fetch_progress(str(self.pk))
+
+    def set_fetch_high_water_mark(self, numero: int) -> None:
+        from zam_repondeur.services.progress import repository  # avoid circular imports
+
+        return repository.set_high_water_mark(str(self.pk), numero)
+
+    def get_fetch_high_water_mark(self) -> int:
+        from zam_repondeur.services.progress import repository  # avoid circular imports
+
+        return repository.get_high_water_mark(str(self.pk))
+
+
+class LectureIndex:
+    """
+    Lookup of the amendements of a lecture by number, and of its articles by subdiv
+
+    It is built on first use, then kept up-to-date when amendements and articles
+    are added to (or removed from) the lecture. New objects are only indexed on the
+    next lookup, as their attributes are not all set yet when they're attached.
+    """
+
+    def __init__(
+        self, amendements: Iterable[Amendement], articles: Iterable[Article]
+    ) -> None:
+        self._amendements: Dict[int, Amendement] = {}
+        self._articles: Dict[SubDiv, Article] = {}
+        self._new_amendements: List[Amendement] = list(amendements)
+        self._new_articles: List[Article] = list(articles)
+
+    def find_amendement(self, num: int) -> Optional[Amendement]:
+        self._update()
+        return self._amendements.get(num)
+
+    def find_article(self, subdiv: SubDiv) -> Optional[Article]:
+        self._update()
+        return self._articles.get(subdiv)
+
+    def add_amendement(self, amendement: Amendement) -> None:
+        self._new_amendements.append(amendement)
+
+    def add_article(self, article: Article) -> None:
+        self._new_articles.append(article)
+
+    def remove_amendement(self, amendement: Amendement) -> None:
+        self._update()
+        if self._amendements.get(amendement.num) is amendement:
+            del self._amendements[amendement.num]
+
+    def remove_article(self, article: Article) -> None:
+        self._update()
+        if self._articles.get(article.subdiv) is article:
+            del self._articles[article.subdiv]
+
+    def _update(self) -> None:
+        for amendement in self._new_amendements:
+            self._amendements.setdefault(amendement.num, amendement)
+        self._new_amendements.clear()
+        for article in self._new_articles:
+            self._articles.setdefault(article.subdiv, article)
+        self._new_articles.clear()
+
+
+def _get_index(lecture: Lecture) -> Optional[LectureIndex]:
+    index: Optional[LectureIndex] = lecture.__dict__.get("index")  # if already built
+    return index
+
+
+@event.listens_for(Lecture.amendements, "append")
+def _index_amendement(lecture: Lecture, amendement: Amendement, initiator: Any) -> None:
+    index = _get_index(lecture)
+    if index is not None:
+        index.add_amendement(amendement)
+
+
+@event.listens_for(Lecture.amendements, "remove")
+def _unindex_amendement(
+    lecture: Lecture, amendement: Amendement, initiator: Any
+) -> None:
+    index = _get_index(lecture)
+    if index is not None:
+        index.remove_amendement(amendement)
+
+
+@event.listens_for(Lecture.articles, "append")
+def _index_article(lecture: Lecture, article: Article, initiator: Any) -> None:
+    index = _get_index(lecture)
+    if index is not None:
+        index.add_article(article)
+
+
+@event.listens_for(Lecture.articles, "remove")
+def _unindex_article(lecture: Lecture, article: Article, initiator: Any) -> None:
+    index = _get_index(lecture)
+    if index is not None:
+        index.remove_article(article)
+
+
+@event.listens_for(Lecture, "expire")
+@event.listens_for(Lecture, "refresh")
+def _drop_index(lecture: Lecture, *args: Any) -> None:
+    # Collections will be loaded again from the database
+    lecture.__dict__.pop("index", None)
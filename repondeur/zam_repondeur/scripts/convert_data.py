@@ -0,0 +1,27 @@
+import logging
+import sys
+from argparse import ArgumentParser, Namespace
+from typing import List
+
+from pyramid.paster import bootstrap, setup_logging
+
+from zam_repondeur.services.data import repository
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv: List[str] = sys.argv) -> None:
+
+    args = parse_args(argv[1:])
+
+    setup_logging(args.config_uri)
+
+    with bootstrap(args.config_uri, options={"app": "zam_convert_data"}):
+        nb_converted = repository.convert_legacy_data()
+        logger.info("Converted %d legacy keys in Redis.", nb_converted)
+
+
+def parse_args(argv: List[str]) -> Namespace:
+    parser = ArgumentParser()
+    parser.add_argument("config_uri")
+    return parser.parse_args(argv)
@@ -114,17 +114,20 @@ def fetch_amendements_for_lecture(lecture: Lecture, settings: Dict[str, Any]) ->
             source.prepare(lecture)
         logger.info("Time to prepare: %.1fs", prepare_timer.elapsed())
 
-        with Timer() as collect_timer:
-            changes = source.collect_changes(lecture)
-        logger.info("Time to collect: %.1fs", collect_timer.elapsed())
-
-        with Timer() as apply_timer:
-            source.apply_changes(lecture, changes)
-        logger.info("Time to apply: %.1fs", apply_timer.elapsed())
-
-        logger.info(
-            "Total time: %.1fs",
-            sum(t.elapsed() for t in (prepare_timer, collect_timer, apply_timer)),
-        )
+        start_index: Optional[int] = 0
+        while start_index is not None:
+            with Timer() as collect_timer:
+                changes = source.collect_changes(lecture, start_index=start_index)
+            logger.info("Time to collect: %.1fs", collect_timer.elapsed())
+
+            with Timer() as apply_timer:
+                result = source.apply_changes(lecture, changes)
+            logger.info("Time to apply: %.1fs", apply_timer.elapsed())
+
+            logger.info(
+                "Total time: %.1fs",
+                sum(t.elapsed() for t in (prepare_timer, collect_timer, apply_timer)),
+            )
+            start_index = result.next_start_index
     except Exception:
         logger.exception(f"Error while fetching {lecture}")
@@ -5,6 +5,8 @@ from typing import List
 
 from pyramid.paster import bootstrap, setup_logging
 
+from zam_repondeur.tasks.queue import LANES
+
 logger = logging.getLogger(__name__)
 
 
@@ -22,6 +24,8 @@ def main(argv: List[str] = sys.argv) -> None:
             print(count)
         else:
             print(f"{count} task(s) in queue")
+            for lane in LANES:
+                print(f"- {lane}: {huey.storage.lane_size(lane)}")
             for task in huey.pending():
                 print(task)
 
@@ -0,0 +1,166 @@
+"""
+Compact binary encoding of the data models we store in Redis
+
+Values are packed with msgpack as plain lists, and prefixed with a header that
+carries the format version. Enums are stored by name, dates as ordinals, and the
+textes of a dossier are only stored once, with lectures pointing to them.
+
+Compared to pickle, values are smaller and do not depend on the module paths of
+the classes. Any change to the layout below requires bumping `FORMAT_VERSION`.
+"""
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional
+
+import msgpack
+
+from zam_repondeur.models.chambre import Chambre
+from zam_repondeur.models.phase import Phase
+from zam_repondeur.models.texte import TypeTexte
+from zam_repondeur.services.fetch.an.dossiers.models import (
+    DossierRef,
+    LectureRef,
+    TexteRef,
+)
+from zam_repondeur.services.fetch.senat.senateurs.models import Senateur
+
+FORMAT_VERSION = 1
+
+HEADER = b"ZAM" + bytes([FORMAT_VERSION])
+
+
+def encode(value: Any) -> bytes:
+    tag, encode_value = _ENCODERS[type(value)]
+    packed: bytes = msgpack.packb([tag, encode_value(value)], use_bin_type=True)
+    return HEADER + packed
+
+
+def decode(raw: bytes) -> Any:
+    if not is_encoded(raw):
+        raise ValueError(f"Unsupported data format: {raw[:len(HEADER)]!r}")
+    tag, payload = msgpack.unpackb(raw[len(HEADER) :], raw=False)
+    return _DECODERS[tag](payload)
+
+
+def is_encoded(raw: bytes) -> bool:
+    return raw.startswith(HEADER)
+
+
+def _encode_date(value: Optional[date]) -> Optional[int]:
+    return value.toordinal() if value is not None else None
+
+
+def _decode_date(value: Optional[int]) -> Optional[date]:
+    return date.fromordinal(value) if value is not None else None
+
+
+def _encode_texte_ref(texte_ref: TexteRef) -> list:
+    return [
+        texte_ref.uid,
+        texte_ref.type_.name,
+        texte_ref.chambre.name,
+        texte_ref.legislature,
+        texte_ref.numero,
+        texte_ref.titre_long,
+        texte_ref.titre_court,
+        _encode_date(texte_ref.date_depot),
+    ]
+
+
+def _decode_texte_ref(payload: list) -> TexteRef:
+    uid, type_, chambre, legislature, numero, titre_long, titre_court, date_ = payload
+    return TexteRef(
+        uid=uid,
+        type_=TypeTexte[type_],
+        chambre=Chambre[chambre],
+        legislature=legislature,
+        numero=numero,
+        titre_long=titre_long,
+        titre_court=titre_court,
+        date_depot=_decode_date(date_),
+    )
+
+
+def _encode_dossier_ref(dossier_ref: DossierRef) -> list:
+    textes: List[TexteRef] = []
+    positions: Dict[str, int] = {}
+    lectures = []
+    for lecture in dossier_ref.lectures:
+        uid = lecture.texte.uid
+        if uid not in positions:
+            positions[uid] = len(textes)
+            textes.append(lecture.texte)
+        lectures.append(
+            [
+                lecture.chambre.name,
+                lecture.phase.name,
+                lecture.titre,
+                positions[uid],
+                lecture.organe,
+                lecture.partie,
+            ]
+        )
+    return [
+        dossier_ref.uid,
+        dossier_ref.titre,
+        dossier_ref.slug,
+        dossier_ref.an_url,
+        dossier_ref.senat_url,
+        [_encode_texte_ref(texte) for texte in textes],
+        lectures,
+    ]
+
+
+def _decode_dossier_ref(payload: list) -> DossierRef:
+    uid, titre, slug, an_url, senat_url, textes_payload, lectures_payload = payload
+    textes = [_decode_texte_ref(texte) for texte in textes_payload]
+    return DossierRef(
+        uid=uid,
+        titre=titre,
+        slug=slug,
+        an_url=an_url,
+        senat_url=senat_url,
+        lectures=[
+            LectureRef(
+                chambre=Chambre[chambre],
+                phase=Phase[phase],
+                titre=titre_lecture,
+                texte=textes[position],
+                organe=organe,
+                partie=partie,
+            )
+            for chambre, phase, titre_lecture, position, organe, partie in (
+                lectures_payload
+            )
+        ],
+    )
+
+
+def _encode_senateur(senateur: Senateur) -> list:
+    return [
+        senateur.matricule,
+        senateur.qualite,
+        senateur.nom,
+        senateur.prenom,
+        senateur.groupe,
+    ]
+
+
+def _decode_senateur(payload: list) -> Senateur:
+    matricule, qualite, nom, prenom, groupe = payload
+    return Senateur(
+        matricule=matricule, qualite=qualite, nom=nom, prenom=prenom, groupe=groupe
+    )
+
+
+# The tags must never be reused for another type
+_ENCODERS: Dict[type, Any] = {
+    TexteRef: (1, _encode_texte_ref),
+    DossierRef: (2, _encode_dossier_ref),
+    Senateur: (3, _encode_senateur),
+}
+
+_DECODERS: Dict[int, Callable[[list], Any]] = {
+    1: _decode_texte_ref,
+    2: _decode_dossier_ref,
+    3: _decode_senateur,
+}
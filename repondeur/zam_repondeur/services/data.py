@@ -1,23 +1,54 @@
 import json
+import logging
 import pickle  # nosec
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
 from io import BytesIO
-from typing import Any, Dict, List, Optional
+from threading import Lock as ThreadLock
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
+from paste.deploy.converters import asbool
 from pyramid.config import Configurator
+from redis import Redis
+from redis.client import Pipeline
+from redis.exceptions import WatchError
 from redis_lock import Lock, reset_all
 
 from zam_repondeur.initialize import needs_init
-from zam_repondeur.services import Repository
+from zam_repondeur.services import Repository, codec
 from zam_repondeur.services.fetch.an.dossiers.dossiers_legislatifs import (
-    get_dossiers_legislatifs_and_textes,
+    iter_dossiers_legislatifs_and_textes,
 )
 from zam_repondeur.services.fetch.an.dossiers.models import DossierRef, TexteRef
-from zam_repondeur.services.fetch.an.organes_acteurs import get_organes_acteurs
+from zam_repondeur.services.fetch.an.common import KnownArchives
+from zam_repondeur.services.fetch.an.organes_acteurs import (
+    ORGANE,
+    iter_organes_acteurs,
+)
 from zam_repondeur.services.fetch.senat.scraping import get_dossier_refs_senat
+from zam_repondeur.services.fetch.http import Validators
 from zam_repondeur.services.fetch.senat.senateurs import (
     Senateur,
     fetch_and_parse_senateurs,
 )
+from zam_repondeur.utils import Timer
+
+logger = logging.getLogger(__name__)
 
 
 def includeme(config: Configurator) -> None:
@@ -32,6 +63,16 @@ def init_repository(settings: Dict[str, str]) -> None:
     repository.legislatures = [
         int(legi) for legi in settings["zam.legislatures"].split(",")
     ]
+    repository.versioned = asbool(settings.get("zam.data.versioned", True))
+    repository.cache = DataCache(
+        max_size=int(settings.get("zam.data.cache_size", 10_000))
+    )
+    repository.check_interval = float(settings.get("zam.data.check_interval", 5))
+    repository.write_chunk_size = int(settings.get("zam.data.write_chunk_size", 1000))
+
+
+# Data written by older versions was pickled (protocol 2 and above)
+PICKLE_PROTO = pickle.PROTO
 
 
 class BackwardsCompatibleUnpickler(pickle.Unpickler):
@@ -41,64 +82,692 @@ class BackwardsCompatibleUnpickler(pickle.Unpickler):
         return super().find_class(module, name)
 
 
+class DataCache:
+    """
+    Bounded in-process cache for data that only changes when `load_data()` runs
+
+    Entries belong to the data generation they were read from, and the whole
+    cache is dropped as soon as we notice that a new generation was published.
+    """
+
+    def __init__(self, max_size: int = 10_000) -> None:
+        self.max_size = max_size
+        self.generation: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = ThreadLock()
+
+    def get(self, generation: int, key: Hashable, load: Callable[[], Any]) -> Any:
+        with self._lock:
+            if generation != self.generation:
+                self._entries.clear()
+                self.generation = generation
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        value = load()
+
+        with self._lock:
+            if generation == self.generation:
+                self._entries[key] = value
+                if len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return value
+
+    def get_many(
+        self,
+        generation: int,
+        keys: Iterable[Hashable],
+        load_many: Callable[[List[Any]], List[Any]],
+    ) -> Dict[Hashable, Any]:
+        """
+        Same as `get()` for several keys, with missing ones loaded all at once
+        """
+        values: Dict[Hashable, Any] = {}
+        missing: List[Hashable] = []
+        with self._lock:
+            if generation != self.generation:
+                self._entries.clear()
+                self.generation = generation
+            for key in dict.fromkeys(keys):  # without duplicates
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    values[key] = self._entries[key]
+                else:
+                    self.misses += 1
+                    missing.append(key)
+
+        if not missing:
+            return values
+
+        loaded = dict(zip(missing, load_many(missing)))
+
+        with self._lock:
+            if generation == self.generation:
+                for key, value in loaded.items():
+                    self._entries[key] = value
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        values.update(loaded)
+        return values
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.generation = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "generation": self.generation or 0,
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+@dataclass
+class ManifestEntry:
+    """
+    What was written to Redis from one file of an open data archive
+    """
+
+    fingerprint: str
+    keys: List[str] = field(default_factory=list)
+    indexes: List[Tuple[str, str]] = field(default_factory=list)
+    textes: List[str] = field(default_factory=list)  # referenced by dossiers
+
+    def dumps(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def loads(cls, raw: bytes) -> "ManifestEntry":
+        data = json.loads(raw)
+        return cls(
+            fingerprint=data["fingerprint"],
+            keys=data["keys"],
+            indexes=[(key, member) for key, member in data["indexes"]],
+            textes=data["textes"],
+        )
+
+
+@dataclass
+class ArchiveEntry:
+    """
+    Validators of an open data archive, and the files we got data from
+    """
+
+    etag: str
+    last_modified: str
+    filenames: List[str] = field(default_factory=list)
+
+    @property
+    def validators(self) -> Validators:
+        return Validators(etag=self.etag, last_modified=self.last_modified)
+
+    def dumps(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def loads(cls, raw: bytes) -> "ArchiveEntry":
+        data = json.loads(raw)
+        return cls(
+            etag=data["etag"],
+            last_modified=data["last_modified"],
+            filenames=data["filenames"],
+        )
+
+
+class SourceManifest(KnownArchives):
+    """
+    Keep track of the archive files a loading stage got its data from
+
+    Files that did not change since the previous generation (same fingerprint)
+    are skipped, and the data parsed from them is copied over instead. Copies
+    are batched, but always flushed before writing newly parsed data, so that
+    we still write everything in the same order as a full load.
+
+    Archives are downloaded with a conditional request, and when they were not
+    modified, all their files are skipped without downloading them again.
+    """
+
+    def __init__(
+        self,
+        previous: Dict[str, ManifestEntry],
+        copy: Callable[[List[Tuple[str, ManifestEntry]]], Set[str]],
+        batch_size: int,
+        previous_archives: Optional[Dict[str, ArchiveEntry]] = None,
+    ) -> None:
+        self.previous = previous
+        self.previous_archives = previous_archives or {}
+        self.entries: Dict[str, ManifestEntry] = {}
+        self.archives: Dict[str, ArchiveEntry] = {}
+        self._current_archive: Optional[ArchiveEntry] = None
+        self.changed_textes: Set[str] = set()
+        self.nb_parsed = 0
+        self.nb_reused = 0
+        self._copy = copy
+        self._batch_size = batch_size
+        self._pending: List[Tuple[str, ManifestEntry]] = []
+
+    def skip(self, filename: str, fingerprint: str) -> bool:
+        if self._current_archive is not None:
+            self._current_archive.filenames.append(filename)
+        entry = self.previous.get(filename)
+        if entry is None or not self._unchanged(entry, fingerprint):
+            self.entries[filename] = ManifestEntry(fingerprint=fingerprint)
+            self.nb_parsed += 1
+            return False
+        self.entries[filename] = entry
+        self.nb_reused += 1
+        self._pending.append((filename, entry))
+        if len(self._pending) >= self._batch_size:
+            self.flush()
+        return True
+
+    def _unchanged(self, entry: ManifestEntry, fingerprint: str) -> bool:
+        return entry.fingerprint == fingerprint and self.changed_textes.isdisjoint(
+            entry.textes
+        )
+
+    def validators(self, url: str) -> Optional[Validators]:
+        archive = self.previous_archives.get(url)
+        return archive.validators if archive is not None else None
+
+    def reuse(self, url: str) -> bool:
+        """
+        Skip all the files of an archive that was not modified, if we can
+        """
+        archive = self.previous_archives.get(url)
+        if archive is None:
+            return False
+        fingerprints = {}
+        for filename in archive.filenames:
+            entry = self.previous.get(filename)
+            if entry is None or not self._unchanged(entry, entry.fingerprint):
+                return False
+            fingerprints[filename] = entry.fingerprint
+        self.downloaded(url, archive.validators)
+        for filename, fingerprint in fingerprints.items():
+            self.skip(filename, fingerprint)
+        self._current_archive = None
+        return True
+
+    def downloaded(self, url: str, validators: Optional[Validators]) -> None:
+        if validators is None:
+            self._current_archive = None
+            return
+        self._current_archive = self.archives[url] = ArchiveEntry(
+            etag=validators.etag, last_modified=validators.last_modified
+        )
+
+    def entry_for(self, filename: str) -> ManifestEntry:
+        self.flush()
+        # An empty fingerprint never matches, in case `skip` was not called
+        return self.entries.setdefault(filename, ManifestEntry(fingerprint=""))
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        for filename in self._copy(self._pending):
+            del self.entries[filename]  # parse it again next time
+        self._pending = []
+
+
 class DataRepository(Repository):
     """
     Store and access global data in Redis
 
-    We use a lock so that periodic updates by a worker thread do not interfere
-    with regular read accesses (e.g. when fetching amendements).
+    In versioned mode (the default), each call to `load_data()` writes a new
+    generation of the data under a fresh key prefix, then atomically flips the
+    `data.current` pointer to it once everything has been written. Readers only
+    need to look up the current prefix: they never take a lock, and never see
+    a partially loaded dataset.
+
+    Otherwise, keys are not prefixed and we use a lock so that periodic updates
+    by a worker thread do not interfere with regular read accesses (e.g. when
+    fetching amendements).
+
+    Organes, acteurs and sénateurs are also kept in an in-process cache, which
+    is invalidated when a new generation is published. We only look up the
+    current generation every `check_interval` seconds.
+
+    When loading data, writes are sent through a Redis pipeline, in chunks of
+    `write_chunk_size` commands, to avoid one network round-trip per key.
+
+    AN open data archives are loaded incrementally: we record which keys were
+    written from each file of the archive, and copy them from the previous
+    generation when the file did not change (see `SourceManifest`).
+
+    The UIDs of dossiers and textes are also added to index sets when writing,
+    so that listing them does not require a (blocking) scan of the keyspace.
     """
 
     legislatures: List[int] = []
+    versioned: bool = True
+    check_interval: float = 5.0
+    write_chunk_size: int = 1000
+
+    # Pointer to the currently published generation (a Redis hash)
+    CURRENT_KEY = "data.current"
+
+    # Counter used to allocate a new generation number on each load
+    NEXT_GENERATION_KEY = "data.next_generation"
+
+    # Bump this to parse all open data files again after changing the parsers
+    MANIFEST_VERSION = 3
+
+    # Key patterns of all the data we store, relative to a generation prefix
+    NAMESPACE_PATTERNS = ["an.opendata.*", "senat.scraping.*", "senateur.*"]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._write_prefix: Optional[str] = None
+        self._pipeline: Optional[Pipeline] = None
+        self._nb_pending_writes = 0
+        self._deferred_writes = False
+        self._recording: Optional[ManifestEntry] = None
+        self._published: Optional[Tuple[int, str]] = None
+        self._published_checked_at = 0.0
+        self.cache = DataCache()
 
     @needs_init
     def clear_data(self) -> None:
         self.connection.flushdb()
+        self._forget_published()
 
     @needs_init
     def reset_locks(self) -> None:
         reset_all(self.connection)
 
+    @needs_init
+    def convert_legacy_data(self) -> int:
+        """
+        Convert the currently published data from the legacy pickle format
+
+        Secondary indexes are turned into UID pointers, and the sets used to list
+        dossiers and textes are rebuilt. Returns the number of converted keys.
+        """
+        conversions: List[Tuple[str, Callable[[Any], Any], Optional[str]]] = [
+            (
+                self._key_for_opendata_dossier("*"),
+                codec.encode,
+                self._key_for_opendata_dossiers_index(),
+            ),
+            (
+                self._key_for_opendata_texte("*"),
+                codec.encode,
+                self._key_for_opendata_textes_index(),
+            ),
+            (
+                self._key_for_senat_scraping_dossier("*"),
+                codec.encode,
+                self._key_for_senat_scraping_dossiers_index(),
+            ),
+            (self._key_for_senateur("*"), codec.encode, None),
+            (
+                self._key_for_opendata_dossier_by_an_url("*"),
+                lambda dossier_ref: dossier_ref.uid,
+                None,
+            ),
+            (
+                self._key_for_opendata_dossier_by_senat_url("*"),
+                lambda dossier_ref: dossier_ref.uid,
+                None,
+            ),
+            (
+                self._key_for_senat_scraping_dossier_by_an_url("*"),
+                lambda dossier_ref: dossier_ref.senat_dossier_id,
+                None,
+            ),
+        ]
+        prefix = self._read_prefix()
+        nb_converted = 0
+        with self._data_lock(), self._bulk_writes("converted"):
+            for pattern, convert, index_key in conversions:
+                for prefixed_key in self.connection.scan_iter(
+                    match=prefix + pattern, count=1000
+                ):
+                    raw_bytes = self.connection.get(prefixed_key)
+                    if raw_bytes is None or not self._is_pickle(raw_bytes):
+                        continue
+                    key = prefixed_key.decode("utf-8")[len(prefix) :]
+                    ttl = self.connection.ttl(prefixed_key)
+                    value = convert(self._decode(raw_bytes))
+                    if value is None:
+                        self.connection.delete(prefixed_key)
+                        continue
+                    self._set_raw_data(key, value, ttl if ttl > 0 else None)
+                    if index_key is not None:
+                        uid = key[len(pattern) - 1 :]
+                        self._add_to_index(index_key, uid, ttl if ttl > 0 else None)
+                    nb_converted += 1
+        self._forget_published()
+        return nb_converted
+
     @needs_init
     def load_data(self) -> None:
-        self._load_opendata_organes_acteurs()
-        self._load_opendata_dossiers_textes()
-        self._load_scraping_senat_dossiers()
-        self._load_senateurs_groupes()
+        generation = self.connection.incr(self.NEXT_GENERATION_KEY)
+        prefix = self._prefix_for_generation(generation) if self.versioned else ""
+        logger.info("Loading data generation %d", generation)
+        try:
+            with self._writing_to(prefix):
+                for name, load_stage in [
+                    ("organes/acteurs", self._load_opendata_organes_acteurs),
+                    ("dossiers/textes", self._load_opendata_dossiers_textes),
+                    ("dossiers Sénat", self._load_scraping_senat_dossiers),
+                    ("sénateurs", self._load_senateurs_groupes),
+                ]:
+                    with Timer() as timer:
+                        load_stage()
+                    logger.info("Loaded %s in %.1fs", name, timer.elapsed())
+        except Exception:
+            if prefix:
+                logger.exception("Discarding incomplete data generation %d", generation)
+                self._delete_namespace(prefix)
+            raise
+        self._publish(generation, prefix)
 
-    def _load_opendata_organes_acteurs(self) -> None:
-        organes, acteurs = get_organes_acteurs()
+    @staticmethod
+    def _prefix_for_generation(generation: int) -> str:
+        return f"data.{generation}."
+
+    @contextmanager
+    def _writing_to(self, prefix: str) -> Iterator[None]:
+        self._write_prefix = prefix
+        try:
+            yield
+        finally:
+            self._write_prefix = None
+
+    @contextmanager
+    def _bulk_writes(self, name: str, deferred: bool = False) -> Iterator[None]:
+        """
+        With `deferred`, the data lock is taken here, but only to send the writes:
+        in non-versioned mode, they are all kept in the pipeline until then, so
+        that the lock is not held while the data is being downloaded and parsed
+        """
+        self._pipeline = self.connection.pipeline(transaction=False)
+        self._nb_pending_writes = 0
+        self._deferred_writes = deferred and not self.versioned
+        try:
+            with Timer() as timer:
+                yield
+                nb_keys = self._nb_pending_writes
+                if deferred:
+                    with self._data_lock():
+                        self._flush_pipeline()
+                else:
+                    self._flush_pipeline()
+        finally:
+            self._pipeline = None
+            self._deferred_writes = False
+        logger.info("Wrote %d %s entries in %.1fs", nb_keys, name, timer.elapsed())
+
+    def _flush_pipeline(self) -> None:
+        if self._pipeline is not None:
+            self._pipeline.execute()
+
+    @contextmanager
+    def _data_lock(self) -> Iterator[None]:
+        if self.versioned:  # readers never see an unpublished generation
+            yield
+            return
         with Lock(self.connection, "data"):
-            for uid, organe in organes.items():
-                self._set_json_data(self._key_for_opendata_organe(uid), organe)
+            yield
+
+    def _publish(self, generation: int, prefix: str) -> None:
+        """
+        Make a fully loaded generation visible to readers
+
+        We keep the previous generation around, so that readers that looked up
+        the prefix just before the switch can still complete their reads, and
+        delete the one before.
+
+        The switch is a compare-and-set, so that a slower load that started first
+        does not publish its (older) generation over a newer one.
+        """
+        with self.connection.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(self.CURRENT_KEY)
+                    current = self._get_current(pipe)
+                    if int(current.get("generation", 0)) > generation:
+                        pipe.reset()
+                        logger.warning(
+                            "Discarding data generation %d, generation %s is newer",
+                            generation,
+                            current["generation"],
+                        )
+                        if prefix:
+                            self._delete_namespace(prefix)
+                        return
+                    current_prefix = current.get("prefix", "")
+                    previous_prefix = current.get("previous_prefix")
+                    if current_prefix != prefix:
+                        previous_prefix, stale_prefix = current_prefix, previous_prefix
+                    else:
+                        stale_prefix = None
+                    pipe.multi()
+                    pipe.hmset(
+                        self.CURRENT_KEY,
+                        {
+                            "generation": generation,
+                            "prefix": prefix,
+                            "previous_prefix": previous_prefix or "",
+                        },
+                    )
+                    pipe.execute()
+                    break
+                except WatchError:  # published by another load in the meantime
+                    continue
+        self._forget_published()
+        logger.info("Published data generation %d", generation)
+        if stale_prefix is not None and stale_prefix not in {prefix, previous_prefix}:
+            self._delete_namespace(stale_prefix)
+
+    def _get_current(self, connection: Optional[Redis] = None) -> Dict[str, str]:
+        if connection is None:
+            connection = self.connection
+        return {
+            key.decode("utf-8"): value.decode("utf-8")
+            for key, value in connection.hgetall(self.CURRENT_KEY).items()
+        }
+
+    def _get_published(self) -> Tuple[int, str]:
+        now = time.monotonic()
+        if (
+            self._published is None
+            or now - self._published_checked_at >= self.check_interval
+        ):
+            current = self._get_current()
+            self._published = (
+                int(current.get("generation", 0)),
+                current.get("prefix", ""),
+            )
+            self._published_checked_at = now
+        return self._published
+
+    def _forget_published(self) -> None:
+        self._published = None
+        self.cache.clear()
+
+    @needs_init
+    def get_current_generation(self) -> int:
+        generation, _ = self._get_published()
+        return generation
+
+    def cache_stats(self) -> Dict[str, int]:
+        return self.cache.stats()
+
+    def _delete_namespace(self, prefix: str) -> None:
+        for pattern in self.NAMESPACE_PATTERNS:
+            self._delete_matching(prefix + pattern)
 
-            for uid, acteur in acteurs.items():
-                self._set_json_data(self._key_for_opendata_acteur(uid), acteur)
+    def _delete_matching(self, pattern: str) -> None:
+        """
+        Delete keys matching a pattern using SCAN rather than KEYS, as the latter
+        would block the Redis server (shared with huey) while it walks all keys
+        """
+        keys = list(self.connection.scan_iter(match=pattern, count=1000))
+        for index in range(0, len(keys), 1000):
+            self.connection.delete(*keys[index : index + 1000])
+
+    def _read_prefix(self) -> str:
+        if not self.versioned:
+            return ""
+        _, prefix = self._get_published()
+        return prefix
+
+    def _prefixed_for_write(self, key: str) -> str:
+        if self._write_prefix is not None:
+            return self._write_prefix + key
+        return self._read_prefix() + key
+
+    def _load_opendata_organes_acteurs(self) -> None:
+        with self._bulk_writes("organes/acteurs", deferred=True):
+            with self._incremental("organes_acteurs") as manifest:
+                for filename, kind, uid, item in iter_organes_acteurs(
+                    manifest.skip, archives=manifest
+                ):
+                    self._recording = manifest.entry_for(filename)
+                    if kind == ORGANE:
+                        key = self._key_for_opendata_organe(uid)
+                    else:
+                        key = self._key_for_opendata_acteur(uid)
+                    self._set_json_data(key, item)
 
     def _load_opendata_dossiers_textes(self) -> None:
-        dossiers, textes = get_dossiers_legislatifs_and_textes(*self.legislatures)
-        with Lock(self.connection, "data"):
-            for dossier_ref in dossiers.values():
-                self.set_opendata_dossier_ref(dossier_ref)
+        with self._bulk_writes("dossiers/textes", deferred=True):
+            with self._incremental("dossiers_textes") as manifest:
+                # Textes referenced by the next dossier, but not published yet
+                missing_textes: List[str] = []
+                for filename, item in iter_dossiers_legislatifs_and_textes(
+                    *self.legislatures,
+                    skip=manifest.skip,
+                    archives=manifest,
+                    get_texte=self._get_previous_texte if manifest.previous else None,
+                    on_missing_texte=missing_textes.append,
+                ):
+                    entry = manifest.entry_for(filename)
+                    self._recording = entry
+                    if isinstance(item, TexteRef):
+                        manifest.changed_textes.add(item.uid)
+                        self.set_opendata_texte_ref(item)
+                    else:
+                        entry.textes.extend(
+                            lecture.texte.uid for lecture in item.lectures
+                        )
+                        # So that it is parsed again once they are published
+                        entry.textes.extend(missing_textes)
+                        missing_textes.clear()
+                        self.set_opendata_dossier_ref(item)
+
+    def _get_previous_texte(self, uid: str) -> Optional[TexteRef]:
+        # Not using get_opendata_texte(), as we may already hold the data lock
+        key = self._read_prefix() + self._key_for_opendata_texte(uid)
+        texte_ref: Optional[TexteRef] = self._decode(self.connection.get(key))
+        return texte_ref
+
+    @contextmanager
+    def _incremental(self, stage: str) -> Iterator[SourceManifest]:
+        key = self._key_for_manifest(stage)
+        archives_key = self._key_for_archives(stage)
+        manifest = SourceManifest(
+            previous=self._get_manifest(key),
+            copy=self._copy_unchanged,
+            batch_size=self.write_chunk_size,
+            previous_archives=self._get_archives(archives_key),
+        )
+        try:
+            yield manifest
+        finally:
+            self._recording = None
+        manifest.flush()
+        self._set_manifest(key, manifest.entries)
+        self._set_manifest(archives_key, manifest.archives)
+        logger.info(
+            "Parsed %d and reused %d %s files",
+            manifest.nb_parsed,
+            manifest.nb_reused,
+            stage,
+        )
 
-            for texte_ref in textes.values():
-                self.set_opendata_texte_ref(texte_ref)
+    def _get_manifest(self, key: str) -> Dict[str, ManifestEntry]:
+        raw_entries = self.connection.hgetall(self._read_prefix() + key)
+        return {
+            filename.decode("utf-8"): ManifestEntry.loads(raw_entry)
+            for filename, raw_entry in raw_entries.items()
+        }
+
+    def _get_archives(self, key: str) -> Dict[str, ArchiveEntry]:
+        raw_entries = self.connection.hgetall(self._read_prefix() + key)
+        return {
+            url.decode("utf-8"): ArchiveEntry.loads(raw_entry)
+            for url, raw_entry in raw_entries.items()
+        }
+
+    def _set_manifest(
+        self, key: str, entries: Mapping[str, Union[ManifestEntry, ArchiveEntry]]
+    ) -> None:
+        prefixed_key = self._prefixed_for_write(key)
+        writer = self._writer()
+        writer.delete(prefixed_key)
+        items = [(filename, entry.dumps()) for filename, entry in entries.items()]
+        for index in range(0, len(items), self.write_chunk_size):
+            writer.hset(
+                prefixed_key, mapping=dict(items[index : index + self.write_chunk_size])
+            )
+            self._count_write()
+
+    def _copy_unchanged(self, entries: List[Tuple[str, ManifestEntry]]) -> Set[str]:
+        """
+        Copy data from unchanged files, returning those we could not fully copy
+        """
+        self._recording = None
+        read_prefix = self._read_prefix()
+        if self._write_prefix == read_prefix:  # not versioned: nothing to do
+            return set()
+        keys = [key for _, entry in entries for key in entry.keys]
+        values = (
+            dict(zip(keys, self.connection.mget([read_prefix + k for k in keys])))
+            if keys
+            else {}
+        )
+        incomplete = set()
+        for filename, entry in entries:
+            if any(values[key] is None for key in entry.keys):
+                logger.warning("Missing data from %s, will parse it again", filename)
+                incomplete.add(filename)
+            for key in entry.keys:
+                value = values[key]
+                if value is not None:
+                    self._set_raw_data(key, value)
+            for index_key, member in entry.indexes:
+                self._add_to_index(index_key, member)
+        return incomplete
 
     def _load_scraping_senat_dossiers(self) -> None:
         dossier_refs = get_dossier_refs_senat()
-        with Lock(self.connection, "data"):
-            self._clear_scraping_senat_dossiers()
+        with self._data_lock(), self._bulk_writes("dossiers Sénat"):
+            if not self.versioned:  # a new generation starts out empty
+                self._clear_scraping_senat_dossiers()
             for dossier_ref in dossier_refs.values():
                 self.set_senat_scraping_dossier_ref(dossier_ref)
 
     def _clear_scraping_senat_dossiers(self) -> None:
+        self.connection.delete(
+            self._prefixed_for_write(self._key_for_senat_scraping_dossiers_index())
+        )
         for pattern in [
             self._key_for_senat_scraping_dossier("*"),
             self._key_for_senat_scraping_dossier_by_an_url("*"),
         ]:
-            keys = self.connection.keys(pattern)
-            if keys:
-                self.connection.delete(*keys)
+            self._delete_matching(self._prefixed_for_write(pattern))
 
     def set_senat_scraping_dossier_ref(
         self, dossier_ref: DossierRef, ttl: int = 2 * 3600
@@ -108,9 +777,9 @@ class DataRepository(Repository):
 
     def _load_senateurs_groupes(self) -> None:
         senateurs_by_matricule = fetch_and_parse_senateurs()
-        with Lock(self.connection, "data"):
+        with self._data_lock(), self._bulk_writes("sénateurs"):
             for matricule, senateur in senateurs_by_matricule.items():
-                self._set_pickled_data(self._key_for_senateur(matricule), senateur)
+                self._set_encoded_data(self._key_for_senateur(matricule), senateur)
 
     def set_opendata_dossier_ref(self, dossier_ref: DossierRef) -> None:
         self.set_opendata_dossier_ref_by_uid(dossier_ref)
@@ -119,38 +788,45 @@ class DataRepository(Repository):
 
     def set_opendata_dossier_ref_by_uid(self, dossier_ref: DossierRef) -> None:
         key = self._key_for_opendata_dossier(dossier_ref.uid)
-        self._set_pickled_data(key, dossier_ref)
+        self._set_encoded_data(key, dossier_ref)
+        self._add_to_index(self._key_for_opendata_dossiers_index(), dossier_ref.uid)
 
     def set_opendata_dossier_ref_by_an_url(self, dossier_ref: DossierRef) -> None:
         an_url = dossier_ref.normalized_an_url
         if an_url:
             key = self._key_for_opendata_dossier_by_an_url(an_url)
-            self._set_pickled_data(key, dossier_ref)
+            self._set_raw_data(key, dossier_ref.uid)
 
     def set_opendata_dossier_ref_by_senat_url(self, dossier_ref: DossierRef) -> None:
         senat_url = dossier_ref.normalized_senat_url
         if senat_url:
             key = self._key_for_opendata_dossier_by_senat_url(senat_url)
-            self._set_pickled_data(key, dossier_ref)
+            self._set_raw_data(key, dossier_ref.uid)
 
     def set_opendata_texte_ref(self, texte_ref: TexteRef) -> None:
         key = self._key_for_opendata_texte(texte_ref.uid)
-        self._set_pickled_data(key, texte_ref)
+        self._set_encoded_data(key, texte_ref)
+        self._add_to_index(self._key_for_opendata_textes_index(), texte_ref.uid)
 
     def set_senat_scraping_dossier_ref_ref_by_id(
         self, dossier_ref: DossierRef, ttl: int
     ) -> None:
         if dossier_ref.senat_dossier_id:
             key = self._key_for_senat_scraping_dossier(dossier_ref.senat_dossier_id)
-            self._set_pickled_data(key, dossier_ref, ttl)
+            self._set_encoded_data(key, dossier_ref, ttl)
+            self._add_to_index(
+                self._key_for_senat_scraping_dossiers_index(),
+                dossier_ref.senat_dossier_id,
+                ttl,
+            )
 
     def set_senat_scraping_dossier_ref_ref_by_an_url(
         self, dossier_ref: DossierRef, ttl: int
     ) -> None:
         an_url = dossier_ref.normalized_an_url
-        if an_url:
+        if an_url and dossier_ref.senat_dossier_id:
             key = self._key_for_senat_scraping_dossier_by_an_url(an_url)
-            self._set_pickled_data(key, dossier_ref, ttl)
+            self._set_raw_data(key, dossier_ref.senat_dossier_id, ttl)
 
     @staticmethod
     def _key_for_opendata_dossier(uid: str) -> str:
@@ -168,6 +844,22 @@ class DataRepository(Repository):
     def _key_for_opendata_texte(uid: str) -> str:
         return f"an.opendata.textes.{uid}"
 
+    @staticmethod
+    def _key_for_opendata_dossiers_index() -> str:
+        return "an.opendata.index.dossiers"
+
+    @staticmethod
+    def _key_for_opendata_textes_index() -> str:
+        return "an.opendata.index.textes"
+
+    @classmethod
+    def _key_for_manifest(cls, stage: str) -> str:
+        return f"an.opendata.manifest.v{cls.MANIFEST_VERSION}.{stage}"
+
+    @classmethod
+    def _key_for_archives(cls, stage: str) -> str:
+        return f"an.opendata.archives.v{cls.MANIFEST_VERSION}.{stage}"
+
     @staticmethod
     def _key_for_opendata_organe(uid: str) -> str:
         return f"an.opendata.organes.{uid}"
@@ -184,6 +876,10 @@ class DataRepository(Repository):
     def _key_for_senat_scraping_dossier_by_an_url(an_url: str) -> str:
         return f"senat.scraping.dossiers_by_an_url.{an_url}"
 
+    @staticmethod
+    def _key_for_senat_scraping_dossiers_index() -> str:
+        return "senat.scraping.index.dossiers"
+
     @staticmethod
     def _key_for_senateur(matricule: str) -> str:
         return f"senateur.{matricule}"
@@ -191,60 +887,68 @@ class DataRepository(Repository):
     @needs_init
     def get_opendata_organe(self, uid: str) -> dict:
         key = self._key_for_opendata_organe(uid)
-        organe: dict = self._get_json_data(key)
+        organe: dict = self._get_cached_data(key, self._get_json_data)
         return organe
 
     @needs_init
     def get_opendata_acteur(self, uid: str) -> dict:
         key = self._key_for_opendata_acteur(uid)
-        acteur: dict = self._get_json_data(key)
+        acteur: dict = self._get_cached_data(key, self._get_json_data)
         return acteur
 
     @needs_init
     def get_opendata_dossier_ref(self, uid: str) -> DossierRef:
         key = self._key_for_opendata_dossier(uid)
-        dossier_ref: DossierRef = self._get_pickled_data(key)
+        dossier_ref: DossierRef = self._get_encoded_data(key)
         return dossier_ref
 
     @needs_init
     def get_opendata_dossier_ref_by_an_url(self, an_url: str) -> Optional[DossierRef]:
         key = self._key_for_opendata_dossier_by_an_url(an_url)
-        dossier_ref: DossierRef = self._get_pickled_data(key)
+        dossier_ref: Optional[DossierRef] = self._get_pointed_data(
+            key, self._key_for_opendata_dossier
+        )
         return dossier_ref
 
     @needs_init
     def get_opendata_dossier_ref_by_senat_url(
         self, senat_url: str
     ) -> Optional[DossierRef]:
-        key = self._key_for_opendata_dossier(senat_url)
-        dossier_ref: DossierRef = self._get_pickled_data(key)
+        key = self._key_for_opendata_dossier_by_senat_url(senat_url)
+        dossier_ref: Optional[DossierRef] = self._get_pointed_data(
+            key, self._key_for_opendata_dossier
+        )
         return dossier_ref
 
     @needs_init
     def list_opendata_dossiers(self) -> List[str]:
-        keys = self.connection.keys(self._key_for_opendata_dossier("*"))
-        return [key.decode("utf-8").split(".")[-1] for key in keys]
+        return self._get_index(
+            self._key_for_opendata_dossiers_index(), self._key_for_opendata_dossier("*")
+        )
 
     @needs_init
     def list_opendata_textes(self) -> List[str]:
-        keys = self.connection.keys(self._key_for_opendata_texte("*"))
-        return [key.decode("utf-8").split(".")[-1] for key in keys]
+        return self._get_index(
+            self._key_for_opendata_textes_index(), self._key_for_opendata_texte("*")
+        )
 
     @needs_init
     def list_senat_scraping_dossiers(self) -> List[str]:
-        keys = self.connection.keys(self._key_for_senat_scraping_dossier("*"))
-        return [key.decode("utf-8").split(".")[-1] for key in keys]
+        return self._get_index(
+            self._key_for_senat_scraping_dossiers_index(),
+            self._key_for_senat_scraping_dossier("*"),
+        )
 
     @needs_init
     def get_opendata_texte(self, uid: str) -> TexteRef:
         key = self._key_for_opendata_texte(uid)
-        texte_ref: TexteRef = self._get_pickled_data(key)
+        texte_ref: TexteRef = self._get_encoded_data(key)
         return texte_ref
 
     @needs_init
     def get_senat_scraping_dossier_ref(self, uid: str) -> DossierRef:
         key = self._key_for_senat_scraping_dossier(uid)
-        dossier_ref: DossierRef = self._get_pickled_data(key)
+        dossier_ref: DossierRef = self._get_encoded_data(key)
         return dossier_ref
 
     @needs_init
@@ -252,32 +956,75 @@ class DataRepository(Repository):
         self, an_url: str
     ) -> Optional[DossierRef]:
         key = self._key_for_senat_scraping_dossier_by_an_url(an_url)
-        dossier_ref: DossierRef = self._get_pickled_data(key)
+        dossier_ref: Optional[DossierRef] = self._get_pointed_data(
+            key, self._key_for_senat_scraping_dossier
+        )
         return dossier_ref
 
     @needs_init
     def get_senateur(self, matricule: str) -> Senateur:
         key = self._key_for_senateur(matricule)
-        senateur: Senateur = self._get_pickled_data(key)
+        senateur: Senateur = self._get_cached_data(key, self._get_encoded_data)
         return senateur
 
     @needs_init
-    def _set_pickled_data(
+    def get_senateurs(self, matricules: Iterable[str]) -> Dict[str, Senateur]:
+        """
+        Get several sénateurs in a single round-trip (missing ones are left out)
+        """
+        keys = {
+            self._key_for_senateur(matricule): matricule for matricule in matricules
+        }
+        generation = self.get_current_generation()
+        values = self.cache.get_many(generation, keys, self._get_many_encoded_data)
+        return {keys[key]: senateur for key, senateur in values.items() if senateur}
+
+    def _get_cached_data(self, key: str, get_data: Callable[[str], Any]) -> Any:
+        generation = self.get_current_generation()
+        return self.cache.get(generation, key, lambda: get_data(key))
+
+    @needs_init
+    def _set_encoded_data(
         self, key: str, value: Any, ttl: Optional[int] = None
     ) -> None:
-        self.connection.set(key, pickle.dumps(value), ex=ttl)
+        self._set_raw_data(key, codec.encode(value), ttl)
+
+    @needs_init
+    def _get_encoded_data(self, key: str) -> Any:
+        return self._decode(self._get_raw_data(key))
+
+    @needs_init
+    def _get_many_encoded_data(self, keys: List[str]) -> List[Any]:
+        return [self._decode(raw_bytes) for raw_bytes in self._get_many_raw_data(keys)]
 
     @needs_init
-    def _get_pickled_data(self, key: str) -> Any:
+    def _get_pointed_data(self, key: str, key_for_uid: Callable[[str], str]) -> Any:
+        """
+        Secondary indexes only store the UID of the value they point to
+        """
         raw_bytes = self._get_raw_data(key)
         if raw_bytes is None:
             return None
-        unpickler = BackwardsCompatibleUnpickler(BytesIO(raw_bytes))
-        return unpickler.load()
+        if self._is_pickle(raw_bytes):  # full copy, written by an older version
+            return self._decode(raw_bytes)
+        return self._get_encoded_data(key_for_uid(raw_bytes.decode("utf-8")))
+
+    @classmethod
+    def _decode(cls, raw_bytes: Optional[bytes]) -> Any:
+        if raw_bytes is None:
+            return None
+        if cls._is_pickle(raw_bytes):
+            unpickler = BackwardsCompatibleUnpickler(BytesIO(raw_bytes))
+            return unpickler.load()
+        return codec.decode(raw_bytes)
+
+    @staticmethod
+    def _is_pickle(raw_bytes: bytes) -> bool:
+        return raw_bytes.startswith(PICKLE_PROTO)
 
     @needs_init
     def _set_json_data(self, key: str, value: Any) -> None:
-        self.connection.set(key, json.dumps(value))
+        self._set_raw_data(key, json.dumps(value))
 
     @needs_init
     def _get_json_data(self, key: str) -> Any:
@@ -286,10 +1033,69 @@ class DataRepository(Repository):
             return None
         return json.loads(raw_bytes)
 
+    def _set_raw_data(
+        self, key: str, value: Union[bytes, str], ttl: Optional[int] = None
+    ) -> None:
+        self._writer().set(self._prefixed_for_write(key), value, ex=ttl)
+        self._count_write()
+        if self._recording is not None:
+            self._recording.keys.append(key)
+
+    def _add_to_index(self, key: str, member: str, ttl: Optional[int] = None) -> None:
+        prefixed_key = self._prefixed_for_write(key)
+        writer = self._writer()
+        writer.sadd(prefixed_key, member)
+        if ttl is not None:
+            writer.expire(prefixed_key, ttl)
+        self._count_write()
+        if self._recording is not None:
+            self._recording.indexes.append((key, member))
+
+    def _get_index(self, key: str, pattern: str) -> List[str]:
+        """
+        Data loaded before the index sets existed is listed with a (slower) scan
+        of the keys matching `pattern`, until it is loaded again or converted
+        """
+        prefix = self._read_prefix()
+        members = self.connection.smembers(prefix + key)
+        if members:
+            return [member.decode("utf-8") for member in members]
+        logger.warning("Missing index %r, scanning keys instead", key)
+        start = len(prefix) + len(pattern) - 1
+        return [
+            prefixed_key.decode("utf-8")[start:]
+            for prefixed_key in self.connection.scan_iter(
+                match=prefix + pattern, count=1000
+            )
+        ]
+
+    def _writer(self) -> Union[Redis, Pipeline]:
+        if self._pipeline is not None:
+            return self._pipeline
+        return self.connection
+
+    def _count_write(self) -> None:
+        if self._pipeline is None:
+            return
+        self._nb_pending_writes += 1
+        if self._deferred_writes:
+            return
+        if self._nb_pending_writes % self.write_chunk_size == 0:
+            self._flush_pipeline()
+
     @needs_init
     def _get_raw_data(self, key: str) -> Optional[bytes]:
-        with Lock(self.connection, "data"):
-            response: Optional[bytes] = self.connection.get(key)
+        with self._data_lock():
+            response: Optional[bytes] = self.connection.get(self._read_prefix() + key)
+            return response
+
+    @needs_init
+    def _get_many_raw_data(self, keys: List[str]) -> List[Optional[bytes]]:
+        read_prefix = self._read_prefix()
+        with self._data_lock():
+            response: List[Optional[bytes]] = self.connection.mget(
+                [read_prefix + key for key in keys]
+            )
             return response
 
 
@@ -1,16 +1,18 @@
+import hashlib
+import json
 import logging
 from abc import ABC, abstractmethod
-from datetime import date
-from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set
-
-from zam_repondeur.models import (
-    Amendement,
-    Article,
-    Chambre,
-    DBSession,
-    Lecture,
-    get_one_or_create,
-)
+from datetime import date, datetime
+from operator import attrgetter
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set
+
+from more_itertools import chunked
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.exc import NoResultFound, StaleDataError
+from zope.sqlalchemy import mark_changed
+
+from zam_repondeur.models import Amendement, Article, Chambre, DBSession, Lecture
+from zam_repondeur.models.amendement import AmendementLocation, AmendementUserContent
 from zam_repondeur.models.division import SubDiv
 from zam_repondeur.models.events.amendement import (
     AmendementIrrecevable,
@@ -20,10 +22,37 @@ from zam_repondeur.models.events.amendement import (
     CorpsAmendementModifie,
     ExposeAmendementModifie,
 )
+from zam_repondeur.services.fetch.http import Validators
+from zam_repondeur.utils import Timer
 
 logger = logging.getLogger(__name__)
 
 
+# Below that, creating amendements one by one with the ORM is fast enough
+BULK_CREATE_THRESHOLD = 100
+
+# Number of rows per INSERT statement
+BULK_INSERT_CHUNK_SIZE = 1000
+
+# Number of times a change is applied again when the amendement was changed
+# concurrently (e.g. by a user) before we give up
+MAX_CONFLICT_RETRIES = 3
+
+# To be bumped when amendements are derived differently from the same source data,
+# so that they are all compared field by field again
+FINGERPRINT_VERSION = 1
+
+
+def fingerprint(*values: Any) -> str:
+    """
+    Hash of the source data of an amendement (must be JSON serializable)
+    """
+    normalized = json.dumps(
+        [FINGERPRINT_VERSION, *values], sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
 class Source:
     @staticmethod
     def update_attributes(amendement: Amendement, **values: Any) -> None:
@@ -115,6 +144,10 @@ class CollectedChanges(NamedTuple):
     unchanged: List[int]
     errored: Set[int]
     next_start_index: Optional[int]
+    # Validators of each source URL, by amendement number
+    # (to be stored when changes are committed)
+    validators: Dict[int, Dict[str, Validators]]
+    fingerprints: List["RecordFingerprint"]  # of unchanged amendements
 
     @classmethod
     def create(
@@ -126,6 +159,8 @@ class CollectedChanges(NamedTuple):
         unchanged: Optional[List[int]] = None,
         errored: Optional[Set[int]] = None,
         next_start_index: Optional[int] = None,
+        validators: Optional[Dict[int, Dict[str, Validators]]] = None,
+        fingerprints: Optional[List["RecordFingerprint"]] = None,
     ) -> "CollectedChanges":
         if position_changes is None:
             position_changes = {}
@@ -137,6 +172,10 @@ class CollectedChanges(NamedTuple):
             unchanged = []
         if errored is None:
             errored = set()
+        if validators is None:
+            validators = {}
+        if fingerprints is None:
+            fingerprints = []
         return cls(
             derouleur_fetch_success,
             position_changes,
@@ -145,10 +184,14 @@ class CollectedChanges(NamedTuple):
             unchanged,
             errored,
             next_start_index,
+            validators,
+            fingerprints,
         )
 
 
 class Action(ABC):
+    num: int
+
     @abstractmethod
     def apply(self, lecture: Lecture) -> FetchResult:
         pass
@@ -173,6 +216,8 @@ class CreateOrUpdateAmendement(Action):
         expose: str,
         sort: str,
         date_depot: Optional[date],
+        alinea: Optional[str] = None,
+        fingerprint: Optional[str] = None,
     ):
         self.subdiv = subdiv
         self.parent_num_raw = parent_num_raw
@@ -190,31 +235,60 @@ class CreateOrUpdateAmendement(Action):
         self.expose = expose
         self.sort = sort
         self.date_depot = date_depot
+        self.alinea = alinea
+        self.fingerprint = fingerprint
 
     def _get_article(self, lecture: Lecture) -> Article:
         article: Article
-        created: bool
-        article, created = get_one_or_create(
-            Article,
-            lecture=lecture,
-            type=self.subdiv.type_,
-            num=self.subdiv.num,
-            mult=self.subdiv.mult,
-            pos=self.subdiv.pos,
-        )
+        article, created = lecture.find_or_create_article(self.subdiv)
         return article
 
-    def _get_parent(self, lecture: Lecture, article: Article) -> Optional[Amendement]:
+    @property
+    def parent_num(self) -> int:
         parent_num, parent_rectif = Amendement.parse_num(self.parent_num_raw)
+        return parent_num
+
+    def _get_parent(self, lecture: Lecture, article: Article) -> Optional[Amendement]:
+        parent_num = self.parent_num
         if not parent_num:
             return None
         # The parent amendement must have been created before this one
         # (which should be the case as long as we process them in order)
-        parent: Amendement = DBSession.query(Amendement).filter_by(
-            lecture=lecture, num=parent_num,
-        ).one()
+        parent = lecture.find_amendement(parent_num)
+        if parent is None:
+            raise NoResultFound(f"Parent amendement {parent_num} not found")
         return parent
 
+    def _update(self, lecture: Lecture, amendement: Amendement) -> None:
+        article = self._get_article(lecture)
+        parent = self._get_parent(lecture, article)
+
+        if amendement.location.batch and amendement.article.pk != article.pk:
+            BatchUnset.create(amendement=amendement, request=None)
+
+        Source.update_rectif(amendement, self.rectif)
+        Source.update_corps(amendement, self.corps)
+        Source.update_expose(amendement, self.expose)
+        Source.update_sort(amendement, self.sort)
+        Source.update_attributes(
+            amendement,
+            article=article,
+            parent=parent,
+            position=self.position,
+            tri_amendement=self.tri_amendement,
+            id_discussion_commune=self.id_discussion_commune,
+            id_identique=self.id_identique,
+            matricule=self.matricule,
+            groupe=self.groupe,
+            auteur=self.auteur,
+            mission_titre=self.mission_titre,
+            mission_titre_court=self.mission_titre_court,
+            date_depot=self.date_depot,
+            source_fingerprint=self.fingerprint,
+        )
+        if self.alinea is not None:  # not provided by all sources
+            Source.update_attributes(amendement, alinea=self.alinea)
+
 
 class CreateAmendement(CreateOrUpdateAmendement):
     def __init__(self, num: int, **kwargs: Any):
@@ -247,10 +321,46 @@ class CreateAmendement(CreateOrUpdateAmendement):
             expose=self.expose,
             sort=self.sort,
             date_depot=self.date_depot,
+            alinea=self.alinea,
+            source_fingerprint=self.fingerprint,
         )
 
         return FetchResult.create(fetched={self.num}, created={self.num})
 
+    def values(
+        self,
+        lecture: Lecture,
+        article: Article,
+        parent_pk: Optional[int],
+        created_at: datetime,
+    ) -> Dict[str, Any]:
+        """
+        Column values for a bulk insert (see `Amendement.create()`)
+        """
+        return {
+            "created_at": created_at,
+            "lecture_pk": lecture.pk,
+            "article_pk": article.pk,
+            "parent_pk": parent_pk,
+            "position": self.position,
+            "num": self.num,
+            "rectif": self.rectif,
+            "tri_amendement": self.tri_amendement,
+            "id_discussion_commune": self.id_discussion_commune,
+            "id_identique": self.id_identique,
+            "matricule": self.matricule,
+            "groupe": self.groupe,
+            "auteur": self.auteur,
+            "mission_titre": self.mission_titre,
+            "mission_titre_court": self.mission_titre_court,
+            "corps": self.corps,
+            "expose": self.expose,
+            "sort": self.sort,
+            "date_depot": self.date_depot,
+            "alinea": self.alinea,
+            "source_fingerprint": self.fingerprint,
+        }
+
 
 class UpdateAmendement(CreateOrUpdateAmendement):
     def __init__(self, amendement_num: int, **kwargs: Any):
@@ -260,43 +370,253 @@ class UpdateAmendement(CreateOrUpdateAmendement):
     def __repr__(self) -> str:
         return f"<UpdateAmendement(num={self.amendement_num})>"
 
+    @property
+    def num(self) -> int:  # type: ignore
+        return self.amendement_num
+
     def apply(self, lecture: Lecture) -> FetchResult:
         amendement = lecture.find_amendement(self.amendement_num)
         if amendement is None:
             return FetchResult.create(errored={self.amendement_num})
 
-        article = self._get_article(lecture)
-        parent = self._get_parent(lecture, article)
+        self._update(lecture, amendement)
 
-        if amendement.location.batch and amendement.article.pk != article.pk:
-            BatchUnset.create(amendement=amendement, request=None)
+        return FetchResult.create(fetched={self.amendement_num})
 
-        Source.update_rectif(amendement, self.rectif)
-        Source.update_corps(amendement, self.corps)
-        Source.update_expose(amendement, self.expose)
-        Source.update_sort(amendement, self.sort)
-        Source.update_attributes(
-            amendement,
-            article=article,
-            parent=parent,
-            position=self.position,
-            tri_amendement=self.tri_amendement,
-            id_discussion_commune=self.id_discussion_commune,
-            id_identique=self.id_identique,
-            matricule=self.matricule,
-            groupe=self.groupe,
-            auteur=self.auteur,
-            mission_titre=self.mission_titre,
-            mission_titre_court=self.mission_titre_court,
-            date_depot=self.date_depot,
+
+class RecordFingerprint(Action):
+    """
+    The amendement is unchanged, but we did not know it from its fingerprint
+    (e.g. first fetch since fingerprints exist, or only irrelevant data changed)
+    """
+
+    def __init__(self, num: int, fingerprint: str):
+        self.num = num
+        self.fingerprint = fingerprint
+
+    def __repr__(self) -> str:
+        return f"<RecordFingerprint(num={self.num})>"
+
+    def apply(self, lecture: Lecture) -> FetchResult:
+        amendement = lecture.find_amendement(self.num)
+        if amendement is None:
+            return FetchResult.create(errored={self.num})
+        amendement.source_fingerprint = self.fingerprint
+        return FetchResult.create(fetched={self.num})
+
+
+class ChangePosition(Action):
+    def __init__(self, num: int, position: Optional[int]):
+        self.num = num
+        self.position = position
+
+    def __repr__(self) -> str:
+        return f"<ChangePosition(num={self.num}, position={self.position})>"
+
+    def apply(self, lecture: Lecture) -> FetchResult:
+        amendement = lecture.find_amendement(self.num)
+        if amendement is not None and amendement.position != self.position:
+            amendement.position = self.position
+        return FetchResult.create()
+
+
+class ApplyStats:
+    """
+    Time spent flushing changes to existing amendements (all their INSERTs and
+    UPDATEs, including any wait for row locks held by other transactions), and
+    number of conflicts
+    """
+
+    def __init__(self) -> None:
+        self.flush_time = 0.0
+        self.conflicts = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"<ApplyStats(flush_time={self.flush_time:.3f}, "
+            f"conflicts={self.conflicts})>"
         )
 
-        return FetchResult.create(fetched={self.amendement_num})
+
+def apply_optimistically(
+    lecture: Lecture, actions: Sequence[Action], stats: ApplyStats
+) -> FetchResult:
+    """
+    Apply changes to existing amendements without locking them (nor the lecture)
+
+    Updates only succeed if amendements (and their locations, e.g. when put back on
+    the index) still have the version we loaded. If one of them was changed in the
+    meantime (e.g. transferred by a user), the changes are rolled back, then applied
+    again one by one on fresh data (at most MAX_CONFLICT_RETRIES times each).
+    """
+    if not actions:
+        return FetchResult.create()
+    try:
+        return _apply_in_savepoint(lecture, actions, stats)
+    except StaleDataError:
+        stats.conflicts += 1
+        logger.info("Conflict while applying %d changes, retrying", len(actions))
+
+    result = FetchResult.create()
+    for action in actions:
+        result += _apply_with_retries(lecture, action, stats)
+    return result
+
+
+def _apply_with_retries(
+    lecture: Lecture, action: Action, stats: ApplyStats
+) -> FetchResult:
+    for attempt in range(1, MAX_CONFLICT_RETRIES + 1):
+        try:
+            return _apply_in_savepoint(lecture, [action], stats)
+        except StaleDataError:
+            stats.conflicts += 1
+            logger.info("Conflict while applying %r (attempt %d)", action, attempt)
+    logger.error("Could not apply %r because of concurrent changes", action)
+    return FetchResult.create(errored={action.num})
+
+
+def _apply_in_savepoint(
+    lecture: Lecture, actions: Sequence[Action], stats: ApplyStats
+) -> FetchResult:
+    """
+    Objects changed in a savepoint that is rolled back are expired, so they will
+    be loaded again (with their new version) on next access
+    """
+    result = FetchResult.create()
+    with DBSession.begin_nested():
+        for action in actions:
+            result += action.apply(lecture)
+        with Timer() as timer:
+            DBSession.flush()
+        stats.flush_time += timer.elapsed()
+    return result
+
+
+def prepare_actions(lecture: Lecture, actions: List[CreateOrUpdateAmendement]) -> None:
+    """
+    Load (or create) what is needed to apply these actions in a handful of queries,
+    instead of a few queries for each of them
+    """
+    # Locations of the amendements to be updated
+    update_nums = [
+        action.amendement_num
+        for action in actions
+        if isinstance(action, UpdateAmendement)
+    ]
+    if update_nums:
+        DBSession.query(Amendement).filter(
+            Amendement.lecture_pk == lecture.pk, Amendement.num.in_(update_nums)
+        ).options(selectinload(Amendement.location)).all()
+
+    # Articles (missing ones are created in a single flush)
+    created = False
+    for action in actions:
+        article, created_ = lecture.find_or_create_article(action.subdiv)
+        created = created or created_
+    if created:
+        DBSession.flush()
+
+
+def create_amendements(
+    lecture: Lecture,
+    actions: List[CreateAmendement],
+    bulk_threshold: Optional[int] = BULK_CREATE_THRESHOLD,
+) -> FetchResult:
+    """
+    Create new amendements, in bulk if there are many of them (unless disabled)
+    """
+    # Create amendements in numerical order, because a "sous-amendement"
+    # must always be created after its parent
+    actions = sorted(actions, key=attrgetter("num"))
+    if bulk_threshold is not None and len(actions) >= bulk_threshold:
+        return _bulk_create_amendements(lecture, actions)
+
+    result = FetchResult.create()
+    for action in actions:
+        result += action.apply(lecture)
+    return result
+
+
+def _bulk_create_amendements(
+    lecture: Lecture, actions: List[CreateAmendement]
+) -> FetchResult:
+    """
+    Insert amendements with multi-row INSERT statements, in successive rounds so
+    that parents are always inserted before their "sous-amendements"
+
+    Their locations and user contents are then inserted the same way.
+    """
+    articles = {action.num: action._get_article(lecture) for action in actions}
+    DBSession.flush()  # we need the primary keys of articles and existing parents
+
+    pks: Dict[int, int] = {
+        amendement.num: amendement.pk for amendement in lecture.amendements
+    }
+    new_nums = {action.num for action in actions}
+    parent_nums = {action.parent_num for action in actions if action.parent_num}
+    missing = parent_nums - pks.keys() - new_nums
+    if missing:
+        raise NoResultFound(f"Parent amendements {sorted(missing)} not found")
+    existing_parents = [lecture.find_amendement(num) for num in parent_nums - new_nums]
+
+    amendements_table = Amendement.__table__
+    now = datetime.utcnow()
+    remaining = actions
+    while remaining:
+        ready = [
+            action
+            for action in remaining
+            if not action.parent_num or action.parent_num in pks
+        ]
+        if not ready:
+            raise ValueError("Circular references between amendements and parents")
+        for chunk in chunked(ready, BULK_INSERT_CHUNK_SIZE):
+            rows = DBSession.execute(
+                amendements_table.insert()
+                .values(
+                    [
+                        action.values(
+                            lecture,
+                            article=articles[action.num],
+                            parent_pk=pks.get(action.parent_num),
+                            created_at=now,
+                        )
+                        for action in chunk
+                    ]
+                )
+                .returning(amendements_table.c.num, amendements_table.c.pk)
+            )
+            pks.update((num, pk) for num, pk in rows)
+        remaining = [action for action in remaining if action.num not in pks]
+
+    new_pks = [pks[num] for num in sorted(new_nums)]
+    for table in (AmendementLocation.__table__, AmendementUserContent.__table__):
+        for chunk in chunked(new_pks, BULK_INSERT_CHUNK_SIZE):
+            DBSession.execute(
+                table.insert().values([{"amendement_pk": pk} for pk in chunk])
+            )
+    mark_changed(DBSession())
+
+    # The session does not know about these new rows, so the collections that
+    # should include them will need to be loaded again
+    for article in lecture.articles:
+        DBSession.expire(article, ["amendements"])
+    for parent in existing_parents:
+        DBSession.expire(parent, ["children"])
+    DBSession.expire(lecture, ["amendements", "nb_amendements"])
+
+    logger.info("Created %d amendements in bulk", len(new_pks))
+
+    return FetchResult.create(fetched=new_nums, created=new_nums)
 
 
 class RemoteSource(Source):
+    bulk_threshold: Optional[int] = BULK_CREATE_THRESHOLD
+
     def __init__(self, settings: Dict[str, Any], prefetching_enabled: bool = True):
         self.prefetching_enabled = prefetching_enabled
+        self.apply_stats = ApplyStats()  # of the last batch
 
     def prepare(self, lecture: Lecture) -> None:
         pass
@@ -311,7 +631,58 @@ class RemoteSource(Source):
         raise NotImplementedError()
 
     def apply_changes(self, lecture: Lecture, changes: CollectedChanges) -> FetchResult:
-        raise NotImplementedError()
+        self.apply_stats = ApplyStats()
+        result = FetchResult.create(
+            fetched=changes.unchanged,
+            errored=changes.errored,
+            next_start_index=changes.next_start_index,
+        )
+
+        # Build amendement -> position map
+        moved_amendements = {
+            amendement.num: changes.position_changes[amendement.num]
+            for amendement in lecture.amendements
+            if amendement.num in changes.position_changes
+        }
+
+        # Reset positions first, so that we never have two with the same position
+        # (which would trigger an integrity error due to the unique constraint)
+        result += apply_optimistically(
+            lecture,
+            [ChangePosition(num, None) for num in moved_amendements],
+            self.apply_stats,
+        )
+
+        # Articles and parents are then found without querying the database
+        # for each amendement
+        prepare_actions(lecture, [*changes.creates, *changes.updates])
+
+        result += create_amendements(
+            lecture, changes.creates, bulk_threshold=self.bulk_threshold
+        )
+
+        # Update amendements
+        result += apply_optimistically(
+            lecture, [*changes.updates, *changes.fingerprints], self.apply_stats
+        )
+
+        # Apply new amendement positions
+        result += apply_optimistically(
+            lecture,
+            [
+                ChangePosition(num, position)
+                for num, position in moved_amendements.items()
+            ],
+            self.apply_stats,
+        )
+
+        DBSession.flush()
+
+        # Was it the last batch?
+        if changes.next_start_index is None:
+            lecture.reset_fetch_progress()
+
+        return result
 
     @classmethod
     def get_remote_source_for_chambre(
@@ -2,37 +2,48 @@ import logging
 import math
 import re
 from collections import OrderedDict
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date
 from http import HTTPStatus
-from itertools import chain, count, islice
-from operator import attrgetter
-from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+from itertools import chain, count, islice, takewhile
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
 from urllib.parse import urljoin
 
+import transaction
 import xmltodict
 from more_itertools import first
+from requests import Response
 from requests.exceptions import ConnectionError as RequestsConnectionError
 
 from zam_repondeur.decorator import reify
 from zam_repondeur.models import Amendement, DBSession, Lecture
 from zam_repondeur.models.division import SubDiv
 from zam_repondeur.services.fetch.amendements import (
+    BULK_CREATE_THRESHOLD,
     Action,
     CollectedChanges,
     CreateAmendement,
     FetchResult,
+    RecordFingerprint,
     RemoteSource,
     UpdateAmendement,
+    fingerprint,
 )
 from zam_repondeur.services.fetch.dates import parse_french_date
 from zam_repondeur.services.fetch.division import parse_subdiv
-from zam_repondeur.services.fetch.exceptions import FetchError, NotFound
-from zam_repondeur.services.fetch.http import get_http_session
+from zam_repondeur.services.fetch.engine import RETRY_STATUSES, FetchEngine
+from zam_repondeur.services.fetch.exceptions import (
+    FetchError,
+    NotFound,
+    NotModified,
+    RateLimited,
+)
+from zam_repondeur.services.fetch.http import Validators, get_http_session
+from zam_repondeur.services.progress import repository as progress_repository
 from zam_repondeur.templating import render_template
 
 from ..missions import MissionRef
 from .division import parse_avant_apres
+from .parse import AMENDEMENT_FIELDS, parse_amendement
 
 logger = logging.getLogger(__name__)
 
@@ -60,6 +71,22 @@ BATCH_SIZE = 250
 # we can't try all possible numbers, so we'll stop after a string of 404s
 MAX_404 = 300
 
+# Discovery strategies for amendements published but not yet included in the list:
+# - "linear": try all numbers in turn, until we get MAX_404 consecutive 404s
+# - "probe": only try a few numbers at exponential distances from the highest known
+#   number, and fill the gaps once something is found there
+# Probing is not the default, because an amendement that only exists between two
+# probes is missed when none of them finds anything. Until that is solved, every
+# refresh keeps paying for the trailing 404s of the linear strategy.
+DISCOVERY_LINEAR = "linear"
+DISCOVERY_PROBE = "probe"
+
+# Parsers for amendement XML:
+# - "xmltodict": convert the whole document to nested dicts
+# - "lxml": only extract the fields we use (faster, see benchmarks/an_parser.py)
+PARSER_XMLTODICT = "xmltodict"
+PARSER_LXML = "lxml"
+
 
 class OrganeNotFound(Exception):
     def __init__(self, organe: str) -> None:
@@ -78,6 +105,35 @@ class ProgressBar:
         self.lecture.set_fetch_progress(progress, max(progress, self.total))
 
 
+class ANFetchContext:
+    """
+    What we know about the lecture for the duration of a fetch run
+
+    The discussion list is only fetched once, and the aggregates over the whole
+    lecture only computed once, so that each batch only pays for its own amendements.
+    """
+
+    def __init__(self, lecture: Lecture, derouleur: "ANDerouleurData") -> None:
+        self.derouleur = derouleur
+        self.prefixe = derouleur.prefixe  # needs the lecture, which may be expired
+        self.position_changes = derouleur.updated_amendement_positions()
+        max_num_in_liste = max(derouleur.numeros, default=0)
+        max_num_in_lecture = max((amdt.num for amdt in lecture.amendements), default=0)
+        self.max_num_seen = max(max_num_in_liste, max_num_in_lecture)
+        self.next_start_index: Optional[int] = 0
+
+    def take_position_changes(self) -> Dict[int, Optional[int]]:
+        """
+        Positions are all updated with the first batch, and amendements created
+        by the next ones already get their position from the list
+        """
+        position_changes, self.position_changes = self.position_changes, {}
+        return position_changes
+
+    def record_created(self, nums: Iterable[int]) -> None:
+        self.max_num_seen = max(self.max_num_seen, max(nums, default=0))
+
+
 class AssembleeNationale(RemoteSource):
     def __init__(self, settings: Dict[str, Any], prefetching_enabled: bool = True):
         super().__init__(settings=settings, prefetching_enabled=prefetching_enabled)
@@ -88,13 +144,32 @@ class AssembleeNationale(RemoteSource):
                 f"zam.fetch.an.max_404 ({self.max_404}) cannot be higher "
                 f"than zam.fetch.an.batch_size ({self.batch_size})"
             )
+        self.discovery = settings.get("zam.fetch.an.discovery", DISCOVERY_LINEAR)
+        if self.discovery not in {DISCOVERY_LINEAR, DISCOVERY_PROBE}:
+            raise ValueError(
+                f"Unknown zam.fetch.an.discovery strategy: {self.discovery!r}"
+            )
+        self.parser = settings.get("zam.fetch.an.parser", PARSER_XMLTODICT)
+        if self.parser not in {PARSER_XMLTODICT, PARSER_LXML}:
+            raise ValueError(f"Unknown zam.fetch.an.parser: {self.parser!r}")
+        self.bulk_threshold = int(
+            settings.get("zam.fetch.an.bulk_threshold", BULK_CREATE_THRESHOLD)
+        )
+        self.engine = FetchEngine.from_settings(settings, prefix="zam.fetch.an")
+        self._contexts: Dict[int, ANFetchContext] = {}
+
+    def prepare(self, lecture: Lecture) -> None:
+        try:
+            self._contexts[lecture.pk] = self._create_context(lecture)
+        except NotFound:
+            pass  # will be reported when collecting changes
 
     def fetch_amendement(
         self, lecture: Lecture, numero_prefixe: str, position: Optional[int]
     ) -> Tuple[Optional[Amendement], bool]:
 
         logger.info("Récupération de l'amendement %r", numero_prefixe)
-        amend_data = _retrieve_amendement(lecture, numero_prefixe)
+        amend_data = _retrieve_amendement(lecture, numero_prefixe, parser=self.parser)
         amendement, action = self.inspect_amendement(
             lecture=lecture,
             amend_data=amend_data,
@@ -115,15 +190,53 @@ class AssembleeNationale(RemoteSource):
         self, lecture: Lecture, start_index: int = 0
     ) -> CollectedChanges:
         try:
-            derouleur = fetch_discussion_list(lecture)
+            context = self._get_context(lecture, start_index)
         except NotFound:
             return CollectedChanges.create(derouleur_fetch_success=False)
 
+        collect = (
+            self._collect_changes_by_probing
+            if self.discovery == DISCOVERY_PROBE
+            else self._collect_changes_linearly
+        )
+        changes = collect(
+            lecture=lecture,
+            derouleur=context.derouleur,
+            position_changes=context.take_position_changes(),
+            max_num_seen=context.max_num_seen,
+            start_index=start_index,
+        )
+
+        context.next_start_index = changes.next_start_index
+        if changes.next_start_index is None:
+            del self._contexts[lecture.pk]  # last batch
+
+        return changes
+
+    def _get_context(self, lecture: Lecture, start_index: int) -> ANFetchContext:
+        """
+        The context created when preparing the fetch is reused for all batches,
+        unless we're starting over
+        """
+        context = self._contexts.get(lecture.pk)
+        if context is None or context.next_start_index != start_index:
+            context = self._contexts[lecture.pk] = self._create_context(lecture)
+        return context
+
+    def _create_context(self, lecture: Lecture) -> ANFetchContext:
+        derouleur = fetch_discussion_list(lecture)
         if not derouleur.items:
             logger.warning("Empty amendement list for %r", lecture)
+        return ANFetchContext(lecture, derouleur)
 
-        position_changes = derouleur.updated_amendement_positions()
-
+    def _collect_changes_linearly(
+        self,
+        lecture: Lecture,
+        derouleur: "ANDerouleurData",
+        position_changes: Dict[int, Optional[int]],
+        max_num_seen: int,
+        start_index: int,
+    ) -> CollectedChanges:
         numeros_prefixes: List[str] = list(
             islice(
                 self._amendements_to_collect(derouleur),
@@ -132,17 +245,21 @@ class AssembleeNationale(RemoteSource):
             )
         )
 
-        max_num_in_liste = max(derouleur.numeros, default=0)
-        max_num_in_lecture = max((amdt.num for amdt in lecture.amendements), default=0)
-        max_num_seen = max(max_num_in_liste, max_num_in_lecture)
-
         progress_bar = ProgressBar(
             lecture=lecture,
             start_index=start_index,
             total=round_up(max_num_seen + self.max_404, self.batch_size),
         )
 
-        creates, updates, unchanged, errored, not_found = self._collect_amendements(
+        (
+            creates,
+            updates,
+            unchanged,
+            errored,
+            not_found,
+            validators,
+            fingerprints,
+        ) = self._collect_amendements(
             lecture=lecture,
             derouleur=derouleur,
             numeros_prefixes=numeros_prefixes,
@@ -172,8 +289,110 @@ class AssembleeNationale(RemoteSource):
             unchanged=unchanged,
             errored=errored,
             next_start_index=next_start_index,
+            validators=validators,
+            fingerprints=fingerprints,
         )
 
+    def _collect_changes_by_probing(
+        self,
+        lecture: Lecture,
+        derouleur: "ANDerouleurData",
+        position_changes: Dict[int, Optional[int]],
+        max_num_seen: int,
+        start_index: int,
+    ) -> CollectedChanges:
+        """
+        Collect all numbers up to the highest one we know of, then only probe a
+        few numbers beyond it
+
+        When a probe finds something, it becomes the new high-water mark of the
+        lecture, and the numbers in between are collected with the next batch.
+        """
+        high_water_mark = max(max_num_seen, lecture.get_fetch_high_water_mark())
+        known = list(self._known_amendements(derouleur, high_water_mark))
+        numeros_prefixes = known[start_index : start_index + self.batch_size]
+
+        last_batch = start_index + self.batch_size >= len(known)
+        offsets = self._probe_offsets()
+        probes = (
+            [derouleur.add_prefixe(high_water_mark + offset) for offset in offsets]
+            if last_batch
+            else []
+        )
+
+        progress_bar = ProgressBar(
+            lecture=lecture, start_index=start_index, total=len(known) + len(offsets)
+        )
+
+        (
+            creates,
+            updates,
+            unchanged,
+            errored,
+            not_found,
+            validators,
+            fingerprints,
+        ) = self._collect_amendements(
+            lecture=lecture,
+            derouleur=derouleur,
+            numeros_prefixes=numeros_prefixes + probes,
+            progress_bar=progress_bar,
+        )
+
+        next_start_index: Optional[int]
+        if not last_batch:
+            next_start_index = start_index + self.batch_size
+        else:
+            logger.info(
+                "Probed %d numbers after %d instead of %d (%d requests saved)",
+                len(probes),
+                high_water_mark,
+                self.max_404,
+                self.max_404 - len(probes),
+            )
+            # Only trust probes that were retrieved successfully: after an error
+            # (e.g. a timeout) we don't know if there is something there or not
+            found = (
+                {derouleur.remove_prefixe(probe) for probe in probes}
+                - not_found
+                - errored
+            )
+            if found:
+                lecture.set_fetch_high_water_mark(max(found))
+                next_start_index = len(known)
+            else:
+                next_start_index = None
+
+        return CollectedChanges.create(
+            position_changes=position_changes,
+            creates=creates,
+            updates=updates,
+            unchanged=unchanged,
+            errored=errored,
+            next_start_index=next_start_index,
+            validators=validators,
+            fingerprints=fingerprints,
+        )
+
+    def _known_amendements(
+        self, derouleur: "ANDerouleurData", high_water_mark: int
+    ) -> Iterator[str]:
+        listed = self._listed_amendements(derouleur)
+        unlisted = takewhile(
+            lambda numero_prefixe: (
+                derouleur.remove_prefixe(numero_prefixe) <= high_water_mark
+            ),
+            self._unlisted_amendements(derouleur),
+        )
+        return chain(listed, unlisted)
+
+    def _probe_offsets(self) -> List[int]:
+        """
+        Distances from the highest known number: 1, 2, 4, 8... up to max_404
+        """
+        powers_of_two = (2 ** n for n in count())
+        return [*takewhile(lambda n: n < self.max_404, powers_of_two), self.max_404]
+
     def _amendements_to_collect(self, derouleur: "ANDerouleurData") -> Iterator[str]:
         listed = self._listed_amendements(derouleur)
         unlisted = self._unlisted_amendements(derouleur)
@@ -205,35 +424,47 @@ class AssembleeNationale(RemoteSource):
         numeros_prefixes: List[str],
         progress_bar: ProgressBar,
     ) -> Tuple[
-        List[CreateAmendement], List[UpdateAmendement], List[int], Set[int], Set[int]
+        List[CreateAmendement],
+        List[UpdateAmendement],
+        List[int],
+        Set[int],
+        Set[int],
+        Dict[int, Dict[str, Validators]],
+        List[RecordFingerprint],
     ]:
         creates: List[CreateAmendement] = []
         updates: List[UpdateAmendement] = []
         unchanged: List[int] = []
         errored: Set[int] = set()
         not_found: Set[int] = set()
+        validators: Dict[int, Dict[str, Validators]] = {}
+        fingerprints: List[RecordFingerprint] = []
+        nb_not_modified = 0
+
+        urls_to_try = {
+            numero_prefixe: _urls_to_try(lecture, numero_prefixe)
+            for numero_prefixe in numeros_prefixes
+        }
+        revalidate = self._validators_to_revalidate(
+            lecture, derouleur, numeros_prefixes, urls_to_try
+        )
 
-        # Dispatch network requests to a thread pool
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            futures = [
-                executor.submit(
-                    _retrieve_amendement_data_from_first_working_url,
-                    _urls_to_try(lecture, numero_prefixe),
+        def retrieve(numero_prefixe: str) -> ANAmendementData:
+            urls = urls_to_try[numero_prefixe]
+            if numero_prefixe in revalidate:
+                return _retrieve_amendement_data_from_first_working_url(
+                    urls, validators=revalidate[numero_prefixe], parser=self.parser
                 )
-                for numero_prefixe in numeros_prefixes
-            ]
-            future_to_numero_prefixe = {
-                future: numero_prefixe
-                for future, numero_prefixe in zip(futures, numeros_prefixes)
-            }
+            return _retrieve_amendement_data_from_first_working_url(
+                urls, parser=self.parser
+            )
 
-        # Process amendement data as it is received (out of order)
-        offset = 0
-        for future in as_completed(futures):
-            offset += 1
+        # Dispatch network requests to a thread pool, and process amendement data
+        # as it is received (out of order), while the next ones are being fetched
+        results = self.engine.fetch_all(retrieve, numeros_prefixes)
+        for offset, (numero_prefixe, future) in enumerate(results, start=1):
             progress_bar.advance(offset)
 
-            numero_prefixe = future_to_numero_prefixe[future]
             logger.info("Récupération de l'amendement %r", numero_prefixe)
 
             item = derouleur.items.get(numero_prefixe)
@@ -255,7 +486,19 @@ class AssembleeNationale(RemoteSource):
                 else:
                     if amendement is None:
                         raise ValueError("Invalid amendement return value")
+                    if isinstance(action, RecordFingerprint):
+                        fingerprints.append(action)
                     unchanged.append(amendement.num)
+
+                if amend_data.url is not None and amend_data.validators is not None:
+                    validators[amend_data.get_num()] = {
+                        amend_data.url: amend_data.validators
+                    }
+            except NotModified:
+                logger.debug("Amendement %s not modified", numero_prefixe)
+                unchanged.append(derouleur.remove_prefixe(numero_prefixe))
+                nb_not_modified += 1
+                continue
             except NotFound:
                 logger.debug("Amendement %s not found", numero_prefixe)
                 numero = derouleur.remove_prefixe(numero_prefixe)
@@ -269,7 +512,59 @@ class AssembleeNationale(RemoteSource):
                 errored.add(derouleur.remove_prefixe(numero_prefixe))
                 continue
 
-        return creates, updates, unchanged, errored, not_found
+        if revalidate:
+            logger.info(
+                "Revalidated %d amendements, %d not modified",
+                len(revalidate),
+                nb_not_modified,
+            )
+
+        return (
+            creates,
+            updates,
+            unchanged,
+            errored,
+            not_found,
+            validators,
+            fingerprints,
+        )
+
+    def _validators_to_revalidate(
+        self,
+        lecture: Lecture,
+        derouleur: "ANDerouleurData",
+        numeros_prefixes: List[str],
+        urls_to_try: Dict[str, List[str]],
+    ) -> Dict[str, Dict[str, Validators]]:
+        """
+        Amendements that we can skip if their source did not change since last time
+
+        That's not the case if the discussion list gives them new values (positions
+        are updated separately). Changes in our reference data are not detected
+        (see VALIDATORS_TTL).
+        """
+        known_validators = progress_repository.get_validators(str(lecture.pk))
+        if not known_validators:
+            return {}
+        revalidate = {}
+        for numero_prefixe in numeros_prefixes:
+            numero = derouleur.remove_prefixe(numero_prefixe)
+            amendement = lecture.find_amendement(numero)
+            if amendement is None:
+                continue
+            item = derouleur.items.get(numero_prefixe)
+            if amendement.id_discussion_commune != (
+                item.id_discussion_commune if item else None
+            ) or amendement.id_identique != (item.id_identique if item else None):
+                continue
+            validators = {
+                url: known_validators[url]
+                for url in urls_to_try[numero_prefixe]
+                if url in known_validators
+            }
+            if validators:
+                revalidate[numero_prefixe] = validators
+        return revalidate
 
     def inspect_amendement(
         self,
@@ -280,9 +575,26 @@ class AssembleeNationale(RemoteSource):
         id_identique: Optional[int],
     ) -> Tuple[Optional["Amendement"], Optional[Action]]:
 
+        num = amend_data.get_num()
+        amendement = lecture.find_amendement(num)
+
+        # Skip the extraction and comparison of fields (and the loading of the
+        # article and parent) if the source data did not change since last time
+        # (the position is updated separately)
+        source_fingerprint = fingerprint(
+            amend_data.get_fingerprint_data(),
+            amend_data.get_groupe(),  # also depends on our reference data
+            id_discussion_commune,
+            id_identique,
+        )
+        if (
+            amendement is not None
+            and amendement.source_fingerprint == source_fingerprint
+        ):
+            return amendement, None
+
         parent_num_raw = amend_data.get_parent_raw_num()
 
-        num = amend_data.get_num()
         rectif = amend_data.get_rectif()
 
         subdiv = amend_data.get_division()
@@ -303,8 +615,6 @@ class AssembleeNationale(RemoteSource):
 
         tri_amendement = amend_data.get_tri_amendement()
 
-        amendement = lecture.find_amendement(num)
-
         action: Optional[Action] = None
 
         if amendement is None:
@@ -326,6 +636,7 @@ class AssembleeNationale(RemoteSource):
                 expose=expose,
                 sort=sort,
                 date_depot=date_depot,
+                fingerprint=source_fingerprint,
             )
             return amendement, action
 
@@ -372,50 +683,49 @@ class AssembleeNationale(RemoteSource):
                 expose=expose,
                 sort=sort,
                 date_depot=date_depot,
+                fingerprint=source_fingerprint,
+            )
+        else:
+            action = RecordFingerprint(
+                num=amendement.num, fingerprint=source_fingerprint
             )
         return amendement, action
 
     def apply_changes(self, lecture: Lecture, changes: CollectedChanges) -> FetchResult:
-        result = FetchResult.create(
-            fetched=changes.unchanged,
-            errored=changes.errored,
-            next_start_index=changes.next_start_index,
+        result = super().apply_changes(lecture, changes)
+        self._store_validators_on_commit(
+            lecture,
+            {
+                url: value
+                for num, validators in changes.validators.items()
+                if num not in result.errored
+                for url, value in validators.items()
+            },
         )
+        context = self._contexts.get(lecture.pk)
+        if context is not None:
+            context.record_created(result.created)
+        return result
 
-        # Build amendement -> position map
-        moved_amendements = {
-            amendement: changes.position_changes[amendement.num]
-            for amendement in lecture.amendements
-            if amendement.num in changes.position_changes
-        }
-
-        # Reset positions first, so that we never have two with the same position
-        # (which would trigger an integrity error due to the unique constraint)
-        for amendement in moved_amendements:
-            amendement.position = None
-        DBSession.flush()
-
-        # Create amendements in numerical order, because a "sous-amendement"
-        # must always be created after its parent
-        for create_action in sorted(changes.creates, key=attrgetter("num")):
-            result += create_action.apply(lecture)
-
-        # Update amendements
-        for update_action in changes.updates:
-            result += update_action.apply(lecture)
-
-        # Apply new amendement positions
-        for amendement, position in moved_amendements.items():
-            if amendement.position != position:
-                amendement.position = position
+    @staticmethod
+    def _store_validators_on_commit(
+        lecture: Lecture, validators: Dict[str, Validators]
+    ) -> None:
+        """
+        Don't remember validators before the changes are in the database (nor those
+        of amendements whose changes could not be applied), otherwise we could skip
+        them next time
+        """
+        if not validators:
+            return
 
-        DBSession.flush()
+        lecture_pk = str(lecture.pk)
 
-        # Was it the last batch?
-        if changes.next_start_index is None:
-            lecture.reset_fetch_progress()
+        def store_validators(success: bool) -> None:
+            if success:
+                progress_repository.set_validators(lecture_pk, validators)
 
-        return result
+        transaction.get().addAfterCommitHook(store_validators)
 
 
 def round_up(n: int, m: int) -> int:
@@ -445,13 +755,22 @@ _ORGANE_PREFIX = {
 def _retrieve_content(
     url: str, force_list: Optional[Tuple[str]] = None
 ) -> Dict[str, OrderedDict]:
+    resp = _retrieve_response(url)
+    result: OrderedDict = xmltodict.parse(resp.content, force_list=force_list)
+    return result
+
+
+def _retrieve_response(url: str, headers: Optional[Dict[str, str]] = None) -> Response:
     logger.info("Récupération de %r", url)
     http_session = get_http_session()
     try:
-        resp = http_session.get(url)
+        resp = http_session.get(url, headers=headers)
     except RequestsConnectionError:
         raise NotFound(url)
 
+    if resp.status_code == HTTPStatus.NOT_MODIFIED:
+        raise NotModified(url)
+
     if resp.status_code == HTTPStatus.NOT_FOUND:
         raise NotFound(url)
 
@@ -460,6 +779,9 @@ def _retrieve_content(
     if resp.status_code == HTTPStatus.INTERNAL_SERVER_ERROR:
         raise NotFound(url)
 
+    if resp.status_code in RETRY_STATUSES:
+        raise RateLimited(url, resp)
+
     # Sometimes the URL returns a 200 but the content is empty which leads to
     # a parsing error from xmltodict if not handled manually before.
     if not resp.content:
@@ -469,8 +791,7 @@ def _retrieve_content(
     if resp.status_code >= 400:
         raise FetchError(url, resp)
 
-    result: OrderedDict = xmltodict.parse(resp.content, force_list=force_list)
-    return result
+    return resp
 
 
 _FORCE_LIST_KEYS_LISTE = ("amendement",)
@@ -490,31 +811,50 @@ def fetch_discussion_list(lecture: Lecture) -> "ANDerouleurData":
 _FORCE_LIST_KEYS_AMENDEMENT = ("programmeAmdt",)
 
 
-def _retrieve_amendement(lecture: Lecture, numero_prefixe: str) -> "ANAmendementData":
+def _retrieve_amendement(
+    lecture: Lecture, numero_prefixe: str, parser: str = PARSER_XMLTODICT
+) -> "ANAmendementData":
     urls = _urls_to_try(lecture, numero_prefixe)
     amendement_data = _retrieve_amendement_data_from_first_working_url(
-        urls=urls, force_list=_FORCE_LIST_KEYS_AMENDEMENT,
+        urls=urls, force_list=_FORCE_LIST_KEYS_AMENDEMENT, parser=parser
     )
     return amendement_data
 
 
 def _retrieve_amendement_data_from_first_working_url(
-    urls: List[str], force_list: Optional[Tuple[str]] = None
+    urls: List[str],
+    force_list: Optional[Tuple[str]] = None,
+    validators: Optional[Dict[str, Validators]] = None,
+    parser: str = PARSER_XMLTODICT,
 ) -> "ANAmendementData":
-    content = _retrieve_content_from_first_working_url(urls, force_list)
-    return ANAmendementData(content)
+    """
+    Raises NotModified if the validators of the working URL are still valid
+    """
+    url, resp = _retrieve_response_from_first_working_url(urls, validators or {})
+    content: dict
+    if parser == PARSER_LXML:
+        content = parse_amendement(resp.content)
+    else:
+        content = xmltodict.parse(resp.content, force_list=force_list)
+    return ANAmendementData(content, url=url, validators=Validators.from_response(resp))
 
 
-def _retrieve_content_from_first_working_url(
-    urls: List[str], force_list: Optional[Tuple[str]] = None
-) -> Dict[str, OrderedDict]:
+def _retrieve_response_from_first_working_url(
+    urls: List[str], validators: Dict[str, Validators]
+) -> Tuple[str, Response]:
     last_index = len(urls) - 1
     for index, url in enumerate(urls):
+        known = validators.get(url)
         try:
-            return _retrieve_content(url, force_list=force_list)
+            resp = _retrieve_response(url, headers=known.headers if known else None)
         except NotFound:
             if index == last_index:
                 raise
+            continue
+        # The cached HTTP session turns a 304 response into the cached response
+        if known is not None and Validators.from_response(resp) == known:
+            raise NotModified(url)
+        return url, resp
     raise RuntimeError  # should not happen
 
 
@@ -628,11 +968,11 @@ class ANDerouleurData:
             return item.prefixe
         return get_organe_prefix(self.lecture.organe)
 
-    @property
+    @reify
     def numeros(self) -> Set[int]:
         return {item.numero for item in self.items.values()}
 
-    @property
+    @reify
     def numeros_prefixes(self) -> Set[str]:
         return {item.numero_prefixe for item in self.items.values()}
 
@@ -691,12 +1031,27 @@ class ANAmendementData:
     Data extaction for Assemblée Nationale amendement
     """
 
-    def __init__(self, content: dict):
+    def __init__(
+        self,
+        content: dict,
+        url: Optional[str] = None,
+        validators: Optional[Validators] = None,
+    ):
         self.amend = content["amendement"]
+        self.url = url
+        self.validators = validators
 
     def get_num(self) -> int:
         return int(self.amend["numero"])
 
+    def get_fingerprint_data(self) -> Dict[str, Any]:
+        """
+        The source fields that the amendement is derived from
+        """
+        return {
+            key: value for key, value in self.amend.items() if key in AMENDEMENT_FIELDS
+        }
+
     def get_rectif(self) -> int:
         numero_long = self._get_str_or_none("numeroLong")
         if numero_long is None:
@@ -1,13 +1,56 @@
 import logging
+from contextlib import contextmanager
 from http import HTTPStatus
-from io import BytesIO, TextIOWrapper
-from typing import IO, BinaryIO, Generator, Tuple, cast
-from zipfile import ZipFile
+from io import TextIOWrapper
+from json import load
+from tempfile import TemporaryFile
+from typing import (
+    IO,
+    Any,
+    BinaryIO,
+    Callable,
+    Generator,
+    Iterator,
+    Optional,
+    Tuple,
+    cast,
+)
+from zipfile import ZipFile, ZipInfo
 
-from zam_repondeur.services.fetch.http import get_http_session
+import requests
+
+from zam_repondeur.services.fetch.exceptions import NotModified
+from zam_repondeur.services.fetch.http import Validators
 
 logger = logging.getLogger(__name__)
 
+# Size of the chunks used to copy a download to disk
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Seconds to wait for the connection, then for each read (not the whole download)
+DOWNLOAD_TIMEOUT = (10, 60)
+
+# Called with the filename and fingerprint of a zip member, returns True to skip it
+SkipMember = Callable[[str, str], bool]
+
+
+class KnownArchives:
+    """
+    What we know about the archives downloaded by a previous load (nothing here)
+
+    When an archive was not modified since then, we don't need to download it
+    again, as long as all the data we got from it last time can be reused.
+    """
+
+    def validators(self, url: str) -> Optional[Validators]:
+        return None
+
+    def reuse(self, url: str) -> bool:
+        return False
+
+    def downloaded(self, url: str, validators: Optional[Validators]) -> None:
+        pass
+
 
 def roman(n: int) -> str:
     if n == 15:
@@ -17,31 +60,91 @@ def roman(n: int) -> str:
     raise NotImplementedError
 
 
-def extract_from_remote_zip(url: str) -> Generator[Tuple[str, IO[str]], None, None]:
-    http_session = get_http_session()
-    response = http_session.get(url)
+@contextmanager
+def download_zip(
+    url: str, archives: Optional[KnownArchives] = None
+) -> Iterator[BinaryIO]:
+    """
+    Download a remote zip file to a temporary file, so that we never hold the
+    whole archive in memory, and so that it can be read more than once
+
+    NB: we don't use the cached HTTP session, as CacheControl buffers the whole
+    response body in memory (to store it in the cache). Instead, we make a
+    conditional request with the validators of the previous download (if any),
+    and raise `NotModified` if the data we got from it can be reused.
+    """
+    validators = archives.validators(url) if archives is not None else None
+    response = _request_zip(url, validators)
+    if response.status_code == HTTPStatus.NOT_MODIFIED:
+        response.close()
+        if archives is not None and archives.reuse(url):
+            logger.info("Archive not modified: %s", url)
+            raise NotModified(url)
+        logger.info("Archive not modified, but its data can't be reused: %s", url)
+        response = _request_zip(url, validators=None)
+
+    with response:
+        if response.status_code != HTTPStatus.OK:
+            message = (
+                f"Unexpected status code {response.status_code} while fetching {url}"
+            )
+            logger.error(message)
+            raise RuntimeError(message)
+
+        content_type = response.headers["content-type"]
+        if content_type != "application/zip":
+            message = (
+                f"Unexpected content type {content_type} while fetching {url} "
+                "(expected application/zip)"
+            )
+            logger.error(message)
+            raise RuntimeError(message)
+
+        if archives is not None:
+            archives.downloaded(url, Validators.from_response(response))
 
-    if response.status_code not in (HTTPStatus.OK, HTTPStatus.NOT_MODIFIED):
-        message = f"Unexpected status code {response.status_code} while fetching {url}"
-        logger.error(message)
-        raise RuntimeError(message)
+        with TemporaryFile() as file_:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                file_.write(chunk)
+            response.close()  # release the connection while we parse the archive
+            file_.seek(0)
+            yield cast(BinaryIO, file_)
 
-    content_type = response.headers["content-type"]
-    if content_type != "application/zip":
-        message = (
-            f"Unexpected content type {content_type} while fetching {url} "
-            "(expected application/zip)"
-        )
-        logger.error(message)
-        raise RuntimeError(message)
 
-    yield from extract_from_zip(BytesIO(response.content))
+def _request_zip(url: str, validators: Optional[Validators]) -> requests.Response:
+    headers = validators.headers if validators is not None else {}
+    return requests.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT)
 
 
-def extract_from_zip(content: BytesIO) -> Generator[Tuple[str, IO[str]], None, None]:
+def extract_from_zip(
+    content: BinaryIO, prefix: str = "", skip: Optional[SkipMember] = None
+) -> Generator[Tuple[str, IO[str]], None, None]:
     with ZipFile(content) as zip_file:
-        for filename in zip_file.namelist():
-            with zip_file.open(filename) as file_:
+        for info in zip_file.infolist():
+            filename = info.filename
+            if info.is_dir() or not filename.startswith(prefix):
+                continue
+            if skip is not None and skip(filename, zip_member_fingerprint(info)):
+                continue
+            with zip_file.open(info) as file_:
                 # The cast is required temporarily to work around a typeshed issue
                 # https://github.com/python/mypy/pull/8965
                 yield (filename, TextIOWrapper(cast(BinaryIO, file_), encoding="utf-8"))
+
+
+def load_json_from_zip(
+    content: BinaryIO, prefix: str = "", skip: Optional[SkipMember] = None
+) -> Iterator[Tuple[str, Any]]:
+    """
+    Parse the JSON files from a zip archive one at a time
+    """
+    for filename, json_file in extract_from_zip(content, prefix, skip):
+        if filename.endswith(".json"):
+            yield filename, load(json_file)
+
+
+def zip_member_fingerprint(info: ZipInfo) -> str:
+    """
+    Identify the content of a zip member without having to decompress it
+    """
+    return f"{info.CRC:08x}-{info.file_size}"
@@ -1,14 +1,32 @@
 import logging
 import re
 from datetime import date
-from json import load
-from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
 from zam_repondeur.models.chambre import Chambre
 from zam_repondeur.slugs import slugify
 
 from ...dates import parse_date
-from ..common import extract_from_remote_zip, roman
+from ...exceptions import NotModified
+from ..common import (
+    KnownArchives,
+    SkipMember,
+    download_zip,
+    load_json_from_zip,
+    roman,
+)
 from .models import DossierRef, DossierRefsByUID, LectureRef, Phase, TexteRef, TypeTexte
 
 logger = logging.getLogger(__name__)
@@ -19,57 +37,118 @@ def get_dossiers_legislatifs_and_textes(
 ) -> Tuple[DossierRefsByUID, Dict[str, TexteRef]]:
     all_dossiers: DossierRefsByUID = {}
     all_textes: Dict[str, TexteRef] = {}
-    for legislature in legislatures:
-        dossiers, textes = _get_dossiers_legislatifs_and_textes(legislature)
-        all_dossiers.update(dossiers)
-        all_textes.update(textes)
+    for _, item in iter_dossiers_legislatifs_and_textes(*legislatures):
+        if isinstance(item, TexteRef):
+            all_textes[item.uid] = item
+        else:
+            all_dossiers[item.uid] = item
     return all_dossiers, all_textes
 
 
-def _get_dossiers_legislatifs_and_textes(
+def iter_dossiers_legislatifs_and_textes(
+    *legislatures: int,
+    skip: Optional[SkipMember] = None,
+    get_texte: Optional[Callable[[str], Optional[TexteRef]]] = None,
+    on_missing_texte: Optional[Callable[[str], None]] = None,
+    archives: Optional[KnownArchives] = None,
+) -> Iterator[Tuple[str, Union[TexteRef, DossierRef]]]:
+    """
+    Yield the textes, then the dossiers of each legislature, along with the name
+    of the file they were parsed from
+
+    Dossiers are parsed one file at a time, but we have to keep the textes of
+    the current legislature around, as dossiers reference them. When files
+    are skipped, `get_texte` is used to look up the textes they contained.
+
+    Lectures of textes that are not published yet are left out of dossiers:
+    `on_missing_texte` is called with their UID before the dossier is yielded.
+
+    Archives that were not modified since the previous load are not parsed
+    at all when `archives` tells us their data can be reused.
+    """
+    for legislature in legislatures:
+        url = dossiers_legislatifs_url(legislature)
+        try:
+            with download_zip(url, archives) as zip_file:
+                yield from _iter_dossiers_legislatifs_and_textes(
+                    legislature, zip_file, skip, get_texte, on_missing_texte
+                )
+        except NotModified:
+            continue
+
+
+def _iter_dossiers_legislatifs_and_textes(
     legislature: int,
-) -> Tuple[DossierRefsByUID, Dict[str, TexteRef]]:
+    zip_file: BinaryIO,
+    skip: Optional[SkipMember],
+    get_texte: Optional[Callable[[str], Optional[TexteRef]]],
+    on_missing_texte: Optional[Callable[[str], None]],
+) -> Iterator[Tuple[str, Union[TexteRef, DossierRef]]]:
     # As of June 20th, 2019 the Assemblée Nationale website updated the way
     # their opendata zip content is splitted, without changing old
     # legislatures. Hence we have to keep two ways to parse their content
     # forever. And ever.
     if legislature <= 14:
-        data = list(fetch_dossiers_legislatifs_and_textes(legislature).values())[0]
-        textes = parse_textes(data["export"]["textesLegislatifs"]["document"])
-        dossiers = parse_dossiers(
-            data["export"]["dossiersLegislatifs"]["dossier"], textes
-        )
+        for filename, data in load_json_from_zip(zip_file, skip=skip):
+            textes = parse_textes(data["export"]["textesLegislatifs"]["document"])
+            for texte in textes.values():
+                yield filename, texte
+            for dossier in iter_dossiers(
+                data["export"]["dossiersLegislatifs"]["dossier"], textes
+            ):
+                yield filename, dossier
+            break  # the whole legislature is in the first file
     else:
-        data = fetch_dossiers_legislatifs_and_textes(legislature)
-        textes_data: List[Dict[str, Any]] = [
-            dict_["document"]
-            for filename, dict_ in data.items()
-            if filename.startswith("json/document")
-        ]
-        textes = parse_textes(textes_data)
-        dossiers_data: List[Dict[str, Any]] = [
-            dict_
-            for filename, dict_ in data.items()
-            if filename.startswith("json/dossierParlementaire")
-        ]
-        dossiers = parse_dossiers(dossiers_data, textes)
-    return dossiers, textes
-
-
-def fetch_dossiers_legislatifs_and_textes(legislature: int) -> dict:
+        textes = KnownTextes(get_texte, on_missing_texte)
+        for filename, dict_ in load_json_from_zip(
+            zip_file, prefix="json/document", skip=skip
+        ):
+            for texte in parse_textes([dict_["document"]]).values():
+                textes[texte.uid] = texte
+                yield filename, texte
+        # Second pass over the archive, now that we know all the textes
+        for filename, dict_ in load_json_from_zip(
+            zip_file, prefix="json/dossierParlementaire", skip=skip
+        ):
+            for dossier in iter_dossiers([dict_], textes):
+                yield filename, dossier
+
+
+class KnownTextes(Dict[str, TexteRef]):
+    """
+    Textes parsed so far, falling back to `get_texte` for the others (and telling
+    `on_missing` about those we don't know at all)
+    """
+
+    def __init__(
+        self,
+        get_texte: Optional[Callable[[str], Optional[TexteRef]]],
+        on_missing: Optional[Callable[[str], None]] = None,
+    ):
+        super().__init__()
+        self.get_texte = get_texte
+        self.on_missing = on_missing
+
+    def __missing__(self, uid: str) -> TexteRef:
+        texte = self.get_texte(uid) if self.get_texte is not None else None
+        if texte is None:
+            if self.on_missing is not None:
+                self.on_missing(uid)
+            raise KeyError(uid)
+        self[uid] = texte
+        return texte
+
+
+def dossiers_legislatifs_url(legislature: int) -> str:
     legislature_roman = roman(legislature)
-    url = (
+    return (
         f"http://data.assemblee-nationale.fr/static/openData/repository/"
         f"{legislature}/loi/dossiers_legislatifs/"
         f"Dossiers_Legislatifs_{legislature_roman}.json.zip"
     )
-    return {
-        filename: load(json_file)
-        for filename, json_file in extract_from_remote_zip(url)
-    }
 
 
-def parse_textes(textes: list) -> Dict[str, TexteRef]:
+def parse_textes(textes: Iterable[dict]) -> Dict[str, TexteRef]:
     return {
         item["uid"]: parse_texte(item)
         for item in textes
@@ -127,15 +206,15 @@ def legislature_texte(item: dict) -> Optional[int]:
     return int(legislature)
 
 
-def parse_dossiers(dossiers: list, textes: Dict[str, TexteRef]) -> DossierRefsByUID:
+def iter_dossiers(
+    dossiers: Iterable[Any], textes: Dict[str, TexteRef]
+) -> Iterator[DossierRef]:
     dossier_dicts = (
         item["dossierParlementaire"] for item in dossiers if isinstance(item, dict)
     )
-    dossier_models = []
     for dossier_dict in dossier_dicts:
         if is_dossier(dossier_dict):
-            dossier_models.append(parse_dossier(dossier_dict, textes))
-    return {dossier.uid: dossier for dossier in dossier_models}
+            yield parse_dossier(dossier_dict, textes)
 
 
 def is_dossier(data: dict) -> bool:
@@ -1,42 +1,67 @@
-from json import load
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
 
-from .common import extract_from_remote_zip
+from zam_repondeur.services.fetch.exceptions import NotModified
+
+from .common import KnownArchives, SkipMember, download_zip, load_json_from_zip
+
+ORGANE = "organe"
+ACTEUR = "acteur"
 
 
 def get_organes_acteurs() -> Tuple[Dict[str, dict], Dict[str, dict]]:
-    data = fetch_organes_acteurs()
-    organes_data: List[Dict[str, Any]] = [
-        dict_["organe"]
-        for filename, dict_ in data.items()
-        if filename.startswith("json/organe")
-    ]
-    organes = extract_organes(organes_data)
-    acteurs_data: List[Dict[str, Any]] = [
-        dict_["acteur"]
-        for filename, dict_ in data.items()
-        if filename.startswith("json/acteur")
-    ]
-    acteurs = extract_acteurs(acteurs_data)
+    organes: Dict[str, dict] = {}
+    acteurs: Dict[str, dict] = {}
+    for _, kind, uid, item in iter_organes_acteurs():
+        if kind == ORGANE:
+            organes[uid] = item
+        else:
+            acteurs[uid] = item
     return organes, acteurs
 
 
-def fetch_organes_acteurs() -> Dict[str, Any]:
+def iter_organes_acteurs(
+    skip: Optional[SkipMember] = None, archives: Optional[KnownArchives] = None,
+) -> Iterator[Tuple[str, str, str, dict]]:
+    """
+    Yield (filename, kind, uid, data) tuples, parsing the files one at a time
+    """
+    for filename, dict_ in fetch_organes_acteurs(skip, archives):
+        if filename.startswith("json/organe"):
+            organe = dict_["organe"]
+            yield filename, ORGANE, _organe_uid(organe), organe
+        elif filename.startswith("json/acteur"):
+            acteur = dict_["acteur"]
+            yield filename, ACTEUR, _acteur_uid(acteur), acteur
+
+
+def fetch_organes_acteurs(
+    skip: Optional[SkipMember] = None, archives: Optional[KnownArchives] = None,
+) -> Iterator[Tuple[str, Any]]:
     url = (
         "http://data.assemblee-nationale.fr/static/openData/repository/15/amo/"
         "tous_acteurs_mandats_organes_xi_legislature/"
         "AMO30_tous_acteurs_tous_mandats_tous_organes_historique.json.zip"
     )
-    return {
-        filename: load(json_file)
-        for filename, json_file in extract_from_remote_zip(url)
-        if filename.endswith(".json")
-    }
+    try:
+        with download_zip(url, archives) as zip_file:
+            yield from load_json_from_zip(zip_file, skip=skip)
+    except NotModified:
+        pass  # the data we got from it last time is reused
+
+
+def extract_organes(organes: Iterable[dict]) -> Dict[str, dict]:
+    return {_organe_uid(organe): organe for organe in organes}
+
+
+def extract_acteurs(acteurs: Iterable[dict]) -> Dict[str, dict]:
+    return {_acteur_uid(acteur): acteur for acteur in acteurs}
 
 
-def extract_organes(organes: List[dict]) -> Dict[str, dict]:
-    return {organe["uid"]: organe for organe in organes}
+def _organe_uid(organe: dict) -> str:
+    uid: str = organe["uid"]
+    return uid
 
 
-def extract_acteurs(acteurs: List[dict]) -> Dict[str, dict]:
-    return {acteur["uid"]["#text"]: acteur for acteur in acteurs}
+def _acteur_uid(acteur: dict) -> str:
+    uid: str = acteur["uid"]["#text"]
+    return uid
@@ -0,0 +1,98 @@
+"""
+Fast extraction of the fields we use from AN amendement XML
+
+`xmltodict` builds nested dicts for the whole document (including the texte,
+seance, cosignataires, etc.) from Python callbacks. Here the document is parsed
+with lxml, and only the fields read by `ANAmendementData` are converted, with
+the same shapes as `xmltodict` would produce for them.
+"""
+from typing import Any, Dict, Optional, Union
+
+from lxml import etree  # nosec
+
+XSI_NIL = "{http://www.w3.org/2001/XMLSchema-instance}nil"
+
+# Direct children of <amendement> used by ANAmendementData
+AMENDEMENT_FIELDS = frozenset(
+    [
+        "numero",
+        "numeroLong",
+        "numeroParent",
+        "etat",
+        "missionVisee",
+        "dispositif",
+        "exposeSommaire",
+        "sortEnSeance",
+        "dateDepot",
+        "triAmendement",
+        "retireAvantPublication",
+        "retireApresPublication",
+        "division",
+        "auteur",
+        "listeProgrammesAmdt",
+        "totalAESupplementairesOuvertesFormat",
+        "totalAEAnnuleesFormat",
+        "totalCPSupplementairesOuvertesFormat",
+        "totalCPAnnuleesFormat",
+        "totalAEPositifFormat",
+        "totalAENegatifFormat",
+        "totalCPPositifFormat",
+        "totalCPNegatifFormat",
+        "soldeAEFormat",
+        "soldeCPFormat",
+    ]
+)
+
+# Elements that are always converted to a list (like `force_list` in xmltodict)
+FORCE_LIST = frozenset(["programmeAmdt"])
+
+# Don't fetch anything over the network, nor expand entities
+_PARSER = etree.XMLParser(resolve_entities=False, no_network=True)
+
+Value = Union[None, str, Dict[str, Any]]
+
+
+def parse_amendement(content: bytes) -> Dict[str, Dict[str, Value]]:
+    root = etree.fromstring(content, parser=_PARSER)  # nosec
+    if root.tag != "amendement":
+        raise ValueError(f"Unexpected root element {root.tag!r}")
+    amend = {
+        child.tag: _convert(child)
+        for child in root
+        if isinstance(child.tag, str) and child.tag in AMENDEMENT_FIELDS
+    }
+    return {"amendement": amend}
+
+
+def _convert(element: etree._Element) -> Value:
+    """
+    Convert an element the way `xmltodict` does (except for namespace declarations)
+    """
+    if element.get(XSI_NIL) is not None:
+        return {"@xsi:nil": element.get(XSI_NIL)}
+    text = _text(element)
+    if len(element) == 0 and not element.attrib:
+        return text
+    result: Dict[str, Any] = {
+        f"@{name}": value for name, value in element.attrib.items()
+    }
+    for child in element:
+        if not isinstance(child.tag, str):
+            continue  # comment or processing instruction
+        value = _convert(child)
+        if child.tag in result:
+            if not isinstance(result[child.tag], list):
+                result[child.tag] = [result[child.tag]]
+            result[child.tag].append(value)
+        elif child.tag in FORCE_LIST:
+            result[child.tag] = [value]
+        else:
+            result[child.tag] = value
+    if text is not None:
+        result["#text"] = text
+    return result
+
+
+def _text(element: etree._Element) -> Optional[str]:
+    text = (element.text or "").strip()
+    return text or None
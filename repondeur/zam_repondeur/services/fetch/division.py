@@ -13,11 +13,16 @@ from typing import Any, List, Optional
 
 from parsy import ParseError, regex, seq, string, string_from, whitespace
 
+from zam_repondeur.decorator import memoize
 from zam_repondeur.models.division import ADJECTIFS_MULTIPLICATIFS, SubDiv
 from zam_repondeur.models.texte import Texte
 
 logger = logging.getLogger(__name__)
 
+# There are a few hundred distinct libellés in a large texte (e.g. PLF), but each
+# of them is parsed for many amendements, on every refresh
+PARSE_CACHE_SIZE = 4096
+
 
 def case_insensitive_string(expected_string: str) -> Any:
     return string(expected_string, transform=lambda s: s.lower())
@@ -231,6 +236,12 @@ DIVISION = (
 
 
 def parse_subdiv(libelle: str, texte: Optional[Texte] = None) -> SubDiv:
+    # The result only depends on the libellé for now
+    return _parse_subdiv(libelle)
+
+
+@memoize(maxsize=PARSE_CACHE_SIZE)
+def _parse_subdiv(libelle: str) -> SubDiv:
     try:
         subdiv: SubDiv = DIVISION.parse(libelle)
         return subdiv
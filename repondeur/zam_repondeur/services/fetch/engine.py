@@ -0,0 +1,198 @@
+"""
+Concurrent fetching of remote resources
+
+Requests are dispatched to a bounded thread pool, and results are handed back to
+the caller as soon as they are received, so that parsing and processing can
+overlap with network I/O.
+
+The number of requests in flight adapts to the remote server: it is halved when
+the server asks us to slow down (HTTP 429 or 5xx gateway errors), and slowly
+increased again while responses come back in a timely manner.
+"""
+import logging
+import random
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from http import HTTPStatus
+from threading import Condition
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+
+from pyramid.threadlocal import manager
+
+from zam_repondeur.services.fetch.exceptions import RateLimited
+
+logger = logging.getLogger(__name__)
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+MAX_WORKERS = 4
+MIN_WORKERS = 1
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 1.0  # seconds
+MAX_BACKOFF = 30.0  # seconds
+
+# Don't increase concurrency when the latency goes above this multiple of
+# the best latency seen so far (the server is probably getting busy)
+SLOWDOWN_RATIO = 2.0
+
+# Responses meaning that we should slow down and try again later
+RETRY_STATUSES = {
+    HTTPStatus.TOO_MANY_REQUESTS,
+    HTTPStatus.BAD_GATEWAY,
+    HTTPStatus.SERVICE_UNAVAILABLE,
+    HTTPStatus.GATEWAY_TIMEOUT,
+}
+
+
+class AdaptiveLimit:
+    """
+    Limit the number of concurrent requests (additive increase, multiplicative
+    decrease)
+    """
+
+    def __init__(self, min_limit: int, max_limit: int) -> None:
+        if not 1 <= min_limit <= max_limit:
+            raise ValueError(
+                f"Invalid concurrency limits (min={min_limit}, max={max_limit})"
+            )
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = max_limit
+        self.in_flight = 0
+        self.best_latency: Optional[float] = None
+        self._successes = 0
+        self._condition = Condition()
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self._condition.notify()
+
+    def on_success(self, latency: float) -> None:
+        with self._condition:
+            if self.best_latency is None or latency < self.best_latency:
+                self.best_latency = latency
+            if latency > self.best_latency * SLOWDOWN_RATIO:
+                return
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.max_limit:
+                self._successes = 0
+                self.limit += 1
+                self._condition.notify()
+                logger.debug("Increasing concurrency to %d", self.limit)
+
+    def on_throttled(self) -> None:
+        with self._condition:
+            self._successes = 0
+            new_limit = max(self.min_limit, self.limit // 2)
+            if new_limit < self.limit:
+                self.limit = new_limit
+                logger.info("Reducing concurrency to %d", self.limit)
+
+
+class FetchEngine:
+    def __init__(
+        self,
+        max_workers: int = MAX_WORKERS,
+        min_workers: int = MIN_WORKERS,
+        max_retries: int = MAX_RETRIES,
+        backoff_factor: float = BACKOFF_FACTOR,
+        max_backoff: float = MAX_BACKOFF,
+    ) -> None:
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.limit = AdaptiveLimit(min_limit=min_workers, max_limit=max_workers)
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any], prefix: str) -> "FetchEngine":
+        return cls(
+            max_workers=int(settings.get(f"{prefix}.max_workers", MAX_WORKERS)),
+            min_workers=int(settings.get(f"{prefix}.min_workers", MIN_WORKERS)),
+            max_retries=int(settings.get(f"{prefix}.max_retries", MAX_RETRIES)),
+            backoff_factor=float(
+                settings.get(f"{prefix}.backoff_factor", BACKOFF_FACTOR)
+            ),
+            max_backoff=float(settings.get(f"{prefix}.max_backoff", MAX_BACKOFF)),
+        )
+
+    def fetch_all(
+        self, func: Callable[[T], R], items: Iterable[T]
+    ) -> Iterator[Tuple[T, "Future[R]"]]:
+        """
+        Call `func` concurrently on each item, and yield `(item, future)` pairs
+        in order of completion
+
+        Exceptions are not raised here, but when calling `future.result()`.
+        """
+        # Worker threads need the current registry (e.g. for the cached HTTP session)
+        threadlocals = manager.get()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            future_to_item = {
+                executor.submit(self._call_in_thread, threadlocals, func, item): item
+                for item in items
+            }
+            try:
+                for future in as_completed(future_to_item):
+                    yield future_to_item[future], future
+            finally:
+                # Don't keep fetching if the caller stopped early
+                for future in future_to_item:
+                    future.cancel()
+
+    def _call_in_thread(
+        self, threadlocals: Dict[str, Any], func: Callable[[T], R], item: T
+    ) -> R:
+        manager.push(threadlocals)
+        try:
+            return self.call(func, item)
+        finally:
+            manager.pop()
+
+    def call(self, func: Callable[[T], R], item: T) -> R:
+        """
+        Call `func` on the item, backing off and retrying if we're rate-limited
+        """
+        attempt = 0
+        while True:
+            with self.limit.slot():
+                start = time.monotonic()
+                try:
+                    result = func(item)
+                except RateLimited as exc:
+                    self.limit.on_throttled()
+                    if attempt >= self.max_retries:
+                        raise
+                    attempt += 1
+                    delay = self._backoff_delay(attempt, exc.retry_after)
+                    logger.info(
+                        "Rate-limited by %s, retrying in %.1fs (attempt %d/%d)",
+                        exc.url,
+                        delay,
+                        attempt,
+                        self.max_retries,
+                    )
+                else:
+                    self.limit.on_success(time.monotonic() - start)
+                    return result
+            time.sleep(delay)
+
+    def _backoff_delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        delay = self.backoff_factor * (2 ** (attempt - 1))
+        delay *= random.uniform(0.5, 1.5)  # nosec (jitter)
+        return float(min(delay, self.max_backoff))
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from requests import Response
 
 
@@ -5,7 +7,25 @@ class NotFound(Exception):
     pass
 
 
+class NotModified(Exception):
+    pass
+
+
 class FetchError(Exception):
     def __init__(self, url: str, response: Response) -> None:
         self.url = url
         self.response = response
+
+
+class RateLimited(FetchError):
+    """
+    The server asked us to slow down (or is temporarily overloaded)
+    """
+
+    @property
+    def retry_after(self) -> Optional[float]:
+        value = self.response.headers.get("Retry-After", "")
+        try:
+            return float(value)
+        except ValueError:
+            return None  # missing, or an HTTP date
@@ -1,4 +1,4 @@
-from typing import Any, Optional, Union
+from typing import Any, Dict, NamedTuple, Optional, Union
 
 import requests
 from cachecontrol import CacheControl, CacheController
@@ -24,6 +24,32 @@ class CustomCacheController(CacheController):
         super().__init__(cache, cache_etags, serializer, status_codes)
 
 
+class Validators(NamedTuple):
+    """
+    Cache validators of a response, to make conditional requests later
+    """
+
+    etag: str
+    last_modified: str
+
+    @classmethod
+    def from_response(cls, response: requests.Response) -> Optional["Validators"]:
+        etag = response.headers.get("ETag", "")
+        last_modified = response.headers.get("Last-Modified", "")
+        if not etag and not last_modified:
+            return None
+        return cls(etag=etag, last_modified=last_modified)
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
 class IHTTPSession(Interface):
     pass
 
@@ -1,25 +1,47 @@
+import codecs
 import csv
+import hashlib
 import logging
 import re
 import sys
-from collections import OrderedDict
+from contextlib import closing
+from functools import partial
 from http import HTTPStatus
-from typing import Iterable, List, Optional, Set, Tuple
+from tempfile import TemporaryFile
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
 from urllib.parse import urlparse
 
+from requests import Response
+
 from zam_repondeur.models import Amendement, Chambre, Lecture
 from zam_repondeur.services.clean import clean_html
 from zam_repondeur.services.data import repository
 from zam_repondeur.services.fetch.amendements import (
+    Action,
     CollectedChanges,
+    CreateAmendement,
     FetchResult,
+    RecordFingerprint,
     RemoteSource,
+    UpdateAmendement,
+    fingerprint,
 )
 from zam_repondeur.services.fetch.dates import parse_date
 from zam_repondeur.services.fetch.division import parse_subdiv
+from zam_repondeur.services.fetch.engine import FetchEngine
 from zam_repondeur.services.fetch.exceptions import NotFound
-from zam_repondeur.services.fetch.http import get_http_session
-from zam_repondeur.utils import Timer
+from zam_repondeur.services.fetch.http import Validators, get_http_session
+from zam_repondeur.services.progress import repository as progress_repository
 
 from .derouleur import DiscussionDetails, fetch_and_parse_discussion_details
 
@@ -30,161 +52,271 @@ BASE_URL = "https://www.senat.fr"
 # https://www.senat.fr/amendements/2019-2020/139/jeu_complet_2019-2020_139.csv
 csv.field_size_limit(sys.maxsize)
 
+# Read the (potentially large) CSV files in chunks of this size
+CHUNK_SIZE = 64 * 1024
 
-class Senat(RemoteSource):
-    def prepare(self, lecture: Lecture) -> None:
-        if self.prefetching_enabled:
-            logger.info("Préchargement des amendements de %r", lecture)
-            with Timer() as timer:
-                self._fetch(lecture, dry_run=True)
-            logger.info("Temps de préchargement : %.1fs", timer.elapsed())
 
-    def collect_changes(
-        self, lecture: Lecture, start_index: int = 0
-    ) -> CollectedChanges:
-        # TODO: split into separate collect_changes/apply_changes like AN
-        return CollectedChanges.create()
+# Don't apply all amendements at once (which is long when there are thousands)
+BATCH_SIZE = 250
 
-    def apply_changes(self, lecture: Lecture, changes: CollectedChanges) -> FetchResult:
-        # TODO: split into separate collect_changes/apply_changes like AN
-        return self._fetch(lecture)
+# Keep parsed files for the other lectures of the same texte (in minutes)
+PARSED_FILES_TTL = 60
 
-    def _fetch(self, lecture: Lecture, dry_run: bool = False) -> FetchResult:
-        created: Set[int] = set()
-        amendements: List[Amendement] = []
+# Parsed files bigger than this are not kept (in KB, once packed and compressed)
+PARSED_FILES_MAX_SIZE = 32 * 1024
 
-        # Remember previous positions and reset them
-        old_positions = {}
-        for amendement in lecture.amendements:
-            old_positions[amendement.num] = amendement.position
-            amendement.position = None
 
-        try:
-            amendements_created = self._fetch_and_parse_all(
-                lecture=lecture, dry_run=dry_run
-            )
-        except NotFound:
-            return FetchResult.create(fetched=set(), created=set())
+class SenatData(NamedTuple):
+    rows: List[Dict[str, str]]  # for this lecture, by increasing numero
+    discussion_details: Dict[int, DiscussionDetails]  # by numero
+    groupes: Dict[str, str]  # groupe parlementaire by matricule
 
-        for amendement, created_ in amendements_created:
-            if created_:
-                created.add(amendement.num)
-            amendements.append(amendement)
 
-        processed_amendements = list(
-            self._process_amendements(amendements=amendements, lecture=lecture)
-        )
-        lecture.reset_fetch_progress()
+class CreateSenatAmendement(CreateAmendement):
+    """
+    New amendements are created empty, then updated, so that their history
+    shows how their content was initialized
+    """
 
-        # Log amendements no longer discussed
-        for amdt in lecture.amendements:
-            if amdt.position is None and old_positions.get(amdt.num) is not None:
-                logger.info("Amendement %s retiré de la discussion", amdt.num)
+    def apply(self, lecture: Lecture) -> FetchResult:
+        article = self._get_article(lecture)
+        amendement = Amendement.create(lecture=lecture, article=article, num=self.num)
+        self._update(lecture, amendement)
+        return FetchResult.create(fetched={self.num}, created={self.num})
 
-        return FetchResult.create(
-            fetched={amdt.num for amdt in processed_amendements}, created=created
-        )
 
-    def _fetch_and_parse_all(
-        self, lecture: Lecture, dry_run: bool = False
-    ) -> List[Tuple[Amendement, bool]]:
-        return [
-            self.parse_from_csv(row, lecture)
-            for row in _fetch_all(lecture, dry_run)
-            if lecture.partie == parse_partie(row["Numéro "])
-        ]
+class Senat(RemoteSource):
+    bulk_threshold = None  # see CreateSenatAmendement
+
+    def __init__(self, settings: Dict[str, Any], prefetching_enabled: bool = True):
+        super().__init__(settings=settings, prefetching_enabled=prefetching_enabled)
+        self.batch_size = int(settings.get("zam.fetch.senat.batch_size", BATCH_SIZE))
+        self.engine = FetchEngine.from_settings(settings, prefix="zam.fetch.senat")
+        self.parsed_files_ttl = int(
+            settings.get("zam.fetch.senat.parsed_files_ttl", PARSED_FILES_TTL)
+        )
+        self.parsed_files_max_size = 1024 * int(
+            settings.get("zam.fetch.senat.parsed_files_max_size", PARSED_FILES_MAX_SIZE)
+        )
+        self._data: Dict[int, SenatData] = {}
 
-    def parse_from_csv(self, row: dict, lecture: Lecture) -> Tuple[Amendement, bool]:
-        subdiv = parse_subdiv(row["Subdivision "], texte=lecture.texte)
-        article, _ = lecture.find_or_create_article(subdiv)
+    def collect_changes(
+        self, lecture: Lecture, start_index: int = 0
+    ) -> CollectedChanges:
+        try:
+            data = self._get_data(lecture, start_index)
+        except NotFound:
+            return CollectedChanges.create(derouleur_fetch_success=False)
 
-        num, rectif = Amendement.parse_num(row["Numéro "])
-        amendement, created = lecture.find_or_create_amendement(num, article)
-
-        self.update_rectif(amendement, rectif)
-        self.update_corps(amendement, clean_html(row["Dispositif "]))
-        self.update_expose(amendement, clean_html(row["Objet "]))
-        self.update_sort(amendement, row["Sort "])
-        self.update_attributes(
-            amendement,
-            article=article,
-            alinea=row["Alinéa"].strip(),
-            auteur=row["Auteur "],
-            matricule=extract_matricule(row["Fiche Sénateur"]),
-            date_depot=parse_date(row["Date de dépôt "]),
+        new_positions = {
+            num: details.position for num, details in data.discussion_details.items()
+        }
+        position_changes = {
+            amendement.num: new_positions.get(amendement.num)
+            for amendement in lecture.amendements
+            if new_positions.get(amendement.num) != amendement.position
+        }
+        if start_index == 0:
+            for amendement in lecture.amendements:
+                if amendement.position is not None and amendement.num not in (
+                    new_positions
+                ):
+                    logger.info("Amendement %s retiré de la discussion", amendement.num)
+
+        creates: List[CreateAmendement] = []
+        updates: List[UpdateAmendement] = []
+        unchanged: List[int] = []
+        fingerprints: List[RecordFingerprint] = []
+
+        rows = data.rows[start_index : start_index + self.batch_size]
+        for row in rows:
+            num, action = self.inspect_row(lecture, row, data)
+            if isinstance(action, CreateAmendement):
+                creates.append(action)
+            elif isinstance(action, UpdateAmendement):
+                updates.append(action)
+            else:
+                if isinstance(action, RecordFingerprint):
+                    fingerprints.append(action)
+                unchanged.append(num)
+
+        end_index = start_index + len(rows)
+        lecture.set_fetch_progress(end_index, len(data.rows))
+        if end_index < len(data.rows):
+            next_start_index: Optional[int] = end_index
+        else:
+            next_start_index = None
+            del self._data[lecture.pk]  # last batch
+
+        return CollectedChanges.create(
+            position_changes=position_changes,
+            creates=creates,
+            updates=updates,
+            unchanged=unchanged,
+            next_start_index=next_start_index,
+            fingerprints=fingerprints,
         )
 
-        return amendement, created
-
-    def _process_amendements(
-        self, amendements: Iterable[Amendement], lecture: Lecture
-    ) -> Iterable[Amendement]:
+    def _get_data(self, lecture: Lecture, start_index: int) -> SenatData:
+        """
+        Data is fetched again for the first batch, then reused for the next ones
+        """
+        if start_index == 0 or lecture.pk not in self._data:
+            self._data[lecture.pk] = self._fetch_data(lecture)
+        return self._data[lecture.pk]
+
+    def _fetch_data(self, lecture: Lecture) -> SenatData:
+        rows = sorted(
+            _fetch_all(
+                lecture,
+                filter_partie=True,
+                cache_ttl=self.parsed_files_ttl,
+                cache_max_size=self.parsed_files_max_size,
+            ),
+            # Parents must be created before their "sous-amendements"
+            key=lambda row: Amendement.parse_num(row["Numéro "]),
+        )
+        nums = {Amendement.parse_num(row["Numéro "])[0] for row in rows}
 
         # Les amendements discutés en séance, par ordre de passage
         logger.info(
             "Récupération des amendements soumis à la discussion sur %r", lecture
         )
-
-        discussion_details = fetch_and_parse_discussion_details(lecture=lecture)
+        discussion_details = fetch_and_parse_discussion_details(
+            lecture=lecture, engine=self.engine
+        )
         if len(discussion_details) == 0:
             logger.info("Aucun amendement soumis à la discussion pour l'instant!")
-        self._enrich_discussion_details(amendements, discussion_details, lecture)
-        self._enrich_groupe_parlementaire(amendements)
 
-        return _sort(amendements)
+        return SenatData(
+            rows=rows,
+            discussion_details={
+                details.num: details
+                for details in discussion_details
+                if details.num in nums
+            },
+            groupes=self._fetch_groupes(rows),
+        )
 
-    def _enrich_discussion_details(
-        self,
-        amendements: Iterable[Amendement],
-        discussion_details: Iterable[DiscussionDetails],
-        lecture: Lecture,
-    ) -> None:
+    @staticmethod
+    def _fetch_groupes(rows: List[Dict[str, str]]) -> Dict[str, str]:
         """
-        Enrichir les amendements avec les informations du dérouleur
-
-        - discussion commune ?
-        - amendement identique ?
+        Groupes parlementaires des auteurs (all at once, as there are far fewer
+        sénateurs than amendements)
         """
-        discussion_details_by_num = {
-            details.num: details for details in discussion_details
-        }
-        for amendement in amendements:
-            self._enrich_one(amendement, discussion_details_by_num.get(amendement.num))
-
-    def _enrich_one(
-        self, amendement: Amendement, discussion_details: Optional[DiscussionDetails]
-    ) -> None:
-        if discussion_details is None:
-            return
-        parent: Optional[Amendement]
-        if discussion_details.parent_num is not None:
-            parent = Amendement.get(
-                lecture=amendement.lecture, num=discussion_details.parent_num
-            )
-        else:
-            parent = None
-
-        mission_ref = discussion_details.mission_ref
-        self.update_attributes(
-            amendement,
-            position=discussion_details.position,
-            id_discussion_commune=discussion_details.id_discussion_commune,
-            id_identique=discussion_details.id_identique,
-            parent=parent,
-            mission_titre=mission_ref.titre if mission_ref else None,
-            mission_titre_court=mission_ref.titre_court if mission_ref else None,
+        matricules = {extract_matricule(row["Fiche Sénateur"]) for row in rows}
+        senateurs = repository.get_senateurs(
+            matricule for matricule in matricules if matricule is not None
+        )
+        return {matricule: senateur.groupe for matricule, senateur in senateurs.items()}
+
+    def inspect_row(
+        self, lecture: Lecture, row: Dict[str, str], data: SenatData
+    ) -> Tuple[int, Optional[Action]]:
+        num, rectif = Amendement.parse_num(row["Numéro "])
+        matricule = extract_matricule(row["Fiche Sénateur"])
+        amendement = lecture.find_amendement(num)
+        groupe = data.groupes.get(matricule, "") if matricule else ""
+        details = data.discussion_details.get(num)
+
+        # Skip cleaning the HTML and comparing fields (and loading the article
+        # and parent) if the source data did not change since last time
+        source_fingerprint = fingerprint(row, groupe, self._fingerprint_data(details))
+        if (
+            amendement is not None
+            and amendement.source_fingerprint == source_fingerprint
+        ):
+            return num, None
+
+        values: Dict[str, Any] = dict(
+            subdiv=parse_subdiv(row["Subdivision "], texte=lecture.texte),
+            rectif=rectif,
+            corps=clean_html(row["Dispositif "]),
+            expose=clean_html(row["Objet "]),
+            sort=row["Sort "],
+            alinea=row["Alinéa"].strip(),
+            auteur=row["Auteur "],
+            matricule=matricule,
+            groupe=groupe,
+            date_depot=parse_date(row["Date de dépôt "]),
+            tri_amendement=amendement.tri_amendement if amendement else None,
         )
+        values.update(self._discussion_values(amendement, details))
+
+        values["fingerprint"] = source_fingerprint
+        if amendement is None:
+            return num, CreateSenatAmendement(num=num, **values)
+        if self._is_modified(amendement, values):
+            return num, UpdateAmendement(amendement_num=num, **values)
+        return num, RecordFingerprint(num=num, fingerprint=source_fingerprint)
+
+    @staticmethod
+    def _fingerprint_data(details: Optional[DiscussionDetails]) -> Optional[list]:
+        """
+        Positions are updated separately
+        """
+        if details is None:
+            return None
+        mission_ref = details.mission_ref
+        return [
+            details.id_discussion_commune,
+            details.id_identique,
+            details.parent_num,
+            mission_ref.titre if mission_ref else None,
+            mission_ref.titre_court if mission_ref else None,
+        ]
 
-    def _enrich_groupe_parlementaire(self, amendements: Iterable[Amendement]) -> None:
+    @staticmethod
+    def _discussion_values(
+        amendement: Optional[Amendement], details: Optional[DiscussionDetails]
+    ) -> Dict[str, Any]:
         """
-        Enrichir les amendements avec le groupe parlementaire de l'auteur
+        Informations du dérouleur : position, discussion commune, identique...
         """
-        for amendement in amendements:
-            amendement.groupe = ""
-            if amendement.matricule is not None:
-                senateur = repository.get_senateur(amendement.matricule)
-                if senateur:
-                    amendement.groupe = senateur.groupe
+        if details is not None:
+            mission_ref = details.mission_ref
+            return dict(
+                position=details.position,
+                id_discussion_commune=details.id_discussion_commune,
+                id_identique=details.id_identique,
+                parent_num_raw=str(details.parent_num) if details.parent_num else "",
+                mission_titre=mission_ref.titre if mission_ref else None,
+                mission_titre_court=mission_ref.titre_court if mission_ref else None,
+            )
+
+        # Not (or no longer) discussed, but we keep what we knew
+        if amendement is not None:
+            return dict(
+                position=None,
+                id_discussion_commune=amendement.id_discussion_commune,
+                id_identique=amendement.id_identique,
+                parent_num_raw=str(amendement.parent.num) if amendement.parent else "",
+                mission_titre=amendement.mission_titre,
+                mission_titre_court=amendement.mission_titre_court,
+            )
+
+        return dict(
+            position=None,
+            id_discussion_commune=None,
+            id_identique=None,
+            parent_num_raw="",
+            mission_titre=None,
+            mission_titre_court=None,
+        )
+
+    @staticmethod
+    def _is_modified(amendement: Amendement, values: Dict[str, Any]) -> bool:
+        if amendement.article is None or values["subdiv"] != amendement.article.subdiv:
+            return True
+        old_parent_num_raw = str(amendement.parent.num) if amendement.parent else ""
+        if values["parent_num_raw"] != old_parent_num_raw:
+            return True
+        # Positions are updated separately
+        return any(
+            getattr(amendement, name) != value
+            for name, value in values.items()
+            if name not in {"subdiv", "parent_num_raw", "position", "fingerprint"}
+        )
 
 
 def parse_partie(numero: str) -> Optional[int]:
@@ -195,25 +327,135 @@ def parse_partie(numero: str) -> Optional[int]:
     return None
 
 
-def _fetch_all(lecture: Lecture, dry_run: bool = False) -> List[OrderedDict]:
+def _fetch_all(
+    lecture: Lecture,
+    filter_partie: bool = False,
+    cache_ttl: int = 0,
+    cache_max_size: int = PARSED_FILES_MAX_SIZE * 1024,
+) -> List[Dict[str, str]]:
     """
     Récupère tous les amendements, dans l'ordre de dépôt
+
+    With `filter_partie`, only keep those of the partie of the lecture (PLF).
+
+    With a `cache_ttl` (in minutes), the parsed rows are shared with the other
+    lectures of the same texte (both parties of a PLF read the same file), unless
+    they are bigger than `cache_max_size` (in bytes).
     """
 
+    def keep(numero: str) -> bool:
+        return not filter_partie or parse_partie(numero) == lecture.partie
+
     http_session = get_http_session()
     url = _build_amendements_url(lecture)
-    resp = http_session.get(url)
-    if resp.status_code == HTTPStatus.NOT_FOUND:
-        raise NotFound(url)
+    with closing(http_session.get(url, stream=True)) as resp:
+        if resp.status_code == HTTPStatus.NOT_FOUND:
+            raise NotFound(url)
+
+        if not cache_ttl:
+            return _parse_rows(resp.iter_content(CHUNK_SIZE), keep)
+
+        rows = _parse_rows_with_cache(url, resp, cache_ttl, cache_max_size)
+        return [row for row in rows if keep(row["Numéro "])]
+
+
+def _parse_rows_with_cache(
+    url: str, resp: Response, cache_ttl: int, cache_max_size: int
+) -> List[Dict[str, str]]:
+    """
+    Only parse the file again if it changed (based on its ETag, or the hash of
+    its content if there is none)
+
+    All rows are cached, so that they can be filtered differently on each read.
+    """
+    with TemporaryFile() as spool:
+        chunks: Iterable[bytes] = resp.iter_content(CHUNK_SIZE)
+        validators = Validators.from_response(resp)
+        if validators is not None:
+            fingerprint = "|".join(validators)  # no need to download the content
+        else:
+            # Write the content to disk while hashing it, to parse it afterwards
+            content_hash = hashlib.sha256()
+            for chunk in chunks:
+                content_hash.update(chunk)
+                spool.write(chunk)
+            fingerprint = content_hash.hexdigest()
+            spool.seek(0)
+            chunks = iter(partial(spool.read, CHUNK_SIZE), b"")
+
+        rows = progress_repository.get_parsed_file(url, fingerprint)
+        if rows is not None:
+            logger.info("Réutilisation de %s déjà analysé", url)
+            return rows
+
+        rows = _parse_rows(chunks)
+
+    if not progress_repository.set_parsed_file(
+        url, fingerprint, rows, ttl=cache_ttl, max_size=cache_max_size
+    ):
+        logger.warning(
+            "%s est trop gros pour être mis en cache"
+            " (voir zam.fetch.senat.parsed_files_max_size)",
+            url,
+        )
+    return rows
 
-    if dry_run:
+
+def _parse_rows(
+    chunks: Iterable[bytes], keep: Callable[[str], bool] = lambda numero: True
+) -> List[Dict[str, str]]:
+    """
+    Parse the TSV file while it is downloaded, skipping rows based on their numero
+    """
+    lines = _iter_lines(chunks)
+    next(lines, None)  # skip the "sep=" line
+    header_line = next(lines, None)
+    if header_line is None:
         return []
+    header = _filter_line(header_line).split("\t")
 
-    text = resp.content.decode("cp1252")
-    lines = [_filter_line(line) for line in text.splitlines()[1:]]
-    reader = csv.DictReader(lines, delimiter="\t")
-    items = list(reader)
-    return items
+    # Skip rows before they are repaired and parsed
+    numero_index = header.index("Numéro ")
+
+    def keep_line(line: str) -> bool:
+        numero = _raw_field(line, numero_index)
+        if numero is None:
+            if line.strip():
+                logger.warning("Ligne incomplète ignorée : %r", line[:100])
+            return False
+        return keep(numero)
+
+    lines = (line for line in lines if keep_line(line))
+
+    reader = csv.reader((_filter_line(line) for line in lines), delimiter="\t")
+    return [dict(zip(header, row)) for row in reader]
+
+
+def _iter_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """
+    Decode and split lines as they are received (like `str.splitlines()`)
+    """
+    pending = ""
+    for text in codecs.iterdecode(chunks, "cp1252"):
+        lines = (pending + text).splitlines(keepends=True)
+        # The last line may be incomplete (and a "\r" may be followed by a "\n")
+        pending = lines.pop() if lines else ""
+        for line in lines:
+            yield line.splitlines()[0]
+    yield from pending.splitlines()
+
+
+def _raw_field(line: str, index: int) -> Optional[str]:
+    """
+    Get a field without parsing the whole line (only valid if it comes before
+    the HTML fields, that may contain unescaped tabs)
+
+    Returns None if the line does not have that many fields.
+    """
+    fields = line.split("\t", index + 1)
+    if len(fields) <= index:
+        return None
+    return fields[index]
 
 
 def _build_amendements_url(lecture: Lecture) -> str:
@@ -262,17 +504,3 @@ def extract_matricule(url: str) -> Optional[str]:
     if mo is not None:
         return mo.group(1).upper()
     raise ValueError(f"Could not extract matricule from '{url}'")
-
-
-def _sort(amendements: Iterable[Amendement]) -> List[Amendement]:
-    """
-    Trier les amendements par ordre de passage, puis par numéro
-    """
-    return sorted(
-        amendements,
-        key=lambda amendement: (
-            1 if amendement.position is None else 0,
-            amendement.position,
-            amendement.num,
-        ),
-    )
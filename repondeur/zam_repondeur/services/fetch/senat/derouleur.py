@@ -3,7 +3,10 @@ from http import HTTPStatus
 from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
 from zam_repondeur.models import Amendement, Lecture
+from zam_repondeur.services.fetch.engine import RETRY_STATUSES, FetchEngine
+from zam_repondeur.services.fetch.exceptions import FetchError, RateLimited
 from zam_repondeur.services.fetch.http import get_http_session
+from zam_repondeur.utils import Timer
 
 from ..missions import ID_TXT_MISSIONS, MissionRef
 
@@ -22,27 +25,59 @@ class DiscussionDetails(NamedTuple):
     mission_ref: Optional[MissionRef]
 
 
-def fetch_and_parse_discussion_details(lecture: Lecture) -> List[DiscussionDetails]:
-    data_iter = _fetch_discussion_details(lecture)
+def fetch_and_parse_discussion_details(
+    lecture: Lecture, engine: Optional[FetchEngine] = None
+) -> List[DiscussionDetails]:
+    data_iter = _fetch_discussion_details(lecture, engine)
     return _parse_derouleur_data(data_iter)
 
 
-def _fetch_discussion_details(lecture: Lecture) -> Iterator[Tuple[Any, MissionRef]]:
+def _fetch_discussion_details(
+    lecture: Lecture, engine: Optional[FetchEngine] = None
+) -> Iterator[Tuple[Any, MissionRef]]:
     """
     Récupère les amendements à discuter, dans l'ordre de passage
 
     NB : les amendements jugés irrecevables ne sont pas inclus.
+
+    There is one URL per mission for the seconde partie of a PLF: they are
+    fetched concurrently, then yielded in order so that positions don't change.
+    Missions that could not be fetched are skipped.
     """
-    http_session = get_http_session()
-    for url, mission_ref in derouleur_urls_and_mission_refs(lecture):
-        resp = http_session.get(url)
-        if resp.status_code == HTTPStatus.NOT_FOUND:  # 404
+    if engine is None:
+        engine = FetchEngine()
+    urls_and_mission_refs = list(derouleur_urls_and_mission_refs(lecture))
+    with Timer() as timer:
+        futures = dict(
+            engine.fetch_all(
+                _fetch_derouleur, [url for url, _ in urls_and_mission_refs]
+            )
+        )
+    logger.info("Fetched %d dérouleur URL(s) in %.2fs", len(futures), timer.elapsed())
+    for url, mission_ref in urls_and_mission_refs:
+        try:
+            data = futures[url].result()
+        except FetchError:  # still rate limited after retrying
             logger.warning(f"Could not fetch {url}")
             continue
-        if resp.text == "":
-            logger.warning(f"Empty response for {url}")
-            continue
-        yield resp.json(), mission_ref
+        if data is not None:
+            yield data, mission_ref
+
+
+def _fetch_derouleur(url: str) -> Optional[Any]:
+    http_session = get_http_session()
+    with Timer() as timer:
+        resp = http_session.get(url)
+    logger.info("Fetched %s in %.2fs (%s)", url, timer.elapsed(), resp.status_code)
+    if resp.status_code == HTTPStatus.NOT_FOUND:  # 404
+        logger.warning(f"Could not fetch {url}")
+        return None
+    if resp.status_code in RETRY_STATUSES:
+        raise RateLimited(url, resp)
+    if resp.text == "":
+        logger.warning(f"Empty response for {url}")
+        return None
+    return resp.json()
 
 
 def _parse_derouleur_data(
@@ -6,6 +6,7 @@ from typing import IO, Dict, List, Optional, Tuple
 
 from defusedxml.lxml import RestrictedElement, parse
 from lxml.etree import XMLSyntaxError  # nosec
+from sqlalchemy.orm.exc import StaleDataError
 
 from zam_repondeur.models import (
     Amendement,
@@ -87,8 +88,8 @@ def import_liasse_xml(
         try:
             amendement = _make_amendement(child, uid_map, lecture)
             uid_map[uid] = amendement
-        except LectureDoesNotMatch:
-            raise
+        except (LectureDoesNotMatch, StaleDataError):
+            raise  # the session can't be used anymore after a StaleDataError
         except Exception as exc:
             logger.exception(f"Failed to import amendement {uid} from liasse")
             errors.append((uid, str(exc)))
@@ -160,6 +161,7 @@ def _make_amendement(
     )
     amendement.corps = clean_html(extract("corps", "dispositif") or "")
     amendement.expose = clean_html(extract("corps", "exposeSommaire") or "")
+    amendement.source_fingerprint = None  # compare with the next fetch
     return amendement
 
 
@@ -1,10 +1,25 @@
+import json
+import zlib
 from datetime import timedelta
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
+import msgpack
 from pyramid.config import Configurator
 
 from zam_repondeur.initialize import needs_init
 from zam_repondeur.services import Repository
+from zam_repondeur.services.fetch.http import Validators
+
+# Validators of a lecture that is no longer fetched expire after this (minutes)
+#
+# NB: an AN amendement whose source is not modified is skipped, so changes in our
+# reference data (e.g. a renamed groupe) only reach it when its source changes, or
+# once the validators of its lecture expire. Each fetch that stores validators
+# pushes back that expiry, so an actively fetched lecture may keep the old values.
+VALIDATORS_TTL = 7 * 24 * 60
+
+# Same for the highest amendement number found by probing (minutes)
+HIGH_WATER_MARK_TTL = 7 * 24 * 60
 
 
 def includeme(config: Configurator) -> None:
@@ -13,6 +28,14 @@ def includeme(config: Configurator) -> None:
     """
     repository.initialize(redis_url=config.registry.settings["zam.progress.redis_url"])
     repository.max_duration = int(config.registry.settings["zam.progress.max_duration"])
+    repository.validators_ttl = int(
+        config.registry.settings.get("zam.progress.validators_ttl", VALIDATORS_TTL)
+    )
+    repository.high_water_mark_ttl = int(
+        config.registry.settings.get(
+            "zam.progress.high_water_mark_ttl", HIGH_WATER_MARK_TTL
+        )
+    )
 
 
 class ProgressRepository(Repository):
@@ -21,6 +44,8 @@ class ProgressRepository(Repository):
     """
 
     max_duration = 0
+    validators_ttl = VALIDATORS_TTL
+    high_water_mark_ttl = HIGH_WATER_MARK_TTL
 
     @needs_init
     def clear_data(self) -> None:
@@ -53,5 +78,92 @@ class ProgressRepository(Repository):
         }
         return progress
 
+    @staticmethod
+    def _key_for_high_water_mark(lecture_pk: str) -> str:
+        return f"fetch.high_water_mark.{lecture_pk}"
+
+    @needs_init
+    def set_high_water_mark(self, lecture_pk: str, numero: int) -> None:
+        key = self._key_for_high_water_mark(lecture_pk)
+        expires_at = self.to_timestamp(
+            self.now() + timedelta(seconds=self.high_water_mark_ttl * 60)
+        )
+        self.connection.set(key, numero)
+        self.connection.expireat(key, expires_at)
+
+    @needs_init
+    def get_high_water_mark(self, lecture_pk: str) -> int:
+        key = self._key_for_high_water_mark(lecture_pk)
+        value = self.connection.get(key)
+        return int(value) if value is not None else 0
+
+    @staticmethod
+    def _key_for_validators(lecture_pk: str) -> str:
+        return f"fetch.validators.{lecture_pk}"
+
+    @needs_init
+    def set_validators(
+        self, lecture_pk: str, validators: Dict[str, Validators]
+    ) -> None:
+        if not validators:
+            return
+        key = self._key_for_validators(lecture_pk)
+        self.connection.hset(
+            key, mapping={url: json.dumps(value) for url, value in validators.items()},
+        )
+        expires_at = self.to_timestamp(
+            self.now() + timedelta(seconds=self.validators_ttl * 60)
+        )
+        self.connection.expireat(key, expires_at)
+
+    @needs_init
+    def get_validators(self, lecture_pk: str) -> Dict[str, Validators]:
+        key = self._key_for_validators(lecture_pk)
+        return {
+            url.decode(): Validators(*json.loads(value))
+            for url, value in self.connection.hgetall(key).items()
+        }
+
+    @staticmethod
+    def _key_for_parsed_file(url: str, fingerprint: str) -> str:
+        return f"fetch.parsed_file.{url}.{fingerprint}"
+
+    @needs_init
+    def set_parsed_file(
+        self,
+        url: str,
+        fingerprint: str,
+        rows: List[Dict[str, str]],
+        ttl: int,
+        max_size: int,
+    ) -> bool:
+        """
+        Rows are not cached if they are bigger than `max_size` (in bytes, once
+        packed and compressed)
+        """
+        header = list(rows[0].keys()) if rows else []
+        packed = zlib.compress(
+            msgpack.packb(
+                [header, [list(row.values()) for row in rows]], use_bin_type=True
+            ),
+            1,  # mostly HTML, that compresses well even with the fastest level
+        )
+        if len(packed) > max_size:
+            return False
+        key = self._key_for_parsed_file(url, fingerprint)
+        self.connection.set(key, packed, ex=ttl * 60)
+        return True
+
+    @needs_init
+    def get_parsed_file(
+        self, url: str, fingerprint: str
+    ) -> Optional[List[Dict[str, str]]]:
+        key = self._key_for_parsed_file(url, fingerprint)
+        packed = self.connection.get(key)
+        if packed is None:
+            return None
+        header, rows = msgpack.unpackb(zlib.decompress(packed), raw=False)
+        return [dict(zip(header, row)) for row in rows]
+
 
 repository = ProgressRepository()
@@ -6,6 +6,7 @@ from typing import Optional
 
 import transaction
 
+from zam_repondeur.decorator import memoize_stats
 from zam_repondeur.models import Chambre, DBSession, Dossier, Lecture, Texte, User
 from zam_repondeur.models.events.dossier import LecturesRecuperees
 from zam_repondeur.models.events.lecture import (
@@ -31,7 +32,7 @@ logger = logging.getLogger(__name__)
 RETRY_DELAY = 5 * 60  # 5 minutes
 
 
-@huey.task(retries=3, retry_delay=RETRY_DELAY)
+@huey.task(retries=3, retry_delay=RETRY_DELAY, coalesce=True)
 def update_dossier(dossier_pk: int, force: bool = False) -> None:
     with huey.lock_task(f"dossier-{dossier_pk}"):
         dossier = DBSession.query(Dossier).get(dossier_pk)
@@ -54,7 +55,7 @@ def update_dossier(dossier_pk: int, force: bool = False) -> None:
         create_missing_lectures(dossier.pk)
 
 
-@huey.task(retries=3, retry_delay=RETRY_DELAY)
+@huey.task(retries=3, retry_delay=RETRY_DELAY, coalesce=True)
 def fetch_articles(lecture_pk: Optional[int]) -> bool:
     if lecture_pk is None:
         logger.error("fetch_articles: lecture_pk is None")
@@ -72,7 +73,7 @@ def fetch_articles(lecture_pk: Optional[int]) -> bool:
         return changed
 
 
-@huey.task(retries=3, retry_delay=RETRY_DELAY)
+@huey.task(retries=3, retry_delay=RETRY_DELAY, coalesce=True)
 def fetch_amendements(lecture_pk: Optional[int]) -> bool:
     if lecture_pk is None:
         logger.error("fetch_amendements: lecture_pk is None")
@@ -123,7 +124,9 @@ def fetch_amendements(lecture_pk: Optional[int]) -> bool:
             # Then apply the actual changes in a fresh transaction, in order to minimize
             # the duration of database locks (if we hold locks too long, we could have
             # synchronization issues with the webapp, causing unwanted delays for users
-            # on some interactive operations).
+            # on some interactive operations). The lecture is not locked: amendements,
+            # their locations and user contents are versioned, and changes that
+            # conflict with a user edit are retried (see apply_optimistically).
 
             # But during tests we want everything to run in a single transaction that
             # we can roll back at the end.
@@ -132,14 +135,19 @@ def fetch_amendements(lecture_pk: Optional[int]) -> bool:
                 transaction.abort()
                 transaction.begin()
 
-            lecture = DBSession.query(Lecture).with_for_update().get(lecture_pk)
+            lecture = DBSession.query(Lecture).get(lecture_pk)
             if lecture is None:
                 logger.error(f"Lecture {lecture_pk} introuvable")
                 return False
 
             with Timer() as apply_timer:
                 batch_result = source.apply_changes(lecture, changes)
-            logger.info("Time to apply batch: %.1fs", apply_timer.elapsed())
+            logger.info(
+                "Time to apply batch: %.1fs (flush: %.1fs, %d conflicts)",
+                apply_timer.elapsed(),
+                source.apply_stats.flush_time,
+                source.apply_stats.conflicts,
+            )
 
             logger.info(
                 "Total batch time: %.1fs",
@@ -169,6 +177,8 @@ def fetch_amendements(lecture_pk: Optional[int]) -> bool:
         logger.info(
             "Total time for %d batches: %.1fs", nb_batches, total_timer.elapsed()
         )
+        logger.info("Data cache stats: %r", repository.cache_stats())
+        logger.info("Parsing cache stats: %r", memoize_stats())
 
         if not cumulated_result.fetched:
             AmendementsNonTrouves.create(lecture=lecture)
@@ -1,7 +1,7 @@
-from huey.api import Huey, RedisStorage
+from huey.api import Huey
 from paste.deploy.converters import asbool
 
-from .queue import TransactionalHuey
+from .queue import LanesRedisStorage, TransactionalHuey
 
 huey: TransactionalHuey = None  # type: ignore
 
@@ -10,7 +10,7 @@ def init_huey(settings: dict) -> Huey:
     global huey
     if huey is None:
         huey = TransactionalHuey(
-            storage_class=RedisStorage,
+            storage_class=LanesRedisStorage,
             url=settings["zam.tasks.redis_url"],
             immediate=asbool(settings.get("zam.tasks.immediate", "False")),
             transactional_enqueue=asbool(
@@ -13,11 +13,12 @@ from zam_repondeur.tasks.fetch import (
     update_dossier,
 )
 from zam_repondeur.tasks.huey import huey
+from zam_repondeur.tasks.queue import PRIORITY_BACKGROUND
 
 logger = logging.getLogger(__name__)
 
 
-@huey.periodic_task(crontab(minute="1", hour="*"))
+@huey.periodic_task(crontab(minute="1", hour="*"), priority=PRIORITY_BACKGROUND)
 def update_data() -> None:
     update_data_repository()
     update_dossiers()
@@ -180,9 +181,18 @@ def create_missing_textes(all_textes: Set[str]) -> None:
 
 
 # Keep it last as it takes time and will add up with the growing number of dossiers.
-@huey.periodic_task(crontab(minute="10", hour="*"))
+@huey.periodic_task(crontab(minute="10", hour="*"), priority=PRIORITY_BACKGROUND)
 def update_all_dossiers() -> None:
     for team in DBSession.query(Team).filter(Team.dossier_pk.isnot(None)):
         dossier_pk = team.dossier_pk
         delay = (dossier_pk % 15) * 60  # spread out updates over 15 minutes
-        update_dossier.schedule(args=(dossier_pk,), delay=delay)
+        update_dossier.schedule(
+            args=(dossier_pk,), delay=delay, priority=PRIORITY_BACKGROUND
+        )
+
+
+@huey.periodic_task(crontab(minute="20", hour="*"), priority=PRIORITY_BACKGROUND)
+def prune_queue_state() -> None:
+    pruned = huey.prune_enqueued_at()
+    if pruned:
+        logger.info("Pruned the enqueue times of %d lost tasks", pruned)
@@ -1,16 +1,109 @@
 import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
 from enum import Enum
 from functools import wraps
-from typing import Any, Callable, Optional
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional
 
 import transaction
 from huey.api import Huey, PeriodicTask, Task, TaskWrapper
+from huey.signals import SIGNAL_REVOKED
+from huey.storage import RedisStorage
+from redis.exceptions import ConnectionError
 from transaction.interfaces import IDataManager
 from zope.interface import implementer
 
 logger = logging.getLogger(__name__)
 
 
+# Task priorities, to be given with `priority=` where tasks are called (tasks
+# enqueued by a running task get the same priority, unless they have their own)
+PRIORITY_INTERACTIVE = 10  # a user is waiting for the result
+PRIORITY_BACKGROUND = -10  # periodic bulk refreshes
+
+# Each priority goes in one of these lanes, that are served in this order
+LANE_INTERACTIVE = "interactive"
+LANE_DEFAULT = "default"
+LANE_BACKGROUND = "background"
+LANES = (LANE_INTERACTIVE, LANE_DEFAULT, LANE_BACKGROUND)
+
+QUEUE_WAITS_KEPT = 1000  # per lane, for the stats
+
+# Enqueue times of tasks that never ran (e.g. lost in a worker crash) are pruned
+ENQUEUED_AT_PREFIX = "enqueued_at:"
+ENQUEUED_AT_MAX_AGE = 24 * 60 * 60
+
+# Marks coalesced tasks that are waiting in the queue or in the schedule
+QUEUED_PREFIX = "queued:"
+
+
+def lane_for(priority: Optional[int]) -> str:
+    if not priority:
+        return LANE_DEFAULT
+    return LANE_INTERACTIVE if priority > 0 else LANE_BACKGROUND
+
+
+class LanesRedisStorage(RedisStorage):
+    """
+    Redis storage with a queue for each lane, so that tasks with a higher priority
+    are dequeued first
+
+    Huey's PriorityRedisStorage needs Redis >= 5 (for ZPOPMIN), but we only need
+    a few lanes, which are plain lists: BRPOP pops from the first non-empty one.
+    The default lane is the usual huey queue.
+    """
+
+    priority = True
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.lane_keys = [
+            self.queue_key if lane == LANE_DEFAULT else f"{self.queue_key}.{lane}"
+            for lane in LANES
+        ]
+
+    def lane_key(self, lane: str) -> str:
+        return self.lane_keys[LANES.index(lane)]
+
+    def enqueue(self, data: bytes, priority: Optional[int] = None) -> None:
+        self.conn.lpush(self.lane_key(lane_for(priority)), data)
+
+    def dequeue(self) -> Optional[bytes]:
+        if self.blocking:
+            try:
+                data: bytes = self.conn.brpop(
+                    self.lane_keys, timeout=self.read_timeout
+                )[1]
+                return data
+            except (ConnectionError, TypeError, IndexError):
+                return None
+        for key in self.lane_keys:
+            data = self.conn.rpop(key)
+            if data is not None:
+                return data
+        return None
+
+    def queue_size(self) -> int:
+        return sum(self.lane_size(lane) for lane in LANES)
+
+    def lane_size(self, lane: str) -> int:
+        size: int = self.conn.llen(self.lane_key(lane))
+        return size
+
+    def enqueued_items(self, limit: Optional[int] = None) -> List[bytes]:
+        items = [
+            item
+            for key in self.lane_keys
+            for item in self.conn.lrange(key, 0, -1)[::-1]
+        ]
+        return items[:limit] if limit else items
+
+    def flush_queue(self) -> None:
+        self.conn.delete(*self.lane_keys)
+
+
 class State(Enum):
     INIT = 0
     NO_WORK = 1
@@ -24,12 +117,52 @@ class State(Enum):
     TPC_ABORTED = 16
 
 
+class PendingTask(NamedTuple):
+    """
+    The task that will do the work for all the requests with the same coalescing key
+    """
+
+    id: str
+    force: bool
+    eta: Optional[datetime]
+    depth: int  # number of requests merged into it
+    priority: int = 0
+
+    @classmethod
+    def from_task(cls, task: Task, depth: int = 1) -> "PendingTask":
+        return cls(
+            id=task.id,
+            force=bool(task.kwargs.get("force")),
+            eta=task.eta,
+            depth=depth,
+            priority=task.priority or 0,
+        )
+
+    def supersedes(self, other: "PendingTask") -> bool:
+        return (
+            (self.force and not other.force)
+            or self.priority > other.priority
+            or self.runs_earlier_than(other)
+        )
+
+    def runs_earlier_than(self, other: "PendingTask") -> bool:
+        if other.eta is None:
+            return False
+        return self.eta is None or self.eta < other.eta
+
+
 class TransactionalHuey(Huey):
     """
     A huey task queue that tries to play well with transactions
 
     - allows enqueing tasks only if the whole transaction succeeds
     - runs each task inside an individual transaction in workers
+    - coalesces requests for tasks declared with `coalesce=True`: while a task
+      with the same name and arguments (except `force`) is pending (i.e. not
+      started yet), it is not enqueued again, unless it has `force=True` (or a
+      higher priority, or an earlier ETA) and the pending one has not, in which
+      case it replaces it
+    - measures how long tasks wait in the queue, for each priority lane
     """
 
     def __init__(self, *, transactional_enqueue: bool = True, **kwargs: Any) -> None:
@@ -41,6 +174,13 @@ class TransactionalHuey(Huey):
         """
         super().__init__(**kwargs)
         self.transactional_enqueue = transactional_enqueue
+        self.pre_execute(name="zam")(self._on_start)
+        self.post_execute(name="zam")(self._on_finish)
+        self.signal(SIGNAL_REVOKED)(self._on_revoked)
+        self._running = threading.local()  # task being executed by this worker
+        self._queue_waits: Dict[str, Deque[float]] = {
+            lane: deque(maxlen=QUEUE_WAITS_KEPT) for lane in LANES
+        }
 
     def enqueue(self, task: Any) -> None:
         logger.debug("Enqueue task %r", task)
@@ -68,8 +208,116 @@ class TransactionalHuey(Huey):
         managed_task.join_transaction()
 
     def really_enqueue(self, task: Any) -> None:
+        if self.immediate:
+            super().enqueue(task)
+            return
+        if task.priority is None:
+            running = getattr(self._running, "task", None)
+            if running is not None:
+                task.priority = running.priority
+        key = self.coalescing_key(task)
+        if key is not None:
+            if not self._claim_pending(key, task):
+                return  # merged into the pending task
+            self.put(self._queued_key(task.id), True)
+        self.put(self._enqueued_at_key(task), time.time())
         super().enqueue(task)
 
+    def dequeue(self) -> Optional[Task]:
+        task: Optional[Task] = super().dequeue()
+        if task is not None and self.coalescing_key(task) is not None:
+            self.delete(self._queued_key(task.id))
+        return task
+
+    def add_schedule(self, task: Task) -> None:
+        super().add_schedule(task)
+        if self.coalescing_key(task) is not None:
+            self.put(self._queued_key(task.id), True)
+
+    @staticmethod
+    def coalescing_key(task: Task) -> Optional[str]:
+        if not getattr(task, "coalesce", False):
+            return None
+        # `force` is not part of the key, as a forced task does the job of both
+        args = [str(arg) for arg in task.args] + [
+            f"{name}={value}"
+            for name, value in sorted(task.kwargs.items())
+            if name != "force"
+        ]
+        return f"coalesce:{task.name}({','.join(args)})"
+
+    def pending_depth(
+        self, task_wrapper: TaskWrapper, *args: Any, **kwargs: Any
+    ) -> int:
+        """
+        Number of requests waiting for the pending task with these arguments
+        """
+        key = self.coalescing_key(task_wrapper.s(*args, **kwargs))
+        if key is None:
+            return 0
+        pending: Optional[PendingTask] = self.get(key, peek=True)
+        return pending.depth if pending is not None else 0
+
+    def _claim_pending(self, key: str, task: Task) -> bool:
+        """
+        Should the task be enqueued, or is there already one that will do the job?
+
+        NB: updates of the depth are not atomic, so it could be off under contention
+        (but the pending task itself is claimed atomically).
+        """
+        if self.put_if_empty(key, PendingTask.from_task(task)):
+            return True
+
+        pending: Optional[PendingTask] = self.get(key, peek=True)
+        if pending is None:  # it has just started
+            self.put(key, PendingTask.from_task(task))
+            return True
+        if pending.id == task.id:  # scheduled or retried by the consumer
+            return True
+        if not self._is_queued(pending.id):  # e.g. worker crash
+            logger.warning("Pending task %s was lost (%s)", pending.id, key)
+            self.delete(self._enqueued_at_key(Task(id=pending.id)))
+            self.put(key, PendingTask.from_task(task))
+            return True
+
+        new = PendingTask.from_task(task, depth=pending.depth + 1)
+        if new.supersedes(pending):
+            logger.info("Task %r replaces pending task %s (%s)", task, pending.id, key)
+            self.revoke_by_id(pending.id, revoke_once=True)
+            self.delete(self._enqueued_at_key(Task(id=pending.id)))
+            self.delete(self._queued_key(pending.id))
+            # Keep the best of both
+            if pending.force:
+                task.kwargs["force"] = True
+            task.priority = max(new.priority, pending.priority)
+            self.put(key, PendingTask.from_task(task, depth=new.depth))
+            return True
+
+        self.put(key, pending._replace(depth=new.depth))
+        logger.info(
+            "Task %r merged into pending task %s (%s, %d requests)",
+            task,
+            pending.id,
+            key,
+            new.depth,
+        )
+        return False
+
+    def _is_queued(self, task_id: str) -> bool:
+        """
+        Is the task still waiting in the queue or in the schedule?
+
+        NB: a task that has just been dequeued by a worker, but has not started yet,
+        is not, so it can be enqueued twice (which is better than never).
+        """
+        if self.is_revoked(task_id):
+            return False
+        return self.get(self._queued_key(task_id), peek=True) is not None
+
+    @staticmethod
+    def _queued_key(task_id: str) -> str:
+        return f"{QUEUED_PREFIX}{task_id}"
+
     def task(
         self,
         retries: int = 0,
@@ -77,7 +325,7 @@ class TransactionalHuey(Huey):
         priority: Any = None,
         context: bool = False,
         name: Optional[str] = None,
-        **kwargs: Any
+        **kwargs: Any,
     ) -> Callable:
         def decorator(func):  # type: ignore
             return TaskWrapper(
@@ -88,7 +336,7 @@ class TransactionalHuey(Huey):
                 default_priority=priority,
                 context=context,
                 name=name,
-                **kwargs
+                **kwargs,
             )
 
         return decorator
@@ -101,7 +349,7 @@ class TransactionalHuey(Huey):
         priority: Any = None,
         context: bool = False,
         name: Optional[str] = None,
-        **kwargs: Any
+        **kwargs: Any,
     ) -> Callable:
         def decorator(func):  # type: ignore
             def method_validate(self, timestamp):  # type: ignore
@@ -117,7 +365,7 @@ class TransactionalHuey(Huey):
                 default_priority=priority,
                 validate_datetime=method_validate,
                 task_base=PeriodicTask,
-                **kwargs
+                **kwargs,
             )
 
         return decorator
@@ -138,6 +386,76 @@ class TransactionalHuey(Huey):
 
         return wrapper
 
+    def queue_wait_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Time spent in each lane by the last tasks executed by this worker
+        """
+        return {
+            lane: {
+                "count": len(waits),
+                "mean": sum(waits) / len(waits) if waits else 0.0,
+                "max": max(waits, default=0.0),
+            }
+            for lane, waits in self._queue_waits.items()
+        }
+
+    def prune_enqueued_at(self, max_age: float = ENQUEUED_AT_MAX_AGE) -> int:
+        """
+        Forget the enqueue times of tasks that will never run
+        """
+        now = time.time()
+        pruned = 0
+        for key, data in self.storage.result_items().items():
+            if isinstance(key, bytes):
+                key = key.decode()
+            if not key.startswith(ENQUEUED_AT_PREFIX):
+                continue
+            if now - self.serializer.deserialize(data) > max_age:
+                self.delete(key)
+                pruned += 1
+        return pruned
+
+    @staticmethod
+    def _enqueued_at_key(task: Task) -> str:
+        return f"{ENQUEUED_AT_PREFIX}{task.id}"
+
+    def _on_start(self, task: Task) -> None:
+        self._running.task = task
+        self._record_queue_wait(task)
+        self._clear_pending(task)
+
+    def _on_finish(self, task: Task, task_value: Any, exc: Optional[Exception]) -> None:
+        self._running.task = None
+
+    def _on_revoked(self, signal: str, task: Task) -> None:
+        self.delete(self._enqueued_at_key(task))
+        self.delete(self._queued_key(task.id))
+        self._clear_pending(task)
+
+    def _record_queue_wait(self, task: Task) -> None:
+        enqueued_at: Optional[float] = self.get(self._enqueued_at_key(task))
+        if enqueued_at is None:  # e.g. enqueued before an upgrade
+            return
+        ready_at = enqueued_at
+        if task.eta is not None:  # scheduled, then enqueued again when ready
+            eta = task.eta.replace(tzinfo=timezone.utc) if self.utc else task.eta
+            ready_at = max(ready_at, eta.timestamp())
+        wait = max(0.0, time.time() - ready_at)
+        lane = lane_for(task.priority)
+        self._queue_waits[lane].append(wait)
+        logger.info("Task %r waited %.1fs in the %s lane", task, wait, lane)
+
+    def _clear_pending(self, task: Task) -> None:
+        """
+        Once it has started, requests for the same task must be enqueued again
+        """
+        key = self.coalescing_key(task)
+        if key is None:
+            return
+        pending: Optional[PendingTask] = self.get(key, peek=True)
+        if pending is not None and pending.id == task.id:
+            self.delete(key)
+
 
 @implementer(IDataManager)
 class ManagedTask:
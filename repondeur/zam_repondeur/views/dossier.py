@@ -11,6 +11,7 @@ from zam_repondeur.models import DBSession
 from zam_repondeur.models.events.dossier import DossierDesactive
 from zam_repondeur.resources import DossierResource
 from zam_repondeur.tasks.fetch import update_dossier
+from zam_repondeur.tasks.queue import PRIORITY_INTERACTIVE
 
 
 class DossierViewBase:
@@ -63,7 +64,7 @@ def dossier_journal(context: DossierResource, request: Request) -> Response:
 @view_config(context=DossierResource, name="manual_refresh", permission="refresh")
 def manual_refresh(context: DossierResource, request: Request) -> Response:
     dossier = context.dossier
-    update_dossier(dossier.pk, force=True)
+    update_dossier(dossier.pk, force=True, priority=PRIORITY_INTERACTIVE)
     request.session.flash(
         Message(cls="success", text="Rafraîchissement des lectures en cours.")
     )
@@ -9,6 +9,7 @@ from zam_repondeur.models import DBSession, Dossier, Team, User
 from zam_repondeur.models.events.dossier import DossierActive
 from zam_repondeur.resources import DossierCollection
 from zam_repondeur.tasks.fetch import create_missing_lectures
+from zam_repondeur.tasks.queue import PRIORITY_INTERACTIVE
 
 
 class DossierCollectionBase:
@@ -76,7 +77,11 @@ class DossierAddForm(DossierCollectionBase):
             admin.teams.append(team)
 
         # Enqueue task to asynchronously add the lectures
-        create_missing_lectures(dossier_pk=dossier.pk, user_pk=self.request.user.pk)
+        create_missing_lectures(
+            dossier_pk=dossier.pk,
+            user_pk=self.request.user.pk,
+            priority=PRIORITY_INTERACTIVE,
+        )
 
         DossierActive.create(dossier=dossier, request=self.request)
 
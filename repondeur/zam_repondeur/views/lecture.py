@@ -10,6 +10,7 @@ from zam_repondeur.message import Message
 from zam_repondeur.models import Amendement, DBSession, SharedTable
 from zam_repondeur.resources import LectureResource
 from zam_repondeur.tasks.fetch import fetch_amendements
+from zam_repondeur.tasks.queue import PRIORITY_INTERACTIVE
 
 
 @view_config(context=LectureResource, name="manual_refresh", permission="refresh")
@@ -23,11 +24,10 @@ def manual_refresh(context: LectureResource, request: Request) -> Response:
             )
         )
         return HTTPFound(location=request.resource_url(amendements_collection))
-    fetch_amendements(lecture.pk)
+    fetch_amendements(lecture.pk, priority=PRIORITY_INTERACTIVE)
     # The progress is initialized even if the task is async for early feedback
     # to users and ability to disable the refresh button.
-    # The total is doubled because we need to handle the dry_run.
-    total = len(lecture.amendements) * 2 if lecture.amendements else 100
+    total = len(lecture.amendements) if lecture.amendements else 100
     lecture.set_fetch_progress(1, total)
     request.session.flash(
         Message(cls="success", text="Rafraîchissement des amendements en cours.")